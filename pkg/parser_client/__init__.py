@@ -1,17 +1,95 @@
 # -*- coding: utf-8 -*-
 
 
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 from django.conf import settings
+from django.core.cache import get_cache
 
 from pkg.notes.models import NotesNotes
-from client import send_request
+from .background import BackgroundParser
+from .breaker import CircuitBreaker, GuardedParserClient
+from .cache import ParseResultCache
+from .fastpath import FastPath, DEFAULT_TAGS, DEFAULT_ATTRIBUTES
+
+
+parse_cache = ParseResultCache(
+    version=getattr(settings, "PARSER_VERSION", ""),
+    max_size=getattr(settings, "PARSER_CACHE_SIZE", 10000),
+    shared=get_cache(settings.PARSER_SHARED_CACHE) if getattr(settings, "PARSER_SHARED_CACHE", None) else None,
+)
+
+parser = GuardedParserClient(
+    getattr(settings, "PARSER_SERVER_URL", "http://parser-example.com/"),
+    breaker=CircuitBreaker(
+        failure_threshold=getattr(settings, "PARSER_BREAKER_FAILURES", 5),
+        latency_threshold=getattr(settings, "PARSER_BREAKER_LATENCY", None),
+        reset_timeout=getattr(settings, "PARSER_BREAKER_RESET_TIMEOUT", 30),
+    ),
+    budget=getattr(settings, "PARSER_LATENCY_BUDGET", None),
+    hedge_server=getattr(settings, "PARSER_HEDGE_SERVER_URL", None),
+    hedge_delay=getattr(settings, "PARSER_HEDGE_DELAY", 0.1),
+    timeout=getattr(settings, "PARSER_TIMEOUT", 10),
+    pool_size=getattr(settings, "PARSER_POOL_SIZE", 10),
+    max_retries=getattr(settings, "PARSER_MAX_RETRIES", 2),
+    keep_alive=getattr(settings, "PARSER_KEEP_ALIVE", True),
+    stream_threshold=getattr(settings, "PARSER_STREAM_THRESHOLD", None),
+    codecs=getattr(settings, "PARSER_CODECS", None),
+    min_compress_size=getattr(settings, "PARSER_MIN_COMPRESS_SIZE", 0),
+)
+
+# clean notes are not sent to the parser, if it's enabled
+fast_path = FastPath(
+    tags=getattr(settings, "PARSER_FAST_PATH_TAGS", DEFAULT_TAGS),
+    attributes=getattr(settings, "PARSER_FAST_PATH_ATTRIBUTES", DEFAULT_ATTRIBUTES),
+    verify_rate=getattr(settings, "PARSER_FAST_PATH_VERIFY_RATE", 0.01),
+) if getattr(settings, "PARSER_FAST_PATH", False) else None
+
+# notes are saved with raw text and parsed by background workers, if it's enabled
+background_parser = BackgroundParser(
+    parser,
+    parse_cache,
+    workers=getattr(settings, "PARSER_ASYNC_WORKERS", 2),
+    queue_size=getattr(settings, "PARSER_ASYNC_QUEUE_SIZE", 1000),
+) if getattr(settings, "PARSER_ASYNC", False) else None
+
+# in async mode the fast path is verified by the workers too, the save path never waits for the parser
+verify_fast_path = (
+    lambda text: background_parser.verify(text, fast_path.record_verified)
+) if background_parser is not None and fast_path is not None else None
 
 
 @receiver(pre_save, sender=NotesNotes, )
 def my_handler(sender, instance, **kwargs):
-    server_url = getattr(settings, "PARSER_SERVER_URL", "http://parser-example.com/")
-    parsed_text = send_request(server_url, instance.text)
+    # scan of the text is cheaper than lookup in the shared cache
+    clean = fast_path is not None and fast_path.is_clean(instance.text)
+    parsed_text = None if clean else parse_cache.get(instance.text)
+
+    if parsed_text is None:
+        if not clean and background_parser is not None and instance.text:
+            instance._parse_pending = True
+            return
+
+        if fast_path is not None:
+            parsed_text = fast_path.process(instance.text, parser.process, clean, verify_fast_path)
+        else:
+            parsed_text = parser.process(instance.text)
+
+        if parsed_text:
+            parsed_text = parsed_text.strip()
+
+            # clean text is never looked up in the cache
+            if not clean:
+                parse_cache.set(instance.text, parsed_text)
+        else:
+            parsed_text = instance.text
+
     if parsed_text:
         instance.text = parsed_text.strip()
+
+
+@receiver(post_save, sender=NotesNotes, )
+def _submit_pending_parse(sender, instance, **kwargs):
+    if getattr(instance, '_parse_pending', False):
+        instance._parse_pending = False
+        background_parser.submit(instance.pk, instance.text)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Implementation of the asyncio client. Its syntax requires python 3.7+, so it's imported only through
+pkg.parser_client.aio, which checks version of the interpreter
+"""
+
+import json
+import asyncio
+
+import aiohttp
+
+from .compression import get_codec, LEGACY_CODEC, CODEC_HEADER
+
+
+__all__ = ['AsyncParserClient', 'run_process_many', ]
+
+
+class AsyncParserClient(object):
+    """
+    Asyncio counterpart of ParserClient with the same wire format and response contract.
+    Count of simultaneous requests is bounded by concurrency, connections are pooled by the session.
+
+    Usage:
+        async with AsyncParserClient(server) as client:
+            parsed = await client.process_many(texts)
+    """
+
+    def __init__(self, parser_server, compressor_type=LEGACY_CODEC, timeout=10, concurrency=10):
+        """
+        :param string parser_server: url of parser
+        :param string compressor_type: codec of requests, @see pkg.parser_client.compression
+        :param float timeout: timeout of single request, in seconds
+        :param int concurrency: max count of simultaneous requests to the parser
+        """
+        self._compressor_type = compressor_type
+        self._parser_server = parser_server
+        self._timeout = timeout
+        self._concurrency = concurrency
+        self._loop = None
+        self._semaphore = None
+        self._session = None
+
+    def _bind_loop(self):
+        """
+        Semaphore and session are bound to the event loop, so they are created inside the running one
+        and recreated if the client is used by another loop
+        """
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            self._close_session()
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+    def _close_session(self):
+        """
+        Close session of the previous loop, which can't be awaited from the current one
+        """
+        session, self._session = self._session, None
+        if session is None or session.closed:
+            return
+
+        if not self._loop.is_closed():
+            # it's closed, when the loop runs: at once, if it's running in another thread
+            asyncio.run_coroutine_threadsafe(session.close(), self._loop)
+        else:
+            # closed loop can't run the closing, its connections are gone with it
+            session.detach()
+
+    def _get_session(self):
+        """
+        :rtype aiohttp.ClientSession:
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self._concurrency))
+
+        return self._session
+
+    async def close(self):
+        if self._session is not None and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+
+        self._close_session()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def process(self, text, timeout=None):
+        """
+        Perform request to the parser.
+
+        :param string text: text, which need to parse
+        :param float timeout: timeout of the request, in seconds. Client's one by default
+
+        :return string: parsed text or empty string on failure
+        """
+        jdata = json.dumps({"action": "parse", "html": str(text)}).encode('utf-8')
+        cdata = get_codec(self._compressor_type).compress(jdata)
+        timeout = aiohttp.ClientTimeout(total=self._timeout if timeout is None else timeout)
+        # request without the header is compressed by the legacy codec
+        headers = {CODEC_HEADER: self._compressor_type} if self._compressor_type != LEGACY_CODEC else {}
+
+        self._bind_loop()
+
+        try:
+            async with self._semaphore:
+                async with self._get_session().post(
+                    self._parser_server, data=cdata, headers=headers, timeout=timeout,
+                ) as result:
+                    if result.status != 200:
+                        return ''
+
+                    codec_name = result.headers.get(CODEC_HEADER, LEGACY_CODEC)
+                    content = await result.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ):
+            return ''
+
+        try:
+            content = get_codec(codec_name).decompress(content)
+        except Exception:
+            # corrupt body or unknown codec, like in ParserClient
+            return ''
+
+        try:
+            return json.loads(content.decode('utf-8'))["data"]["parsed_html"]
+        except (TypeError, ValueError, KeyError, ):
+            return ''
+
+    async def process_many(self, texts, timeout=None):
+        """
+        Parse many texts concurrently
+
+        :param list texts: texts, which need to parse
+        :param float timeout: timeout of each request, in seconds
+
+        :return list: parsed texts in the same order. Empty string for failed ones
+        """
+        results = await asyncio.gather(*[self.process(text, timeout) for text in texts], return_exceptions=True)
+
+        # failure of one text does not fail the others
+        return ['' if isinstance(result, BaseException) else result for result in results]
+
+
+def run_process_many(parser_server, texts, **options):
+    """
+    Parse many texts concurrently from synchronous code, in its own event loop. @see AsyncParserClient
+
+    :param string parser_server: url of parser
+    :param list texts: texts, which need to parse
+    :param dict options: options of client
+
+    :return list: parsed texts in the same order. Empty string for failed ones
+    """
+    async def run():
+        async with AsyncParserClient(parser_server, **options) as client:
+            return await client.process_many(texts)
+
+    return asyncio.run(run())
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio client of the parser. Requires python 3.7+ and aiohttp, so it's not imported by the package.
+Under older interpreters import of this module fails by ImportError, so callers can fall back to ParserClient
+"""
+
+import sys
+
+if sys.version_info < (3, 7):
+    raise ImportError('AsyncParserClient requires python 3.7+')
+
+from ._aio import AsyncParserClient, run_process_many
+
+
+__all__ = ['AsyncParserClient', 'run_process_many', ]
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import threading
+from datetime import timedelta
+
+try:
+    from Queue import Queue, Full
+except ImportError:
+    from queue import Queue, Full
+
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from pkg.notes.models import NotesNotes, note_updated, note_pre_size_change
+from pkg.quota.models import QuotaLimitError
+from pkg.utils.transactions import batch_transaction, on_commit
+from .models import PendingParse, get_text_hash
+
+
+__all__ = ['BackgroundParser', ]
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundParser(object):
+    """
+    Parses notes out of the save path. Note is saved with raw text and PendingParse marker,
+    then local worker threads parse it and write the result back, if the note has not changed since.
+    Change of size is accounted by quota as any save. Clients learn about the new text by note_updated signal.
+
+    Local queue is lost on restart, so markers left behind are processed by process_pending_parses command.
+    """
+    SIZE_FIELD = 'size'
+
+    __slots__ = ('__parser', '__cache', '__workers', '__queue_size', '__queue', '__pid', '__lock', )
+
+    def __init__(self, parser, cache, workers=2, queue_size=1000):
+        """
+        :param parser: parser client with process(text) method, @see GuardedParserClient
+        :param ParseResultCache cache: cache of parser results
+        :param int workers: count of worker threads in each process
+        :param int queue_size: max count of notes waiting for workers. Others are left to the command
+        """
+        self.__parser = parser
+        self.__cache = cache
+        self.__workers = int(workers)
+        self.__queue_size = int(queue_size)
+        self.__queue = None
+        self.__pid = None
+        self.__lock = threading.Lock()
+
+    def _get_queue(self):
+        """
+        Workers are started on first use in each process, threads do not survive fork
+
+        :rtype Queue:
+        """
+        pid = os.getpid()
+
+        if self.__pid != pid:
+            with self.__lock:
+                if self.__pid != pid:
+                    self.__queue = Queue(self.__queue_size)
+
+                    for _ in range(self.__workers):
+                        thread = threading.Thread(target=self._work, args=(self.__queue, ))
+                        thread.daemon = True
+                        thread.start()
+
+                    self.__pid = pid
+
+        return self.__queue
+
+    def _work(self, queue):
+        while True:
+            note_id, text, callback = queue.get()
+
+            try:
+                if callback is not None:
+                    callback(text, self.__parser.process(text))
+                else:
+                    self.process_note(note_id, text)
+            except Exception:
+                # the marker is kept, so the note is parsed by the command later
+                logger.exception('Background parse of note %s has failed', note_id)
+
+            if queue.empty():
+                # do not keep idle connection of the worker
+                connection.close()
+
+    def _put(self, note_id, text, callback=None):
+        """
+        :return bool: whether the text is queued
+        """
+        try:
+            self._get_queue().put_nowait((note_id, text, callback, ))
+        except Full:
+            return False
+
+        return True
+
+    def submit(self, note_id, text):
+        """
+        Mark the note as pending and queue it for parsing. It's called on save, inside its transaction.
+        The note is queued after the transaction is committed, otherwise workers could not see it, @see on_commit.
+        Not queued note (the queue is full) is parsed by the command
+
+        :param int note_id: id of saved note
+        :param string text: raw text of saved note
+        """
+        text_hash = get_text_hash(text)
+
+        if not PendingParse.objects.filter(note_id=note_id).update(
+                text_hash=text_hash, created_at=timezone.now(), attempts=0):
+            PendingParse.objects.create(note_id=note_id, text_hash=text_hash, created_at=timezone.now())
+
+        on_commit(lambda: self._put(note_id, text))
+
+    def verify(self, text, callback):
+        """
+        Parse the text by workers and pass the result to the callback, e.g. to verify the fast path.
+        Nothing is written, so it's dropped if the queue is full
+
+        :param string text: text, which need to parse
+        :param callable callback: (text, parsed text or empty string on failure) => None
+
+        :return bool: whether the text is queued
+        """
+        return self._put(None, text, callback)
+
+    def process_note(self, note_id, text):
+        """
+        Parse the text and write it back, if the note still has the same text
+
+        :param int note_id: id of note
+        :param string text: raw text of note
+
+        :return bool: whether the note is processed. Failed or changed one keeps its marker
+        """
+        parsed_text = self.__cache.get(text)
+
+        if parsed_text is None:
+            parsed_text = self.__parser.process(text)
+
+            if not parsed_text:
+                PendingParse.objects.filter(note_id=note_id).update(attempts=F('attempts') + 1)
+                return False
+
+            parsed_text = parsed_text.strip()
+            self.__cache.set(text, parsed_text)
+
+        text_hash = get_text_hash(text)
+
+        if parsed_text != text:
+            try:
+                with batch_transaction():
+                    if not self._write_parsed(note_id, text_hash, parsed_text):
+                        return False
+            except QuotaLimitError:
+                # parsed text does not fit the quota, the note keeps raw text
+                pass
+
+        PendingParse.objects.filter(note_id=note_id, text_hash=text_hash).delete()
+
+        return True
+
+    def _write_parsed(self, note_id, text_hash, parsed_text):
+        """
+        Compare-and-set by hash of text under lock of the note: newer save of the note wins.
+        Note, which is not found (changed or not committed yet), keeps the marker and is checked by the command.
+        It's called inside transaction
+
+        :param int note_id: id of note
+        :param string text_hash: hash of raw text, @see get_text_hash
+        :param string parsed_text: parsed text
+
+        :return bool: whether the text is written
+        :raise: QuotaLimitError
+        """
+        try:
+            note = NotesNotes.objects.select_for_update().get(pk=note_id)
+        except NotesNotes.DoesNotExist:
+            return False
+
+        if get_text_hash(note.text) != text_hash:
+            return False
+
+        prev_size = getattr(note, self.SIZE_FIELD) or 0
+        new_size = prev_size + len(parsed_text.encode('utf-8')) - len(note.text.encode('utf-8'))
+        note_pre_size_change.send(sender=NotesNotes, instance=note, prev_size=prev_size, new_size=new_size)
+
+        NotesNotes.objects.filter(pk=note_id).update(**{'text': parsed_text, self.SIZE_FIELD: new_size})
+
+        update_time = timezone.now()
+        on_commit(lambda: note_updated.send(
+            sender=NotesNotes, update_time=update_time, note_id=note_id, user_id=note.user_id))
+
+        return True
+
+    def process_pending(self, older_than=60, limit=100):
+        """
+        Process markers left by lost queue or failed attempts
+
+        :param int older_than: min age of marker, in seconds. Younger ones are probably in the queue
+        :param int limit: max count of processed notes
+
+        :return int: count of resolved markers. Failed ones are not counted
+        """
+        pending = list(PendingParse.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=older_than),
+        ).order_by('attempts', 'created_at')[:limit])
+
+        notes = NotesNotes.objects.in_bulk([marker.note_id for marker in pending])
+        resolved = 0
+
+        for marker in pending:
+            note = notes.get(marker.note_id)
+
+            if note is None or get_text_hash(note.text) != marker.text_hash:
+                # the note is deleted or changed by save, which has its own marker
+                PendingParse.objects.filter(note_id=marker.note_id, text_hash=marker.text_hash).delete()
+            elif not self.process_note(note.pk, note.text):
+                # touch the marker, so failing note does not block others
+                PendingParse.objects.filter(note_id=marker.note_id).update(created_at=timezone.now())
+                continue
+
+            resolved += 1
+
+        return resolved
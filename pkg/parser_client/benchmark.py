@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the parser client. Require python 3 (and python 3.7+ with aiohttp for clients). Usage:
+
+    # sync and async clients against the local stand-in server
+    python -m pkg.parser_client.benchmark clients --count 200 --delay 0.01 --concurrency 20
+
+    # compression ratio and CPU time of codecs on a corpus of real-sized notes
+    python -m pkg.parser_client.benchmark codecs --count 50
+"""
+
+import json
+import time
+import random
+import argparse
+
+from .client import ParserClient
+from .compression import get_codec, get_codec_names
+from .stub import ParserStubServer
+
+# sizes of notes' html (bytes) and their share in the corpus
+NOTE_SIZES = ((150, 0.3), (600, 0.3), (2500, 0.2), (10000, 0.15), (60000, 0.05), )
+_WORDS = ('note', 'meeting', 'project', 'todo', 'buy', 'milk', 'call', 'tomorrow', 'deadline', 'review', 'idea',
+          'list', 'report', 'draft', 'price', 'travel', 'ticket', 'hotel', 'book', 'read', )
+_FRAGMENTS = ('<div>%s</div>', '<p>%s</p>', '<b>%s</b>', '<li>%s</li>', '<span style="font-weight: bold;">%s</span>',
+              '<a href="http://example.com/%s">link</a>', '%s<br>', )
+
+
+def _get_texts(count, size):
+    return ['<p>%d %s</p>' % (i, 'x' * size) for i in range(count)]
+
+
+def _get_note(size, rand):
+    parts = []
+    length = 0
+
+    while length < size:
+        part = rand.choice(_FRAGMENTS) % ' '.join(rand.choice(_WORDS) for _ in range(rand.randint(1, 12)))
+        parts.append(part)
+        length += len(part)
+
+    return ''.join(parts)
+
+
+def _get_corpus(count):
+    rand = random.Random(42)
+    corpus = []
+
+    for size, share in NOTE_SIZES:
+        corpus.extend(_get_note(size, rand) for _ in range(max(int(count * share), 1)))
+
+    return [json.dumps({"action": "parse", "html": note}).encode('utf-8') for note in corpus]
+
+
+def benchmark_codecs(args):
+    corpus = _get_corpus(args.count)
+
+    print('%-12s %10s %10s %8s %14s %14s' % ('codec', 'size', 'compressed', 'ratio', 'compress, us', 'decompress, us'))
+    for name in get_codec_names():
+        codec = get_codec(name)
+        raw_size = sum(len(data) for data in corpus)
+
+        started = time.process_time()
+        compressed = [codec.compress(data) for data in corpus]
+        compress_time = time.process_time() - started
+
+        started = time.process_time()
+        for data in compressed:
+            codec.decompress(data)
+        decompress_time = time.process_time() - started
+
+        compressed_size = sum(len(data) for data in compressed)
+        print('%-12s %10d %10d %8.2f %14.1f %14.1f' % (
+            name, raw_size, compressed_size, raw_size / float(compressed_size),
+            compress_time * 1e6 / len(corpus), decompress_time * 1e6 / len(corpus),
+        ))
+
+
+def _measure(title, func, count):
+    started = time.time()
+    func()
+    elapsed = time.time() - started
+
+    print('%-32s %8.3f s %10.1f req/s' % (title, elapsed, count / elapsed))
+
+
+def benchmark_clients(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from .aio import run_process_many
+
+    texts = _get_texts(args.count, args.size)
+
+    with ParserStubServer(delay=args.delay) as server:
+        client = ParserClient(server.url, pool_size=args.concurrency)
+
+        _measure('sync, sequential', lambda: [client.process(text) for text in texts], args.count)
+
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            _measure('sync, %d threads' % args.concurrency, lambda: list(executor.map(client.process, texts)),
+                     args.count)
+
+        _measure('async, concurrency %d' % args.concurrency,
+                 lambda: run_process_many(server.url, texts, concurrency=args.concurrency), args.count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    clients = subparsers.add_parser('clients', help='sync and async clients')
+    clients.add_argument('--count', type=int, default=200, help='count of parsed texts')
+    clients.add_argument('--size', type=int, default=2048, help='size of each text, in bytes')
+    clients.add_argument('--delay', type=float, default=0.01, help='simulated parse time, in seconds')
+    clients.add_argument('--concurrency', type=int, default=20, help='concurrency of threads and async client')
+    clients.set_defaults(func=benchmark_clients)
+
+    codecs = subparsers.add_parser('codecs', help='compression codecs')
+    codecs.add_argument('--count', type=int, default=200, help='count of notes in the corpus')
+    codecs.set_defaults(func=benchmark_codecs)
+
+    args = parser.parse_args()
+    if not hasattr(args, 'func'):
+        parser.error('benchmark is not specified')
+
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
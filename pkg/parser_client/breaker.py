@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from .client import get_client, ParserUnavailableError
+
+
+__all__ = ['CircuitBreaker', 'GuardedParserClient', ]
+
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of calls to remote service.
+
+    Closed breaker passes all calls. It opens after failure_threshold consecutive failures (calls slower
+    than latency_threshold are failures too), and open breaker rejects calls for reset_timeout seconds.
+    Then it's half-open: only probe calls are passed, success of probe closes the breaker, failure opens it again
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    __slots__ = (
+        '__failure_threshold', '__latency_threshold', '__reset_timeout', '__max_probes', '__lock', '__failures',
+        '__opened_at', '__probes',
+    )
+
+    def __init__(self, failure_threshold=5, latency_threshold=None, reset_timeout=30, max_probes=1):
+        """
+        :param int failure_threshold: count of consecutive failures, which opens the breaker
+        :param float latency_threshold: calls slower than that (in seconds) are failures. Not checked by default
+        :param float reset_timeout: time the breaker stays open, in seconds
+        :param int max_probes: max count of simultaneous probe calls of half-open breaker
+        """
+        self.__failure_threshold = int(failure_threshold)
+        self.__latency_threshold = latency_threshold
+        self.__reset_timeout = reset_timeout
+        self.__max_probes = int(max_probes)
+        self.__lock = threading.Lock()
+        self.__failures = 0
+        self.__opened_at = None
+        self.__probes = 0
+
+    @property
+    def state(self):
+        """
+        :rtype string:
+        """
+        if self.__opened_at is None:
+            return self.CLOSED
+
+        if _now() - self.__opened_at < self.__reset_timeout:
+            return self.OPEN
+
+        return self.HALF_OPEN
+
+    def allow(self):
+        """
+        Check whether call can be performed. Every allowed call has to be followed by record_success or record_failure
+
+        :rtype bool:
+        """
+        if self.__opened_at is None:
+            return True
+
+        with self.__lock:
+            if self.state != self.HALF_OPEN or self.__probes >= self.__max_probes:
+                return self.__opened_at is None
+
+            self.__probes += 1
+            return True
+
+    def record_success(self, elapsed=0):
+        """
+        :param float elapsed: duration of the call, in seconds
+        """
+        if self.__latency_threshold is not None and elapsed > self.__latency_threshold:
+            return self.record_failure()
+
+        with self.__lock:
+            self.__failures = 0
+            self.__opened_at = None
+            self.__probes = 0
+
+    def record_failure(self):
+        with self.__lock:
+            self.__failures += 1
+
+            if self.__opened_at is not None or self.__failures >= self.__failure_threshold:
+                self.__opened_at = _now()
+                self.__probes = 0
+
+
+class GuardedParserClient(object):
+    """
+    Parser client for the save path: calls are guarded by the circuit breaker and limited by the latency budget.
+    Optionally the request is hedged: if the primary parser does not answer in hedge_delay seconds or fails,
+    the same request is sent to the second parser, and the first answer is used.
+
+    Only unavailability of the parser (connection error, timeout, 5xx, budget is over) is failure of the breaker.
+    Failure, rejected request or open breaker return empty string, so caller falls back to the original text
+    """
+    __slots__ = ('__server', '__hedge_server', '__hedge_delay', '__budget', '__breaker', '__options', )
+
+    def __init__(self, server, breaker, budget=None, hedge_server=None, hedge_delay=0.1, **options):
+        """
+        :param string server: url of parser
+        :param CircuitBreaker breaker: breaker of calls to the parser
+        :param float budget: max time of one call including hedged request, in seconds. Not limited by default,
+            so the call takes up to timeout of the client for every request
+        :param string hedge_server: url of the second parser. Requests are not hedged by default
+        :param float hedge_delay: delay of hedged request, in seconds
+        :param dict options: options of parser clients, @see ParserClient
+        """
+        self.__server = server
+        self.__hedge_server = hedge_server
+        self.__hedge_delay = hedge_delay
+        self.__budget = budget
+        self.__breaker = breaker
+        self.__options = options
+
+    @property
+    def breaker(self):
+        """
+        :rtype CircuitBreaker:
+        """
+        return self.__breaker
+
+    def _process_guarded(self, text):
+        """
+        Requests are performed by threads, so the call returns at the deadline even if the socket is still waiting
+
+        :return string: first answer
+
+        :raises ParserUnavailableError: no parser has answered before the deadline
+        """
+        results = Queue()
+
+        def call(server):
+            try:
+                results.put((get_client(server, **self.__options).process(
+                    text, timeout=self.__budget, raise_unavailable=True), None, ))
+            except ParserUnavailableError as err:
+                results.put((None, err, ))
+            except Exception:
+                results.put((u'', None, ))
+
+        servers = [self.__server] + ([self.__hedge_server] if self.__hedge_server else [])
+        deadline = _now() + self.__budget if self.__budget is not None else None
+        error = None
+        pending = 0
+
+        for i, server in enumerate(servers):
+            thread = threading.Thread(target=call, args=(server, ))
+            thread.daemon = True
+            thread.start()
+            pending += 1
+
+            # wait for the answer until it's time to hedge or the budget is over
+            wait_until = _now() + self.__hedge_delay if i < len(servers) - 1 else None
+            if deadline is not None:
+                wait_until = deadline if wait_until is None else min(wait_until, deadline)
+
+            while pending:
+                try:
+                    parsed, err = results.get(timeout=max(wait_until - _now(), 0) if wait_until is not None else None)
+                except Empty:
+                    break
+
+                pending -= 1
+                if err is None:
+                    return parsed
+
+                # failed parser is hedged at once
+                error = err
+
+            if deadline is not None and _now() >= deadline:
+                break
+
+        if pending or error is None:
+            raise ParserUnavailableError('Parser has not answered in %s seconds' % self.__budget)
+
+        raise error
+
+    def process(self, text):
+        """
+        :param string text: text, which need to parse
+
+        :return string: parsed text or empty string on failure
+        """
+        if not text or not self.__breaker.allow():
+            return u''
+
+        started = _now()
+        try:
+            if self.__hedge_server or self.__budget is not None:
+                parsed = self._process_guarded(text)
+            else:
+                parsed = get_client(self.__server, **self.__options).process(text, raise_unavailable=True)
+        except ParserUnavailableError:
+            self.__breaker.record_failure()
+            return u''
+        except Exception:
+            parsed = u''
+
+        # empty or malformed answer means the parser is up, it's not failure of the breaker
+        self.__breaker.record_success(_now() - started)
+
+        return parsed
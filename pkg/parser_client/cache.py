@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+
+from pkg.utils.lru import ExpiringLRUCache
+
+
+__all__ = ['ParseResultCache', ]
+
+
+class ParseResultCache(object):
+    """
+    Cache of parser results keyed by hash of parser version and input text.
+    Has two tiers: in-process LRU and optional shared one (e.g. django cache).
+    Re-saving of unchanged text does not go to the parser, once the text has been parsed.
+    """
+    KEY_PREFIX = 'parser:'
+
+    __slots__ = ('__version', '__local', '__shared', '__shared_timeout', )
+
+    def __init__(self, version='', max_size=10000, ttl=0, shared=None, shared_timeout=24 * 60 * 60):
+        """
+        :param string version: version of parser. Results of other versions are not used
+        :param int max_size: max count of results in the in-process tier
+        :param int ttl: time to live of results in the in-process tier, in seconds. 0 - unlimited
+        :param shared: shared tier with interface of django cache. Not used by default
+        :param int shared_timeout: time to live of results in the shared tier, in seconds
+        """
+        self.__version = version
+        self.__local = ExpiringLRUCache(max_size, ttl)
+        self.__shared = shared
+        self.__shared_timeout = shared_timeout
+
+    def _get_key(self, text):
+        data = u'%s\0%s' % (self.__version, text)
+        return self.KEY_PREFIX + hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def get(self, text):
+        """
+        :param string text: input of parser
+
+        :return string: cached result or None
+        """
+        key = self._get_key(text)
+        parsed = self.__local.get(key)
+
+        if parsed is None and self.__shared is not None:
+            parsed = self.__shared.get(key)
+            if parsed is not None:
+                self.__local.set(key, parsed)
+
+        return parsed
+
+    def set(self, text, parsed):
+        """
+        :param string text: input of parser
+        :param string parsed: result of parser
+        """
+        key = self._get_key(text)
+        self.__local.set(key, parsed)
+
+        if self.__shared is not None:
+            self.__shared.set(key, parsed, self.__shared_timeout)
@@ -1,125 +1,520 @@
 # -*- coding: utf-8 -*-
 
+import os
 import json
+import threading
 import requests
+from contextlib import closing
+from requests.adapters import HTTPAdapter
 from socket import timeout as TimeoutError
 
+from .compression import (
+    get_codec, get_codec_names, CODEC_HEADER, ACCEPT_CODECS_HEADER, SERVER_CODECS_HEADER, LEGACY_CODEC,
+)
+from .metrics import get_metrics, timer
 
-__all__ = ['ParserClient', 'send_request', ]
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry
 
+try:
+    unicode
+except NameError:
+    # python 3
+    unicode = str
 
-class ParserCompressor(object):
-    PARSER_ZLIB = 'zlib'
 
-    __slots__ = ('__compressor_type', '__compressor', )
+__all__ = ['ParserClient', 'ParserUnavailableError', 'send_request', 'send_many_requests', 'get_client', ]
 
-    def __init__(self, compressor_type=PARSER_ZLIB):
+
+class ParserUnavailableError(Exception):
+    """
+    Parser can't be reached: connection error, timeout or server error (5xx)
+    """
+    pass
+
+
+def _iter_parse_request(text, chunk_size):
+    """
+    Encode parse request by slices of the text, so JSON of the whole note is never built
+
+    :param unicode text: text, which need to parse
+    :param int chunk_size: size of slice, in characters
+
+    :return generator: ascii-encoded chunks of JSON
+    """
+    yield b'{"action": "parse", "html": "'
+
+    for start in range(0, len(text), chunk_size):
+        # escaped slice without quotes. Output is ascii, so surrogate pairs may be split safely
+        yield json.dumps(text[start:start + chunk_size])[1:-1].encode('ascii')
+
+    yield b'"}'
+
+
+def _iter_compressed(chunks, compressor):
+    """
+    :param chunks: iterable of bytes
+    :param compressor: incremental compressor, @see Codec.compressobj
+
+    :return generator: compressed chunks
+    """
+    for chunk in chunks:
+        cchunk = compressor.compress(chunk)
+        if cchunk:
+            yield cchunk
+
+    cchunk = compressor.flush()
+    if cchunk:
+        yield cchunk
+
+
+class ParserClient(object):
+    """
+    Client of parser server. It's safe to share one instance between threads, @see get_client
+    """
+    BATCH_MAX_COUNT = 100
+    BATCH_MAX_SIZE = 1024 * 1024
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    __slots__ = (
+        '__compressor_type', '__codecs', '__min_compress_size', '__server_codecs', '__parser_server', '__timeout',
+        '__pool_size', '__max_retries', '__keep_alive', '__stream_threshold', '__metrics', '__session', '__pid',
+    )
+
+    def __init__(self, parser_server, compressor_type=LEGACY_CODEC, timeout=10, pool_size=10,
+                 max_retries=2, keep_alive=True, codecs=None, min_compress_size=0, stream_threshold=None,
+                 metrics=None):
         """
-        Initialize instance
+        Instance of parser client
 
-        :param string compressor_type: type of compressor engine
+        :param string parser_server: url of parser
+        :param string compressor_type: codec, which is used until the server tells which codecs it supports
+        :param float timeout: timeout of request, in seconds
+        :param int pool_size: max count of kept-alive connections to the parser
+        :param int max_retries: count of retries of failed connection attempts
+        :param bool keep_alive: reuse connections between requests
+        :param list codecs: preferred codecs, in order of preference. @see pkg.parser_client.compression
+        :param int min_compress_size: smaller requests are sent uncompressed, if the server supports it
+        :param int stream_threshold: texts of this size (in characters) and larger are streamed by chunked requests.
+            Server has to accept chunked transfer encoding. Disabled by default
+        :param MetricsHook metrics: hook of client's metrics. Process-wide one by default, @see set_metrics
         """
+        available = get_codec_names()
 
-        self.__compressor_type = ''
-        self.__compressor = None
+        self.__compressor_type = compressor_type
+        self.__codecs = [name for name in (codecs or []) if name in available and name != compressor_type]
+        self.__codecs.append(compressor_type)
+        self.__min_compress_size = int(min_compress_size)
+        self.__server_codecs = None
+        self.__parser_server = parser_server
+        self.__timeout = float(timeout)
+        self.__pool_size = int(pool_size)
+        self.__max_retries = int(max_retries)
+        self.__keep_alive = keep_alive
+        self.__stream_threshold = int(stream_threshold) if stream_threshold else None
+        self.__metrics = metrics
+        self.__session = None
+        self.__pid = None
+
+    def _build_session(self):
+        """
+        :rtype requests.Session:
+        """
+        session = requests.Session()
+        # only connection errors are retried, so the request is never sent twice
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.__pool_size,
+            max_retries=Retry(total=self.__max_retries, connect=self.__max_retries, read=0, backoff_factor=0.1),
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
 
-        self.compressor_type = compressor_type
+        if not self.__keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
 
     @property
-    def compressor_type(self):
+    def session(self):
+        """
+        HTTP session with pool of connections. It's rebuilt after fork, so child processes do not share sockets
+
+        :rtype requests.Session:
         """
-        :rtype string:
+        pid = os.getpid()
+
+        if self.__session is None or self.__pid != pid:
+            self.__session = self._build_session()
+            self.__pid = pid
+
+        return self.__session
+
+    def _get_request_codec(self, size):
         """
+        Select codec of request. Until the server tells which codecs it supports, the legacy one is used
+
+        :param int size: size of request body, in bytes
+
+        :return string: name of codec
+        """
+        server_codecs = self.__server_codecs
+        if server_codecs is None:
+            return self.__compressor_type
+
+        if size < self.__min_compress_size and 'identity' in server_codecs:
+            return 'identity'
+
+        for name in self.__codecs:
+            if name in server_codecs:
+                return name
+
         return self.__compressor_type
 
-    @compressor_type.setter
-    def compressor_type(self, c_type):
+    @property
+    def metrics(self):
         """
-        :param string c_type: type of compressor
+        :rtype MetricsHook:
         """
-        try:
-            self.__compressor = __import__(c_type)
-            self.__compressor_type = c_type
-        except ImportError:
-            pass
+        return self.__metrics or get_metrics()
 
-    def compress(self, string="", level=5):
+    def _post(self, codec_name, body, stream=False, timeout=None):
         """
-        Perform compress
+        :param string codec_name: codec of request body
+        :param body: compressed request body: bytes or generator of chunks
+        :param bool stream: do not read response body in advance
+        :param float timeout: timeout of the request, in seconds. Client's one by default
 
-        :param string string: Data to compress
-        :param int level: compression level
+        :return requests.Response: response with status 200 or None on rejected request
 
-        :return bytearray:
+        :raises ParserUnavailableError:
         """
-        if not string:
-            return u''
+        metrics = self.metrics
+        headers = {}
+
+        # request without headers is legacy one, they are sent once the server has told which codecs it supports
+        if self.__server_codecs is not None or codec_name != LEGACY_CODEC:
+            headers[CODEC_HEADER] = codec_name
+            headers[ACCEPT_CODECS_HEADER] = ', '.join(self.__codecs)
 
-        return self.__compressor.compress(string, level)
+        metrics.increment('parser.requests')
+        started = timer()
+        try:
+            result = self.session.post(self.__parser_server, body, headers=headers,
+                                       timeout=self.__timeout if timeout is None else timeout, stream=stream)
+        except (requests.exceptions.Timeout, TimeoutError, ) as err:
+            metrics.increment('parser.errors.timeout')
+            raise ParserUnavailableError(err)
+        except requests.exceptions.ConnectionError as err:
+            metrics.increment('parser.errors.connection')
+            raise ParserUnavailableError(err)
+        finally:
+            metrics.timing('parser.time.http', timer() - started)
+
+        if SERVER_CODECS_HEADER in result.headers:
+            self.__server_codecs = frozenset(name.strip() for name in result.headers[SERVER_CODECS_HEADER].split(','))
 
-    def decompress(self, string=None):
+        if result.status_code != 200:
+            metrics.increment('parser.errors.status')
+            result.close()
+
+            if result.status_code >= 500:
+                raise ParserUnavailableError('Parser has answered with status %d' % result.status_code)
+
+            return None
+
+        return result
+
+    def _loads(self, content):
         """
-        Perform decompress
+        :param content: decompressed response: unicode or utf-8 bytes
 
-        :param bytearray string: Data to decompress
+        :return dict: decoded response or None
+        """
+        started = timer()
+        try:
+            return json.loads(content)
+        except (TypeError, ValueError, ):
+            self.metrics.increment('parser.errors.malformed')
+            return None
+        finally:
+            self.metrics.timing('parser.time.parse', timer() - started)
 
-        :return string:
+    def _send(self, data, timeout=None):
         """
+        Send request to the parser
 
-        if not string:
-            return u''
+        :param dict data: request
+        :param float timeout: timeout of the request, in seconds. Client's one by default
 
-        return unicode(self.__compressor.decompress(string))
+        :return dict: decoded response or None on failure
 
+        :raises ParserUnavailableError:
+        """
+        metrics = self.metrics
 
-class ParserClient(object):
-    __slots__ = ('__compressor', '__parser_server', '__timeout', )
+        started = timer()
+        jdata = json.dumps(data).encode('utf-8')
+        metrics.timing('parser.time.serialize', timer() - started)
+
+        codec_name = self._get_request_codec(len(jdata))
+
+        started = timer()
+        cdata = get_codec(codec_name).compress(jdata)
+        metrics.timing('parser.time.compress', timer() - started)
+
+        metrics.histogram('parser.bytes.input', len(jdata))
+        metrics.histogram('parser.bytes.compressed', len(cdata))
+        if cdata:
+            metrics.histogram('parser.compression_ratio', len(jdata) / float(len(cdata)))
 
-    def __init__(self, parser_server, compressor_type=ParserCompressor.PARSER_ZLIB, timeout=10):
+        result = self._post(codec_name, cdata, timeout=timeout)
+        if result is None:
+            return None
+
+        started = timer()
+        try:
+            codec = get_codec(result.headers.get(CODEC_HEADER, self.__compressor_type))
+            unresult = unicode(codec.decompress(result.content), 'utf-8')
+        except Exception:
+            metrics.increment('parser.errors.malformed')
+            return None
+        finally:
+            metrics.timing('parser.time.decompress', timer() - started)
+
+        return self._loads(unresult)
+
+    def _read_stream(self, result):
         """
-        Instance of parser client
+        Decompress response incrementally as it's received, compressed body is never kept whole
 
-        :param string parser_server: url of parser
-        :param string compressor_type: type of string compressor. @see ParserCompressor
-        :param int timeout: connection timeout
+        :param requests.Response result: streamed response
+
+        :return bytes: decompressed body
         """
-        self.__compressor = ParserCompressor(compressor_type)
-        self.__parser_server = parser_server
-        self.__timeout = int(timeout)
+        codec = get_codec(result.headers.get(CODEC_HEADER, self.__compressor_type))
+        if not codec.streaming:
+            return codec.decompress(result.content)
+
+        decompressor = codec.decompressobj()
+        chunks = [decompressor.decompress(chunk) for chunk in result.iter_content(self.STREAM_CHUNK_SIZE)]
+        chunks.append(decompressor.flush())
+
+        return b''.join(chunks)
+
+    def _send_stream(self, text, timeout=None):
+        """
+        Send parse request with chunked body, which is encoded and compressed on the fly.
+        Peak memory is the text, the decompressed response and the parsed result.
+
+        Encoding and compression are interleaved with sending, so they are measured as part of http phase
+
+        :param unicode text: text, which need to parse
+        :param float timeout: timeout of the request, in seconds. Client's one by default
+
+        :return dict: decoded response or None on failure
 
-    def process(self, text):
+        :raises ParserUnavailableError:
+        """
+        codec_name = self._get_request_codec(len(text))
+        codec = get_codec(codec_name)
+        if not codec.streaming:
+            return self._send({"action": "parse", "html": text}, timeout)
+
+        body = _iter_compressed(_iter_parse_request(text, self.STREAM_CHUNK_SIZE), codec.compressobj())
+        result = self._post(codec_name, body, stream=True, timeout=timeout)
+        if result is None:
+            return None
+
+        started = timer()
+        with closing(result):
+            try:
+                content = self._read_stream(result)
+            except (requests.exceptions.Timeout, TimeoutError, ) as err:
+                self.metrics.increment('parser.errors.timeout')
+                raise ParserUnavailableError(err)
+            except requests.exceptions.RequestException as err:
+                self.metrics.increment('parser.errors.connection')
+                raise ParserUnavailableError(err)
+            except Exception:
+                self.metrics.increment('parser.errors.malformed')
+                return None
+            finally:
+                self.metrics.timing('parser.time.decompress', timer() - started)
+
+        # json decodes utf-8 bytes itself, without the intermediate unicode copy
+        return self._loads(content)
+
+    def process(self, text, timeout=None, raise_unavailable=False):
         """
         Perform request to the parser.
 
         :param string text: text, which need to parse
+        :param float timeout: timeout of the request, in seconds. Client's one by default
+        :param bool raise_unavailable: raise ParserUnavailableError, if the parser can't be reached.
+            Otherwise it's empty result as any other failure
 
         :return string;
         """
-        data = {
-            "action": "parse",
-            "html": unicode(text)
-        }
+        text = unicode(text)
 
-        jdata = json.dumps(data)
+        try:
+            if self.__stream_threshold is not None and len(text) >= self.__stream_threshold:
+                response = self._send_stream(text, timeout)
+            else:
+                response = self._send({"action": "parse", "html": text}, timeout)
+        except ParserUnavailableError:
+            if raise_unavailable:
+                raise
+
+            response = None
+
+        if response is None:
+            return u''
 
-        cdata = self.__compressor.compress(jdata)
         try:
-            result = requests.post(self.__parser_server, cdata, timeout=self.__timeout)
-        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, TimeoutError, ):
+            return response["data"]["parsed_html"]
+        except (TypeError, KeyError, ):
+            self.metrics.increment('parser.errors.malformed')
             return u''
 
-        if result.status_code != 200:
-            return u""
+    def _split_batches(self, texts, max_count, max_size):
+        """
+        Split texts into batches limited by count of items and total size of texts.
+        Text larger than max_size is sent alone
+
+        :return generator: lists of texts
+        """
+        batch = []
+        batch_size = 0
+
+        for text in texts:
+            if batch and (len(batch) >= max_count or batch_size + len(text) > max_size):
+                yield batch
+                batch = []
+                batch_size = 0
+
+            batch.append(text)
+            batch_size += len(text)
+
+        if batch:
+            yield batch
 
-        unresult = self.__compressor.decompress(result.content)
+    def _process_batch(self, texts):
+        """
+        :return list: parsed texts. Empty string for failed ones
+        """
+        data = {
+            "action": "parse_many",
+            "items": [unicode(text) for text in texts],
+        }
 
         try:
-            result = json.loads(unresult)["data"]["parsed_html"]
-        except (TypeError, ValueError, ):
-            result = u''
+            response = self._send(data)
+        except ParserUnavailableError:
+            response = None
+
+        if response is None:
+            return [u''] * len(texts)
+
+        try:
+            items = response["data"]["items"]
+        except (TypeError, KeyError, ):
+            items = None
+
+        if not isinstance(items, list) or len(items) != len(texts):
+            self.metrics.increment('parser.errors.malformed')
+            return [u''] * len(texts)
+
+        return [item.get("parsed_html") or u'' if isinstance(item, dict) else u'' for item in items]
+
+    def process_many(self, texts, max_count=BATCH_MAX_COUNT, max_size=BATCH_MAX_SIZE):
+        """
+        Parse many texts by batched requests. Failure of one text does not fail others
+
+        :param list texts: texts, which need to parse
+        :param int max_count: max count of texts in one request
+        :param int max_size: max total size of texts in one request, in characters
+
+        :return list: parsed texts in the same order. Empty string for failed ones
+        """
+        result = []
+
+        for batch in self._split_batches([unicode(text) for text in texts], max_count, max_size):
+            result.extend(self._process_batch(batch))
 
         return result
 
 
-def send_request(server, text):
-    return ParserClient(server).process(text) or text
+_clients = {}
+_clients_lock = threading.Lock()
+_clients_pid = None
+
+
+def get_client(server, **options):
+    """
+    Returns process-wide client of parser server. Client is created on first call for the server,
+    so options are applied only then. @see ParserClient
+
+    :param string server: url of parser
+
+    :rtype ParserClient:
+    """
+    global _clients, _clients_lock, _clients_pid
+
+    # lock could be held by another thread at the moment of fork, so child process gets its own registry
+    if _clients_pid != os.getpid():
+        _clients, _clients_lock, _clients_pid = {}, threading.Lock(), os.getpid()
+
+    client = _clients.get(server)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(server)
+            if client is None:
+                client = _clients[server] = ParserClient(server, **options)
+
+    return client
+
+
+def send_request(server, text, fast_path=None, **options):
+    """
+    :param string server: url of parser
+    :param string text: text, which need to parse
+    :param FastPath fast_path: local classifier, clean texts are not sent to the parser
+    :param dict options: options of client, @see get_client
+
+    :return string: parsed text or original one on failure
+    """
+    client = get_client(server, **options)
+
+    if fast_path is not None:
+        return fast_path.process(text, client.process) or text
+
+    return client.process(text) or text
+
+
+def send_many_requests(server, texts, fast_path=None, **options):
+    """
+    Parse many texts by batched requests, @see send_request
+
+    :return list: parsed texts in the same order. Original ones on failure
+    """
+    client = get_client(server, **options)
+    texts = [unicode(text) for text in texts]
+    parsed = [None] * len(texts)
+
+    if fast_path is not None:
+        for i, text in enumerate(texts):
+            if fast_path.is_clean(text):
+                parsed[i] = fast_path.process(text, client.process, True)
+
+    remote = [i for i, result in enumerate(parsed) if result is None]
+    if fast_path is not None:
+        fast_path.record_remote(len(remote))
+
+    for i, result in zip(remote, client.process_many([texts[i] for i in remote])):
+        parsed[i] = result
+
+    return [result or text for result, text in zip(parsed, texts)]
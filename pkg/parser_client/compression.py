@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compression codecs of the parser wire format.
+
+Codec of request body is passed in CODEC_HEADER, codecs acceptable for response - in ACCEPT_CODECS_HEADER.
+Server answers with codec of response body in CODEC_HEADER and the list of its codecs in SERVER_CODECS_HEADER.
+Request without CODEC_HEADER is compressed by legacy zlib.
+"""
+
+import bz2
+import zlib
+import threading
+
+
+__all__ = [
+    'Codec', 'IdentityCodec', 'ZlibCodec', 'GzipCodec', 'ZlibDictCodec', 'Bz2Codec', 'LzmaCodec', 'ZstdCodec',
+    'Lz4Codec',
+    'register_codec', 'get_codec', 'get_codec_names', 'CODEC_HEADER', 'ACCEPT_CODECS_HEADER', 'SERVER_CODECS_HEADER',
+    'LEGACY_CODEC', 'HTML_DICTIONARY',
+]
+
+
+CODEC_HEADER = 'X-Parser-Codec'
+ACCEPT_CODECS_HEADER = 'X-Parser-Accept-Codecs'
+SERVER_CODECS_HEADER = 'X-Parser-Codecs'
+LEGACY_CODEC = 'zlib'
+
+# preset dictionary for small notes: the most frequent fragments of notes' html
+HTML_DICTIONARY = (
+    b'<!DOCTYPE html><html><head><meta charset="utf-8"></head><body></body></html>'
+    b'<div></div><p></p><br><br/><span></span><strong></strong><b></b><em></em><i></i><u></u>'
+    b'<ul><li></li></ul><ol><li></li></ol><blockquote></blockquote><pre></pre><code></code>'
+    b'<a href="http://" target="_blank"></a><img src="" alt="" width="" height="">'
+    b'<table><tbody><tr><td></td></tr></tbody></table>'
+    b'<span style="font-weight: bold;"><span style="font-style: italic;"><span style="text-decoration: underline;">'
+    b'<div style="text-align: center;"><font color="#000000" face="Arial" size="2">&nbsp;&amp;&lt;&gt;&quot;'
+    b'{"action": "parse", "html": "{"data": {"parsed_html": "'
+)
+
+
+class _IdentityStream(object):
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class _FlushlessDecompressor(object):
+    """
+    Adapter of decompressors without flush (bz2, lzma, zstd) to the zlib interface
+    """
+    __slots__ = ('__decompressor', )
+
+    def __init__(self, decompressor):
+        self.__decompressor = decompressor
+
+    def decompress(self, data):
+        return self.__decompressor.decompress(data)
+
+    def flush(self):
+        return b''
+
+
+class Codec(object):
+    """
+    Base class of codecs. Codec has to be stateless, one instance is shared between threads.
+    Streaming codecs also provide incremental compressor and decompressor objects
+    """
+    streaming = False
+
+    @classmethod
+    def is_available(cls):
+        """
+        :return bool: whether required module is installed
+        """
+        return True
+
+    def compress(self, data):
+        """
+        :param bytes data: data to compress
+
+        :rtype bytes:
+        """
+        raise NotImplementedError()
+
+    def decompress(self, data):
+        """
+        :param bytes data: data to decompress
+
+        :rtype bytes:
+        """
+        raise NotImplementedError()
+
+    def compressobj(self):
+        """
+        :return: new incremental compressor with compress(data) and flush() methods
+        """
+        raise NotImplementedError()
+
+    def decompressobj(self):
+        """
+        :return: new incremental decompressor with decompress(data) and flush() methods
+        """
+        raise NotImplementedError()
+
+
+class IdentityCodec(Codec):
+    streaming = True
+
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+    def compressobj(self):
+        return _IdentityStream()
+
+    def decompressobj(self):
+        return _IdentityStream()
+
+
+class ZlibCodec(Codec):
+    streaming = True
+    wbits = zlib.MAX_WBITS
+
+    def __init__(self, level=5):
+        """
+        :param int level: compression level
+        """
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, self.wbits)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        return zlib.decompress(data, self.wbits)
+
+    def compressobj(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, self.wbits)
+
+    def decompressobj(self):
+        return zlib.decompressobj(self.wbits)
+
+
+class GzipCodec(ZlibCodec):
+    wbits = 16 + zlib.MAX_WBITS
+
+
+class ZlibDictCodec(ZlibCodec):
+    """
+    Zlib with preset dictionary, which improves compression of small notes. Requires python 3.3+
+    """
+
+    def __init__(self, level=5, dictionary=HTML_DICTIONARY):
+        """
+        :param int level: compression level
+        :param bytes dictionary: preset dictionary. Both sides have to use the same one
+        """
+        super(ZlibDictCodec, self).__init__(level)
+        self.dictionary = dictionary
+
+    @classmethod
+    def is_available(cls):
+        try:
+            zlib.compressobj(zdict=b'-')
+        except TypeError:
+            return False
+
+        return True
+
+    def compress(self, data):
+        compressor = self.compressobj()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = self.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def compressobj(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, self.wbits, zdict=self.dictionary)
+
+    def decompressobj(self):
+        return zlib.decompressobj(self.wbits, zdict=self.dictionary)
+
+
+class Bz2Codec(Codec):
+    streaming = True
+
+    def __init__(self, level=9):
+        self.level = level
+
+    def compress(self, data):
+        return bz2.compress(data, self.level)
+
+    def decompress(self, data):
+        return bz2.decompress(data)
+
+    def compressobj(self):
+        return bz2.BZ2Compressor(self.level)
+
+    def decompressobj(self):
+        return _FlushlessDecompressor(bz2.BZ2Decompressor())
+
+
+class LzmaCodec(Codec):
+    streaming = True
+
+    def __init__(self, preset=1):
+        self.preset = preset
+
+    @classmethod
+    def _get_module(cls):
+        try:
+            import lzma
+        except ImportError:
+            from backports import lzma
+
+        return lzma
+
+    @classmethod
+    def is_available(cls):
+        try:
+            cls._get_module()
+        except ImportError:
+            return False
+
+        return True
+
+    def compress(self, data):
+        return self._get_module().compress(data, preset=self.preset)
+
+    def decompress(self, data):
+        return self._get_module().decompress(data)
+
+    def compressobj(self):
+        return self._get_module().LZMACompressor(preset=self.preset)
+
+    def decompressobj(self):
+        return _FlushlessDecompressor(self._get_module().LZMADecompressor())
+
+
+class ZstdCodec(Codec):
+    streaming = True
+
+    def __init__(self, level=3, dictionary=None):
+        """
+        :param int level: compression level
+        :param bytes dictionary: preset dictionary. Both sides have to use the same one
+        """
+        import zstandard
+
+        self.level = level
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        # compressor and decompressor objects are not thread-safe
+        self.local = threading.local()
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import zstandard
+        except ImportError:
+            return False
+
+        return True
+
+    def compress(self, data):
+        import zstandard
+
+        if not hasattr(self.local, 'compressor'):
+            self.local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+
+        return self.local.compressor.compress(data)
+
+    def decompress(self, data):
+        import zstandard
+
+        if not hasattr(self.local, 'decompressor'):
+            self.local.decompressor = zstandard.ZstdDecompressor(dict_data=self.dictionary)
+
+        return self.local.decompressor.decompress(data)
+
+    def compressobj(self):
+        import zstandard
+        return zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary).compressobj()
+
+    def decompressobj(self):
+        import zstandard
+        return _FlushlessDecompressor(zstandard.ZstdDecompressor(dict_data=self.dictionary).decompressobj())
+
+
+class Lz4Codec(Codec):
+    @classmethod
+    def is_available(cls):
+        try:
+            import lz4.frame
+        except ImportError:
+            return False
+
+        return True
+
+    def compress(self, data):
+        import lz4.frame
+        return lz4.frame.compress(data)
+
+    def decompress(self, data):
+        import lz4.frame
+        return lz4.frame.decompress(data)
+
+
+_codecs = {}
+_instances = {}
+
+
+def register_codec(name, codec_class, **options):
+    """
+    Register codec
+
+    :param string name: name of codec in the wire format
+    :param type codec_class: subclass of Codec
+    :param dict options: arguments of codec's constructor
+    """
+    _codecs[name] = (codec_class, options, )
+    _instances.pop(name, None)
+
+
+def get_codec_names():
+    """
+    :return list: names of registered codecs, whose modules are installed
+    """
+    return sorted(name for name, (codec_class, _) in _codecs.items() if codec_class.is_available())
+
+
+def get_codec(name):
+    """
+    :param string name: name of codec
+
+    :rtype Codec:
+    :raise: KeyError if codec is unknown or unavailable
+    """
+    if name not in _instances:
+        codec_class, options = _codecs[name]
+        if not codec_class.is_available():
+            raise KeyError(name)
+
+        _instances[name] = codec_class(**options)
+
+    return _instances[name]
+
+
+register_codec('identity', IdentityCodec)
+register_codec('zlib', ZlibCodec)
+register_codec('zlib-html', ZlibDictCodec)
+register_codec('gzip', GzipCodec)
+register_codec('bz2', Bz2Codec)
+register_codec('lzma', LzmaCodec)
+register_codec('zstd', ZstdCodec)
+register_codec('zstd-html', ZstdCodec, dictionary=HTML_DICTIONARY)
+register_codec('lz4', Lz4Codec)
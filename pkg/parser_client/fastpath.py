@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import re
+import random
+import threading
+
+
+__all__ = ['FastPath', 'DEFAULT_TAGS', 'DEFAULT_ATTRIBUTES', ]
+
+
+# tags, which the parser keeps as is
+DEFAULT_TAGS = (
+    'p', 'div', 'span', 'br', 'b', 'i', 'u', 's', 'strong', 'em', 'ul', 'ol', 'li', 'blockquote', 'pre', 'code', 'a',
+)
+# attributes of tags, which the parser keeps as is
+DEFAULT_ATTRIBUTES = {
+    'a': ('href', 'title', ),
+}
+# tags without closing one
+VOID_TAGS = frozenset(('br', ))
+ENTITIES = frozenset(('&amp;', '&lt;', '&gt;', '&quot;', '&nbsp;', ))
+SAFE_URL_SCHEMES = ('http://', 'https://', 'mailto:', )
+
+# every token of markup: tag, broken tag or entity
+_MARKUP = re.compile(r'<[^<>]*>?|>|&[^;&<>\s]*;?')
+_TAG = re.compile(r'<(/?)([a-z][a-z0-9]*)((?: [a-z]+="[^"<>]*")*)>$')
+_ATTRIBUTE = re.compile(r' ([a-z]+)="([^"]*)"')
+
+
+class FastPath(object):
+    """
+    Local pre-classifier of parser inputs. Text without markup, or with whitelisted tags and attributes only,
+    is returned by the parser unchanged, so it's not sent to the parser at all.
+
+    Whitelist has to follow rules of the parser. Drift is caught by verification: part of clean texts
+    is still sent to the parser, and mismatched results are counted, @see stats
+    """
+    MAX_CACHED_TOKENS = 4096
+
+    __slots__ = ('__tags', '__attributes', '__verify_rate', '__lock', '__counters', '__tokens', )
+
+    def __init__(self, tags=DEFAULT_TAGS, attributes=None, verify_rate=0):
+        """
+        :param tuple tags: tags, which the parser keeps as is
+        :param dict attributes: tag => attributes, which the parser keeps as is. DEFAULT_ATTRIBUTES by default
+        :param float verify_rate: share of clean texts, which are verified by the parser. 0 - no verification
+        """
+        self.__tags = frozenset(tags)
+        if attributes is None:
+            attributes = DEFAULT_ATTRIBUTES
+
+        self.__attributes = dict((tag, frozenset(names), ) for tag, names in attributes.items())
+        self.__verify_rate = verify_rate
+        self.__lock = threading.Lock()
+        self.__counters = dict.fromkeys(('calls', 'avoided', 'verified', 'mismatched', ), 0)
+        # markup token => its kind, @see _classify
+        self.__tokens = {}
+
+    def _classify(self, token):
+        """
+        :param string token: markup token
+
+        :return: False for token, which the parser changes; True for entity or void tag;
+            name of opening tag; name of closing tag prefixed by slash
+        """
+        if token[0] == '&':
+            return token in ENTITIES
+
+        match = _TAG.match(token)
+        if match is None:
+            return False
+
+        closing, tag, attributes = match.groups()
+        if tag not in self.__tags:
+            return False
+
+        if closing:
+            return not attributes and closing + tag
+
+        allowed = self.__attributes.get(tag, ())
+        for name, value in _ATTRIBUTE.findall(attributes):
+            if name not in allowed or (name == 'href' and not value.startswith(SAFE_URL_SCHEMES)):
+                return False
+
+        return True if tag in VOID_TAGS else tag
+
+    def is_clean(self, text):
+        """
+        Single-pass scan of the text
+
+        :param string text: input of parser
+
+        :return bool: whether the parser returns the text unchanged
+        """
+        if '<' not in text and '>' not in text and '&' not in text:
+            return True
+
+        tokens = self.__tokens
+        stack = []
+
+        for token in _MARKUP.findall(text):
+            kind = tokens.get(token)
+            if kind is None:
+                kind = self._classify(token)
+                # the same tags are repeated in all notes, unique ones (e.g. links) are not kept
+                if len(tokens) < self.MAX_CACHED_TOKENS:
+                    tokens[token] = kind
+
+            if kind is True:
+                continue
+
+            if kind is False:
+                return False
+
+            if kind[0] != '/':
+                stack.append(kind)
+            elif not stack or stack.pop() != kind[1:]:
+                # the parser closes unbalanced tags
+                return False
+
+        return not stack
+
+    def _count(self, **increments):
+        with self.__lock:
+            for name, value in increments.items():
+                self.__counters[name] += value
+
+    def record_remote(self, count=1):
+        """
+        Count calls, which are sent to the parser bypassing process, e.g. by batches
+
+        :param int count: count of calls
+        """
+        self._count(calls=count)
+
+    def record_verified(self, text, parsed):
+        """
+        Count result of verification, which is performed out of process, @see process
+
+        :param string text: clean text
+        :param string parsed: its result of the parser or empty string on failure
+        """
+        if parsed:
+            self._count(verified=1, mismatched=int(parsed.strip() != text.strip()))
+
+    def process(self, text, remote, clean=None, verify=None):
+        """
+        Parse the text locally if it's clean, remotely otherwise
+
+        :param string text: input of parser
+        :param callable remote: remote parser, text => parsed text or empty string on failure
+        :param bool clean: result of is_clean, if it's already known
+        :param callable verify: verification out of the call, text => None. It has to report the result
+            by record_verified. Clean texts are verified by the remote parser in place by default
+
+        :return string: parsed text or empty string on failure
+        """
+        if clean is None:
+            clean = self.is_clean(text)
+
+        if not clean:
+            self._count(calls=1)
+            return remote(text)
+
+        if not self.__verify_rate or random.random() >= self.__verify_rate:
+            self._count(calls=1, avoided=1)
+            return text
+
+        if verify is not None:
+            verify(text)
+            self._count(calls=1, avoided=1)
+            return text
+
+        parsed = remote(text)
+        if parsed:
+            self._count(calls=1, verified=1, mismatched=int(parsed.strip() != text.strip()))
+        else:
+            self._count(calls=1)
+
+        # the parser is the source of truth
+        return parsed
+
+    def stats(self):
+        """
+        :return dict: counters of calls and percentage of avoided remote calls
+        """
+        with self.__lock:
+            stats = dict(self.__counters)
+
+        stats['avoided_percent'] = 100.0 * stats['avoided'] / stats['calls'] if stats['calls'] else 0.0
+        stats['mismatched_percent'] = 100.0 * stats['mismatched'] / stats['verified'] if stats['verified'] else 0.0
+
+        return stats
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from pkg.parser_client import background_parser, parser, parse_cache
+from pkg.parser_client.background import BackgroundParser
+
+
+class Command(BaseCommand):
+    help = 'Parse notes, which are saved with raw text and left behind by background parser'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--older-than', dest='older_than', type='int', default=60,
+                    help='Process notes pending for more than OLDER_THAN seconds'),
+        make_option('--limit', dest='limit', type='int', default=100,
+                    help='Count of notes processed at once'),
+        make_option('--interval', dest='interval', type='int', default=0,
+                    help='Repeat every INTERVAL seconds. Process once by default'),
+    )
+
+    def handle(self, *args, **options):
+        # markers can be left even if async mode is disabled after
+        processor = background_parser or BackgroundParser(parser, parse_cache)
+        interval = options['interval']
+
+        while True:
+            total = 0
+
+            while True:
+                processed = processor.process_pending(options['older_than'], options['limit'])
+                if not processed:
+                    break
+
+                total += processed
+
+            self.stdout.write('Processed %d pending notes\n' % total)
+
+            if interval <= 0:
+                break
+
+            time.sleep(interval)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import time
+import bisect
+import threading
+
+
+__all__ = ['MetricsHook', 'NullMetrics', 'InMemoryMetrics', 'get_metrics', 'set_metrics', 'timer', ]
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class MetricsHook(object):
+    """
+    Interface of metrics backend. Methods are called on hot path, so they have to be cheap and never raise
+    """
+    def timing(self, name, seconds):
+        """
+        :param string name: name of metric
+        :param float seconds: duration
+        """
+        raise NotImplementedError()
+
+    def histogram(self, name, value):
+        """
+        :param string name: name of metric
+        :param float value: observed value
+        """
+        raise NotImplementedError()
+
+    def increment(self, name, count=1):
+        """
+        :param string name: name of counter
+        :param int count: increment
+        """
+        raise NotImplementedError()
+
+
+class NullMetrics(MetricsHook):
+    def timing(self, name, seconds):
+        pass
+
+    def histogram(self, name, value):
+        pass
+
+    def increment(self, name, count=1):
+        pass
+
+
+class _Histogram(object):
+    __slots__ = ('bounds', 'buckets', 'count', 'sum', 'min', 'max', )
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # the last bucket is for values above all bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def dump(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'buckets': [(bound, count, ) for bound, count in zip(self.bounds + (None, ), self.buckets) if count],
+        }
+
+
+class InMemoryMetrics(MetricsHook):
+    """
+    Metrics of the process kept in memory: histograms with fixed buckets and counters
+    """
+    # upper bounds of buckets of timings, in seconds: 10us .. 10s
+    TIME_BOUNDS = (
+        0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1, 2.5, 5, 10,
+    )
+    # upper bounds of buckets of other values: powers of 4 up to 16M
+    VALUE_BOUNDS = tuple(4 ** i for i in range(13))
+
+    __slots__ = ('__lock', '__histograms', '__counters', )
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__histograms = {}
+        self.__counters = {}
+
+    def _observe(self, name, value, bounds):
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = _Histogram(bounds)
+
+            histogram.observe(value)
+
+    def timing(self, name, seconds):
+        self._observe(name, seconds, self.TIME_BOUNDS)
+
+    def histogram(self, name, value):
+        self._observe(name, value, self.VALUE_BOUNDS)
+
+    def increment(self, name, count=1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + count
+
+    def dump(self):
+        """
+        :return dict: {'counters': {name: count}, 'histograms': {name: {count, sum, min, max, buckets}}}.
+            Buckets are pairs of upper bound (None for the last one) and count, empty ones are omitted
+        """
+        with self.__lock:
+            return {
+                'counters': dict(self.__counters),
+                'histograms': dict((name, histogram.dump(), ) for name, histogram in self.__histograms.items()),
+            }
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms = {}
+            self.__counters = {}
+
+
+_metrics = InMemoryMetrics()
+
+
+def get_metrics():
+    """
+    :return MetricsHook: process-wide metrics hook
+    """
+    return _metrics
+
+
+def set_metrics(hook):
+    """
+    Replace process-wide metrics hook, e.g. with adapter of statsd
+
+    :param MetricsHook hook: new hook
+    """
+    global _metrics
+    _metrics = hook
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+
+from django.db import models
+
+
+__all__ = ['PendingParse', 'get_text_hash', ]
+
+
+def get_text_hash(text):
+    """
+    :param string text: text of note
+
+    :return string: hex digest of text
+    """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class PendingParse(models.Model):
+    """
+    Marker of note saved with raw text, which is waiting for the background parser, @see BackgroundParser
+    """
+    note_id = models.IntegerField(primary_key=True)
+    text_hash = models.CharField(max_length=40)
+    created_at = models.DateTimeField(db_index=True)
+    attempts = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'notes_pending_parse'
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in of the parser server for tests and benchmarks. It speaks the same wire format,
+zlib-compressed JSON requests (plain or chunked) and responses:
+    {"action": "parse", "html": ...} => {"data": {"parsed_html": ...}}
+    {"action": "parse_many", "items": [...]} => {"data": {"items": [{"parsed_html": ...} or {"error": ...}, ...]}}
+
+If the stub is started with the list of codecs, it negotiates them by headers, @see pkg.parser_client.compression
+"""
+
+import json
+import time
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+from .compression import get_codec, LEGACY_CODEC, CODEC_HEADER, ACCEPT_CODECS_HEADER, SERVER_CODECS_HEADER
+
+
+__all__ = ['ParserStubServer', ]
+
+
+class _ParserStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections_count += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _get_response_codec(self):
+        if not self.server.codecs:
+            return LEGACY_CODEC
+
+        accepted = [name.strip() for name in (self.headers.get(ACCEPT_CODECS_HEADER) or '').split(',')]
+        for name in accepted:
+            if name in self.server.codecs and name != 'identity':
+                return name
+
+        return LEGACY_CODEC
+
+    def _send(self, status, data=None):
+        codec_name = self._get_response_codec()
+        body = get_codec(codec_name).compress(json.dumps(data).encode('utf-8')) if data is not None else b''
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if self.server.codecs:
+            self.send_header(CODEC_HEADER, codec_name)
+            self.send_header(SERVER_CODECS_HEADER, ', '.join(self.server.codecs))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if not size:
+                self.rfile.readline()
+                break
+
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+        self.server.chunked_requests_count += 1
+        return b''.join(chunks)
+
+    def do_POST(self):
+        self.server.requests_count += 1
+        body = self._read_body()
+
+        if self.server.delay:
+            time.sleep(self.server.delay)
+
+        if self.server.status is not None:
+            return self._send(self.server.status)
+
+        if self.headers.get(CODEC_HEADER) or self.headers.get(ACCEPT_CODECS_HEADER):
+            self.server.codec_headers_count += 1
+
+        codec_name = self.headers.get(CODEC_HEADER) if self.server.codecs else None
+        self.server.received_codecs.append(codec_name or LEGACY_CODEC)
+
+        try:
+            request = json.loads(get_codec(codec_name or LEGACY_CODEC).decompress(body).decode('utf-8'))
+        except Exception:
+            return self._send(400)
+
+        if not isinstance(request, dict):
+            return self._send(400)
+
+        if request.get('action') == 'parse':
+            return self._send(200, {'data': {'parsed_html': self.server.parse(request.get('html', ''))}})
+
+        if request.get('action') == 'parse_many' and isinstance(request.get('items'), list):
+            return self._send(200, {'data': {'items': [self._parse_item(item) for item in request['items']]}})
+
+        self._send(400)
+
+    def _parse_item(self, html):
+        try:
+            return {'parsed_html': self.server.parse(html)}
+        except Exception as err:
+            return {'error': str(err)}
+
+
+class ParserStubServer(ThreadingMixIn, HTTPServer):
+    """
+    Usage:
+        with ParserStubServer() as server:
+            ParserClient(server.url).process(text)
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, delay=0, parse=None, codecs=None, status=None):
+        """
+        :param string host: interface to listen on
+        :param int port: port to listen on. Random free one by default
+        :param float delay: simulated processing time of each request, in seconds
+        :param callable parse: transformation of html. By default html is only stripped
+        :param list codecs: supported codecs. By default the stub behaves as legacy server (zlib only, no headers)
+        :param int status: status of all responses, e.g. to simulate failed server. Requests are parsed by default
+        """
+        HTTPServer.__init__(self, (host, port), _ParserStubHandler)
+
+        self.delay = delay
+        self.parse = parse or (lambda html: html.strip())
+        self.codecs = codecs
+        self.status = status
+        self.requests_count = 0
+        self.connections_count = 0
+        self.chunked_requests_count = 0
+        self.received_codecs = []
+        self.codec_headers_count = 0
+        self.__thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.server_address
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.__thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
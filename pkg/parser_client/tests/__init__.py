@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from .aio import TestAsyncParserClient
+from .batch import TestParseMany
+from .breaker import TestCircuitBreaker, TestGuardedParserClient
+from .cache import TestParseResultCache, TestParseHandler
+from .compression import TestParserCodecs
+from .fastpath import TestFastPath
+from .metrics import TestParserMetrics
+from .stream import TestParserStreaming
+from .pool import TestParserPool
+from .background import TestBackgroundParser
+
+__all__ = [
+    'TestParseMany', 'TestCircuitBreaker', 'TestGuardedParserClient', 'TestParseResultCache', 'TestParseHandler',
+    'TestParserCodecs', 'TestParserStreaming', 'TestFastPath', 'TestParserMetrics', 'TestParserPool',
+    'TestBackgroundParser', 'TestAsyncParserClient',
+]
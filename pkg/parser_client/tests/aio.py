@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+from unittest import skipIf
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client.stub import ParserStubServer
+
+try:
+    import asyncio
+    from pkg.parser_client import _aio
+    from pkg.parser_client.aio import AsyncParserClient, run_process_many
+except (ImportError, SyntaxError, ):
+    # python 2
+    AsyncParserClient = None
+
+
+__all__ = ['TestAsyncParserClient', ]
+
+
+class CorruptCodec(object):
+    """
+    Legacy codec, whose responses can't be decompressed
+    """
+    def compress(self, data):
+        return zlib.compress(data)
+
+    def decompress(self, data):
+        raise zlib.error('Error -3 while decompressing data: incorrect header check')
+
+
+@skipIf(AsyncParserClient is None, 'AsyncParserClient requires python 3.7+ and aiohttp')
+class TestAsyncParserClient(SimpleTestCase):
+    def setUp(self):
+        self.server = ParserStubServer().start()
+        self._get_codec = _aio.get_codec
+
+    def tearDown(self):
+        _aio.get_codec = self._get_codec
+        self.server.stop()
+
+    def test_texts_are_parsed_in_order(self):
+        texts = [u' <p>%d</p> ' % i for i in range(20)]
+
+        self.assertEqual(run_process_many(self.server.url, texts, concurrency=4), [text.strip() for text in texts])
+        self.assertEqual(self.server.requests_count, 20)
+
+    def test_corrupt_response_fails_only_its_text(self):
+        codec = CorruptCodec()
+        _aio.get_codec = lambda name: codec if name == 'zlib' else self._get_codec(name)
+
+        self.assertEqual(run_process_many(self.server.url, [u'<p>a</p>', u'<p>b</p>']), [u'', u''])
+
+    def test_failed_server(self):
+        with ParserStubServer(status=500) as server:
+            self.assertEqual(run_process_many(server.url, [u'<p>a</p>']), [u''])
+
+    def test_session_of_previous_loop_is_closed(self):
+        client = AsyncParserClient(self.server.url)
+        loop, other_loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+
+        try:
+            self.assertEqual(loop.run_until_complete(client.process(u' <p>a</p> ')), u'<p>a</p>')
+            session = client._session
+
+            self.assertEqual(other_loop.run_until_complete(client.process(u' <p>b</p> ')), u'<p>b</p>')
+            self.assertIsNot(client._session, session)
+
+            # the closing is scheduled to the previous loop
+            loop.run_until_complete(asyncio.sleep(0.1))
+            self.assertTrue(session.closed)
+
+            other_loop.run_until_complete(client.close())
+        finally:
+            loop.close()
+            other_loop.close()
+
+    def test_session_of_closed_loop_is_released(self):
+        client = AsyncParserClient(self.server.url)
+
+        self.assertEqual(asyncio.run(client.process(u' <p>a</p> ')), u'<p>a</p>')
+        session = client._session
+
+        # the client is closed by other loop
+        asyncio.run(client.close())
+
+        self.assertTrue(session.closed)
+        self.assertIsNone(client._session)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.dispatch import Signal
+from django.test import TestCase
+
+from pkg.parser_client import background
+from pkg.parser_client.background import BackgroundParser
+from pkg.parser_client.models import PendingParse
+from pkg.quota.models import QuotaLimitError
+from pkg.utils.errors import ERROR_NOTE_SIZE_QUOTA_EXCEED
+from pkg.utils.transactions import batch_transaction
+
+
+__all__ = ['TestBackgroundParser', ]
+
+
+class NoteStub(object):
+    def __init__(self, pk, user_id, text, size):
+        self.pk = pk
+        self.user_id = user_id
+        self.text = text
+        self.size = size
+
+
+class NotesManagerStub(object):
+    def __init__(self, model):
+        self.model = model
+        self.notes = {}
+        self.locked = []
+
+    def select_for_update(self):
+        return self
+
+    def get(self, pk):
+        if pk not in self.notes:
+            raise self.model.DoesNotExist()
+
+        self.locked.append(pk)
+        note = self.notes[pk]
+
+        return NoteStub(note.pk, note.user_id, note.text, note.size)
+
+    def filter(self, pk):
+        return NotesQuerySetStub(self.notes, pk)
+
+
+class NotesQuerySetStub(object):
+    def __init__(self, notes, pk):
+        self.notes = notes
+        self.pk = pk
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self.notes[self.pk], name, value)
+
+        return 1
+
+
+class NotesStub(object):
+    """
+    Model of notes, which keeps them in memory
+    """
+    class DoesNotExist(ObjectDoesNotExist):
+        pass
+
+
+class ParserStub(object):
+    def process(self, text):
+        return u' %s<br> ' % text.upper()
+
+
+class CacheStub(object):
+    def get(self, text):
+        return None
+
+    def set(self, text, parsed):
+        pass
+
+
+class QueueStubParser(BackgroundParser):
+    """
+    Keeps queued notes instead of passing them to workers
+    """
+    def __init__(self, *args, **kwargs):
+        super(QueueStubParser, self).__init__(*args, **kwargs)
+        self.queued = []
+
+    def _put(self, note_id, text, callback=None):
+        self.queued.append((note_id, text, ))
+        return True
+
+
+class TestBackgroundParser(TestCase):
+    NOTE_ID = 1
+    USER_ID = 42
+
+    def setUp(self):
+        self._patched = (background.NotesNotes, background.note_updated, background.note_pre_size_change, )
+
+        NotesStub.objects = NotesManagerStub(NotesStub)
+        background.NotesNotes = NotesStub
+        background.note_updated = Signal()
+        background.note_pre_size_change = Signal()
+
+        self.updates = []
+        self.size_changes = []
+        background.note_updated.connect(lambda **kwargs: self.updates.append(kwargs), weak=False)
+        background.note_pre_size_change.connect(
+            lambda instance, prev_size, new_size, **kwargs: self.size_changes.append((prev_size, new_size, )),
+            weak=False,
+        )
+
+        self.parser = BackgroundParser(ParserStub(), CacheStub())
+
+    def tearDown(self):
+        background.NotesNotes, background.note_updated, background.note_pre_size_change = self._patched
+        del NotesStub.objects
+
+    def _save(self, text):
+        # size of note includes more than text
+        size = len(text.encode('utf-8')) + 10
+        NotesStub.objects.notes[self.NOTE_ID] = NoteStub(self.NOTE_ID, self.USER_ID, text, size)
+        PendingParse.objects.create(note_id=self.NOTE_ID, text_hash=background.get_text_hash(text),
+                                    created_at=background.timezone.now())
+
+    def test_parsed_text_is_written_with_its_size(self):
+        self._save(u'<p>заметка</p>')
+
+        self.assertTrue(self.parser.process_note(self.NOTE_ID, u'<p>заметка</p>'))
+
+        note = NotesStub.objects.notes[self.NOTE_ID]
+        self.assertEqual(note.text, u'<P>ЗАМЕТКА</P><br>')
+        self.assertEqual(self.size_changes, [(31, 35, )])
+        self.assertEqual(note.size, 35)
+        self.assertEqual(NotesStub.objects.locked, [self.NOTE_ID])
+        self.assertFalse(PendingParse.objects.exists())
+
+    def test_update_is_sent_for_user_after_commit(self):
+        self._save(u'<p>a</p>')
+
+        self.parser.process_note(self.NOTE_ID, u'<p>a</p>')
+
+        update, = self.updates
+        self.assertEqual((update['note_id'], update['user_id'], ), (self.NOTE_ID, self.USER_ID, ))
+
+    def test_newer_save_wins(self):
+        self._save(u'<p>b</p>')
+
+        self.assertFalse(self.parser.process_note(self.NOTE_ID, u'<p>a</p>'))
+        self.assertEqual(NotesStub.objects.notes[self.NOTE_ID].text, u'<p>b</p>')
+        self.assertEqual(self.updates, [])
+        self.assertTrue(PendingParse.objects.exists())
+
+    def test_text_over_quota_is_kept_raw(self):
+        def reject(**kwargs):
+            raise QuotaLimitError(ERROR_NOTE_SIZE_QUOTA_EXCEED)
+
+        background.note_pre_size_change.connect(reject, weak=False)
+        self._save(u'<p>a</p>')
+
+        self.assertTrue(self.parser.process_note(self.NOTE_ID, u'<p>a</p>'))
+        self.assertEqual(NotesStub.objects.notes[self.NOTE_ID].text, u'<p>a</p>')
+        self.assertEqual(self.updates, [])
+        self.assertFalse(PendingParse.objects.exists())
+
+    def test_note_is_queued_after_commit(self):
+        parser = QueueStubParser(ParserStub(), CacheStub())
+
+        with batch_transaction():
+            parser.submit(self.NOTE_ID, u'<p>a</p>')
+
+            # workers can't see the note until its transaction is committed
+            self.assertEqual(parser.queued, [])
+            self.assertTrue(PendingParse.objects.filter(note_id=self.NOTE_ID).exists())
+
+        self.assertEqual(parser.queued, [(self.NOTE_ID, u'<p>a</p>', )])
+
+    def test_note_is_not_queued_on_rollback(self):
+        parser = QueueStubParser(ParserStub(), CacheStub())
+
+        with self.assertRaises(ValueError):
+            with batch_transaction():
+                parser.submit(self.NOTE_ID, u'<p>a</p>')
+                raise ValueError()
+
+        self.assertEqual(parser.queued, [])
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client.client import ParserClient
+from pkg.parser_client.stub import ParserStubServer
+
+
+__all__ = ['TestParseMany', ]
+
+
+def _parse(html):
+    if 'broken' in html:
+        raise ValueError('broken html')
+
+    return html.upper()
+
+
+class TestParseMany(SimpleTestCase):
+    def setUp(self):
+        self.server = ParserStubServer(parse=_parse).start()
+        self.client = ParserClient(self.server.url)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_single_parse_is_still_supported(self):
+        self.assertEqual(self.client.process(u'<p>a</p>'), u'<P>A</P>')
+
+    def test_results_are_returned_in_order(self):
+        texts = [u'<p>%d</p>' % i for i in range(10)]
+
+        self.assertEqual(self.client.process_many(texts), [text.upper() for text in texts])
+        self.assertEqual(self.server.requests_count, 1)
+
+    def test_batch_is_split_by_count(self):
+        self.client.process_many([u'a'] * 10, max_count=3)
+
+        self.assertEqual(self.server.requests_count, 4)
+
+    def test_batch_is_split_by_size(self):
+        result = self.client.process_many([u'aaaa', u'bbbb', u'cccccccccc', u'd'], max_size=8)
+
+        self.assertEqual(result, [u'AAAA', u'BBBB', u'CCCCCCCCCC', u'D'])
+        self.assertEqual(self.server.requests_count, 3)
+
+    def test_failed_item_does_not_fail_batch(self):
+        result = self.client.process_many([u'a', u'broken', u'b'])
+
+        self.assertEqual(result, [u'A', u'', u'B'])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client.breaker import CircuitBreaker, GuardedParserClient
+from pkg.parser_client.stub import ParserStubServer
+
+
+__all__ = ['TestCircuitBreaker', 'TestGuardedParserClient', ]
+
+
+class TestCircuitBreaker(SimpleTestCase):
+    def test_breaker_opens_after_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_slow_calls_are_failures(self):
+        breaker = CircuitBreaker(failure_threshold=1, latency_threshold=0.5)
+
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_success(1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_breaker_passes_one_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+
+class TestGuardedParserClient(SimpleTestCase):
+    def setUp(self):
+        self.slow = ParserStubServer(delay=1, parse=lambda html: u'slow').start()
+        self.fast = ParserStubServer(parse=lambda html: u'fast').start()
+
+    def tearDown(self):
+        self.slow.stop()
+        self.fast.stop()
+
+    def _get_client(self, server, **options):
+        return GuardedParserClient(server.url, CircuitBreaker(failure_threshold=1, reset_timeout=60), **options)
+
+    def test_budget_is_overall_deadline(self):
+        client = self._get_client(self.slow, budget=0.1)
+
+        started = time.time()
+        self.assertEqual(client.process(u'a'), u'')
+        self.assertLess(time.time() - started, 0.5)
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_server_error_is_failure(self):
+        with ParserStubServer(status=503) as server:
+            client = self._get_client(server)
+
+            self.assertEqual(client.process(u'a'), u'')
+            self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_empty_or_rejected_result_is_not_failure(self):
+        with ParserStubServer(parse=lambda html: u'') as server:
+            client = self._get_client(server)
+
+            self.assertEqual(client.process(u'a'), u'')
+            self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+        with ParserStubServer(status=400) as server:
+            client = self._get_client(server, budget=1)
+
+            self.assertEqual(client.process(u'a'), u'')
+            self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_request_is_hedged_at_once(self):
+        with ParserStubServer(status=503) as server:
+            client = self._get_client(server, budget=0.5, hedge_server=self.fast.url, hedge_delay=0.3)
+
+            started = time.time()
+            self.assertEqual(client.process(u'a'), u'fast')
+            self.assertLess(time.time() - started, 0.2)
+            self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_open_breaker_fails_fast(self):
+        client = GuardedParserClient(self.slow.url, CircuitBreaker(failure_threshold=1, reset_timeout=60), budget=0.1)
+
+        self.assertEqual(client.process(u'a'), u'')
+        started = time.time()
+        self.assertEqual(client.process(u'a'), u'')
+        self.assertLess(time.time() - started, 0.05)
+        self.assertEqual(self.slow.requests_count, 1)
+
+    def test_request_is_hedged(self):
+        client = GuardedParserClient(self.slow.url, CircuitBreaker(), budget=0.5, hedge_server=self.fast.url,
+                                     hedge_delay=0.05)
+
+        self.assertEqual(client.process(u'a'), u'fast')
+        self.assertEqual(self.fast.requests_count, 1)
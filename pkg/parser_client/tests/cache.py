@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+import pkg.parser_client
+from pkg.parser_client.cache import ParseResultCache
+from pkg.parser_client.fastpath import FastPath
+from pkg.utils import lru
+
+
+__all__ = ['TestParseResultCache', 'TestParseHandler', ]
+
+
+class SharedCacheStub(object):
+    """
+    Shared tier with interface of django cache
+    """
+    def __init__(self):
+        self.items = {}
+        self.timeouts = {}
+
+    def get(self, key):
+        return self.items.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.items[key] = value
+        self.timeouts[key] = timeout
+
+
+class TimeStub(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class TestParseResultCache(SimpleTestCase):
+    def setUp(self):
+        self._time = lru.time
+        lru.time = self.clock = TimeStub()
+
+    def tearDown(self):
+        lru.time = self._time
+
+    def test_key_is_hash_of_version_and_text(self):
+        cache = ParseResultCache(version='1')
+        key = cache._get_key(u'<p>заметка</p>')
+
+        self.assertTrue(key.startswith(ParseResultCache.KEY_PREFIX))
+        self.assertEqual(len(key), len(ParseResultCache.KEY_PREFIX) + 64)
+        self.assertEqual(key, ParseResultCache(version='1')._get_key(u'<p>заметка</p>'))
+        self.assertNotEqual(key, ParseResultCache(version='2')._get_key(u'<p>заметка</p>'))
+        self.assertNotEqual(key, cache._get_key(u'<p>заметка </p>'))
+        # version and text are separated, so they can't be shifted into each other
+        self.assertNotEqual(ParseResultCache(version='1')._get_key(u'2a'), ParseResultCache(version='12')._get_key(u'a'))
+
+    def test_hit_and_miss(self):
+        cache = ParseResultCache()
+        cache.set(u' <p>a</p> ', u'<p>a</p>')
+
+        self.assertEqual(cache.get(u' <p>a</p> '), u'<p>a</p>')
+        self.assertEqual(cache.get(u'<p>b</p>'), None)
+
+    def test_result_is_not_cached_as_result_of_itself(self):
+        cache = ParseResultCache()
+        cache.set(u' <p>a</p> ', u'<p>a</p>')
+
+        self.assertEqual(cache.get(u'<p>a</p>'), None)
+
+    def test_results_of_other_version_are_not_used(self):
+        shared = SharedCacheStub()
+        ParseResultCache(version='1', shared=shared).set(u' <p>a</p> ', u'<p>a</p>')
+
+        self.assertEqual(ParseResultCache(version='2', shared=shared).get(u' <p>a</p> '), None)
+
+    def test_shared_tier_fills_local_one(self):
+        shared = SharedCacheStub()
+        ParseResultCache(shared=shared, shared_timeout=60).set(u' <p>a</p> ', u'<p>a</p>')
+        self.assertEqual(list(shared.timeouts.values()), [60])
+
+        cache = ParseResultCache(shared=shared)
+        self.assertEqual(cache.get(u' <p>a</p> '), u'<p>a</p>')
+
+        shared.items.clear()
+        self.assertEqual(cache.get(u' <p>a</p> '), u'<p>a</p>')
+
+    def test_local_results_expire(self):
+        cache = ParseResultCache(ttl=60)
+        cache.set(u' <p>a</p> ', u'<p>a</p>')
+
+        self.clock.now += 59
+        self.assertEqual(cache.get(u' <p>a</p> '), u'<p>a</p>')
+
+        self.clock.now += 1
+        self.assertEqual(cache.get(u' <p>a</p> '), None)
+
+    def test_least_recently_used_result_is_evicted(self):
+        cache = ParseResultCache(max_size=2)
+        cache.set(u'a', u'A')
+        cache.set(u'b', u'B')
+        cache.get(u'a')
+        cache.set(u'c', u'C')
+
+        self.assertEqual([cache.get(text) for text in (u'a', u'b', u'c', )], [u'A', None, u'C'])
+
+
+class NoteStub(object):
+    def __init__(self, text):
+        self.text = text
+
+
+class ParserStub(object):
+    def __init__(self):
+        self.calls = []
+
+    def process(self, text):
+        self.calls.append(text)
+        return u' %s ' % text.strip().upper()
+
+
+class TestParseHandler(SimpleTestCase):
+    PATCHED = ('parser', 'parse_cache', 'fast_path', 'background_parser', 'verify_fast_path', )
+
+    def setUp(self):
+        self._patched = dict((name, getattr(pkg.parser_client, name)) for name in self.PATCHED)
+
+        self.parser = pkg.parser_client.parser = ParserStub()
+        self.cache = pkg.parser_client.parse_cache = ParseResultCache()
+        pkg.parser_client.fast_path = None
+        pkg.parser_client.background_parser = None
+        pkg.parser_client.verify_fast_path = None
+
+    def tearDown(self):
+        for name, value in self._patched.items():
+            setattr(pkg.parser_client, name, value)
+
+    def _save(self, text):
+        instance = NoteStub(text)
+        pkg.parser_client.my_handler(sender=None, instance=instance)
+
+        return instance.text
+
+    def test_unchanged_text_is_not_sent_again(self):
+        self.assertEqual(self._save(u'<p>a < b</p>'), u'<P>A < B</P>')
+        self.assertEqual(self._save(u'<p>a < b</p>'), u'<P>A < B</P>')
+
+        self.assertEqual(self.parser.calls, [u'<p>a < b</p>'])
+        self.assertEqual(self.cache.get(u'<p>a < b</p>'), u'<P>A < B</P>')
+
+    def test_changed_text_is_sent(self):
+        self._save(u'<p>a</p>')
+        self._save(u'<p>b</p>')
+
+        self.assertEqual(self.parser.calls, [u'<p>a</p>', u'<p>b</p>'])
+
+    def test_clean_text_skips_parser_and_cache(self):
+        pkg.parser_client.fast_path = FastPath(verify_rate=0)
+
+        self.assertEqual(self._save(u' <p>a</p> '), u'<p>a</p>')
+
+        self.assertEqual(self.parser.calls, [])
+        self.assertEqual(self.cache.get(u' <p>a</p> '), None)
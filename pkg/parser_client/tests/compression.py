@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client.client import ParserClient
+from pkg.parser_client.compression import get_codec, get_codec_names
+from pkg.parser_client.stub import ParserStubServer
+
+
+__all__ = ['TestParserCodecs', ]
+
+
+class TestParserCodecs(SimpleTestCase):
+    def test_codecs_round_trip(self):
+        data = u'<p>заметка</p>'.encode('utf-8') * 100
+
+        for name in get_codec_names():
+            self.assertEqual(get_codec(name).decompress(get_codec(name).compress(data)), data, name)
+
+    def test_legacy_server_gets_zlib(self):
+        with ParserStubServer() as server:
+            client = ParserClient(server.url, codecs=['identity'])
+
+            self.assertEqual(client.process(u' <p>a</p> '), u'<p>a</p>')
+            self.assertEqual(client.process(u' <p>b</p> '), u'<p>b</p>')
+            self.assertEqual(server.received_codecs, ['zlib', 'zlib'])
+            self.assertEqual(server.codec_headers_count, 0)
+
+    def test_codecs_are_negotiated(self):
+        with ParserStubServer(codecs=['identity', 'gzip']) as server:
+            client = ParserClient(server.url, codecs=['gzip'], min_compress_size=100)
+
+            client.process(u'<p>a</p>')
+            client.process(u'<p>a</p>')
+            client.process(u'<p>%s</p>' % (u'a' * 200))
+
+            self.assertEqual(server.received_codecs, ['zlib', 'identity', 'gzip'])
+            # codecs of the server are unknown before the first response
+            self.assertEqual(server.codec_headers_count, 2)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client.fastpath import FastPath
+
+
+__all__ = ['TestFastPath', ]
+
+
+class TestFastPath(SimpleTestCase):
+    def setUp(self):
+        self.fast_path = FastPath()
+
+    def test_clean_texts(self):
+        for text in (
+            u'plain text',
+            u'<p>text &amp; <b>bold</b><br></p>',
+            u'<ul><li><a href="http://example.com/" title="link">link</a></li></ul>',
+        ):
+            self.assertTrue(self.fast_path.is_clean(text), text)
+
+    def test_texts_for_parser(self):
+        for text in (
+            u'a > b',
+            u'<p>unclosed',
+            u'<p>misnested <b></p></b>',
+            u'<P>upper case</P>',
+            u'<script>alert(1)</script>',
+            u'<p onclick="alert(1)">a</p>',
+            u'<a href="javascript:alert(1)">a</a>',
+            u'<!-- comment -->',
+            u'&copy;',
+        ):
+            self.assertFalse(self.fast_path.is_clean(text), text)
+
+    def test_clean_text_is_not_sent(self):
+        calls = []
+
+        def remote(text):
+            calls.append(text)
+            return text.upper()
+
+        self.assertEqual(self.fast_path.process(u'<p>a</p>', remote), u'<p>a</p>')
+        self.assertEqual(self.fast_path.process(u'a < b', remote), u'A < B')
+        self.assertEqual(calls, [u'a < b'])
+        self.assertEqual(self.fast_path.stats()['avoided_percent'], 50.0)
+
+    def test_mismatches_are_counted_by_verification(self):
+        fast_path = FastPath(verify_rate=1)
+
+        self.assertEqual(fast_path.process(u'<p>a</p>', lambda text: u'<p>b</p>'), u'<p>b</p>')
+        self.assertEqual(fast_path.stats()['mismatched'], 1)
+        self.assertEqual(fast_path.stats()['avoided'], 0)
+
+    def test_verification_is_passed_out_of_call(self):
+        fast_path = FastPath(verify_rate=1)
+        queued = []
+
+        def remote(text):
+            raise AssertionError('verification has to be deferred')
+
+        self.assertEqual(fast_path.process(u'<p>a</p>', remote, verify=queued.append), u'<p>a</p>')
+        self.assertEqual(queued, [u'<p>a</p>'])
+        self.assertEqual(fast_path.stats()['verified'], 0)
+
+        fast_path.record_verified(u'<p>a</p>', u'<p>b</p>')
+        fast_path.record_verified(u'<p>a</p>', u'')
+
+        stats = fast_path.stats()
+        self.assertEqual((stats['calls'], stats['avoided'], stats['verified'], stats['mismatched'], ), (1, 1, 1, 1, ))
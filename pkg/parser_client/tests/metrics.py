@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client.client import ParserClient
+from pkg.parser_client.metrics import InMemoryMetrics
+from pkg.parser_client.stub import ParserStubServer
+
+
+__all__ = ['TestParserMetrics', ]
+
+
+class TestParserMetrics(SimpleTestCase):
+    def setUp(self):
+        self.metrics = InMemoryMetrics()
+
+    def test_phases_and_sizes_are_measured(self):
+        with ParserStubServer() as server:
+            ParserClient(server.url, metrics=self.metrics).process(u'<p>a</p>' * 100)
+
+        dump = self.metrics.dump()
+        for phase in ('serialize', 'compress', 'http', 'decompress', 'parse', ):
+            self.assertEqual(dump['histograms']['parser.time.%s' % phase]['count'], 1, phase)
+
+        self.assertGreater(dump['histograms']['parser.compression_ratio']['min'], 1)
+        self.assertEqual(dump['counters'], {'parser.requests': 1})
+
+    def test_errors_are_counted_by_class(self):
+        ParserClient('http://127.0.0.1:1/', max_retries=0, metrics=self.metrics).process(u'a')
+
+        self.assertEqual(self.metrics.dump()['counters'], {'parser.requests': 1, 'parser.errors.connection': 1})
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client import client as client_module
+from pkg.parser_client.client import ParserClient, get_client
+from pkg.parser_client.stub import ParserStubServer
+
+
+__all__ = ['TestParserPool', ]
+
+
+class TestParserPool(SimpleTestCase):
+    def setUp(self):
+        self.server = ParserStubServer().start()
+        self._getpid = os.getpid
+
+    def tearDown(self):
+        os.getpid = self._getpid
+        self.server.stop()
+
+    def test_connection_is_kept_alive(self):
+        client = ParserClient(self.server.url)
+
+        for i in range(5):
+            self.assertEqual(client.process(u' <p>%d</p> ' % i), u'<p>%d</p>' % i)
+
+        self.assertEqual(self.server.requests_count, 5)
+        self.assertEqual(self.server.connections_count, 1)
+
+    def test_connection_is_closed_without_keep_alive(self):
+        client = ParserClient(self.server.url, keep_alive=False)
+
+        for i in range(3):
+            client.process(u'<p>%d</p>' % i)
+
+        self.assertEqual(self.server.connections_count, 3)
+
+    def test_session_is_rebuilt_after_fork(self):
+        client = ParserClient(self.server.url)
+        session = client.session
+        self.assertIs(client.session, session)
+
+        pid = os.getpid() + 1
+        os.getpid = lambda: pid
+
+        self.assertIsNot(client.session, session)
+
+    def test_client_is_shared_per_server(self):
+        client = get_client(self.server.url)
+
+        self.assertIs(get_client(self.server.url, timeout=1), client)
+        self.assertIsNot(get_client(self.server.url + 'other/'), client)
+
+    def test_child_process_gets_own_clients(self):
+        client = get_client(self.server.url)
+
+        pid = os.getpid() + 1
+        os.getpid = lambda: pid
+
+        self.assertIsNot(get_client(self.server.url), client)
+        self.assertIs(client_module._clients[self.server.url], get_client(self.server.url))
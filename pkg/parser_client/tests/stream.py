@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from django.test import SimpleTestCase
+
+from pkg.parser_client.client import ParserClient
+from pkg.parser_client.stub import ParserStubServer
+
+
+__all__ = ['TestParserStreaming', ]
+
+
+class TestParserStreaming(SimpleTestCase):
+    def setUp(self):
+        self.server = ParserStubServer(parse=lambda html: html.upper()).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_large_text_is_streamed(self):
+        client = ParserClient(self.server.url, stream_threshold=1000)
+        text = u'<p>заметка "%d"</p>\n' * 10000
+
+        self.assertEqual(client.process(text), text.upper())
+        self.assertEqual(client.process(u'<p>a</p>'), u'<P>A</P>')
+        self.assertEqual(self.server.chunked_requests_count, 1)
+
+    def test_streaming_is_disabled_by_default(self):
+        client = ParserClient(self.server.url)
+
+        client.process(u'a' * 100000)
+        self.assertEqual(self.server.chunked_requests_count, 0)
@@ -1,11 +1,27 @@
 # -*- coding: utf-8 -*-
 
+from django.db.models.signals import post_save, post_delete
 from django.dispatch.dispatcher import receiver
 
 from pkg.notes.models import note_pre_size_change
-from models import QuotaValidator
+from models import QuotaValidator, UsersPremium, UsersPremiumLimits, premium_resolver
+from cache import limits_cache
 
 
 @receiver(note_pre_size_change)
 def _validate_quota(sender, instance, prev_size, new_size, **kwargs):
     QuotaValidator(instance, prev_size, new_size).validate()
+
+
+@receiver(post_save, sender=UsersPremium)
+@receiver(post_delete, sender=UsersPremium)
+@receiver(post_save, sender=UsersPremiumLimits)
+@receiver(post_delete, sender=UsersPremiumLimits)
+def _invalidate_limits_cache(sender, instance, **kwargs):
+    limits_cache.delete(instance.user_id)
+
+
+@receiver(post_save, sender=UsersPremium)
+@receiver(post_delete, sender=UsersPremium)
+def _invalidate_premium_status(sender, instance, **kwargs):
+    premium_resolver.invalidate(instance.user_id)
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import time
+import uuid
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from pkg.utils.lru import ExpiringLRUCache
+
+
+__all__ = ['ExpiringLRUCache', 'VersionedLRUCache', 'limits_cache', 'premium_cache', ]
+
+
+class VersionedLRUCache(object):
+    """
+    Process-local LRU cache, whose entries are invalidated in all processes by version stamps in the shared cache.
+
+    Version stamp of entry is checked not more often than once per check_interval seconds, so the shared cache
+    is touched once per interval for each used entry. Stamps are unique, so expired stamp is never taken
+    for the stamp of a cached entry. Interface is the same as of ExpiringLRUCache
+    """
+    # stamps of misses, which are not followed by set(), are dropped beyond this count
+    LOADING_MAX_SIZE = 1000
+
+    __slots__ = ('__name', '__local', '__check_interval', '__version_timeout', '__loading', )
+
+    def __init__(self, name, max_size=10000, ttl=3600, check_interval=10):
+        """
+        :param string name: name of the cache, prefix of version stamps in the shared cache
+        :param int max_size: max count of cached entries
+        :param int ttl: default time to live of entry, in seconds. 0 - entries expires only by eviction
+        :param int check_interval: how often version stamp of entry is checked, in seconds
+        """
+        self.__name = name
+        self.__local = ExpiringLRUCache(max_size, ttl)
+        self.__check_interval = check_interval
+        # stamp has to outlive entries of its version, otherwise they are reloaded needlessly
+        self.__version_timeout = ttl or None
+        self.__loading = threading.local()
+
+    def _get_version_key(self, key):
+        return 'quota:%s:version:%s' % (self.__name, key, )
+
+    def _get_version(self, key):
+        return cache.get(self._get_version_key(key))
+
+    def _get_loading(self):
+        """
+        :return dict: key => version stamp read by the current thread before loading of the value
+        """
+        if not hasattr(self.__loading, 'versions'):
+            self.__loading.versions = {}
+
+        return self.__loading.versions
+
+    def get(self, key, default=None):
+        """
+        Returns cached value or default one if entry is missing, expired or changed by any process
+
+        :param key: hashable key
+        :param default: fallback value
+        """
+        entry = self.__local.get(key)
+        now = time.time()
+
+        if entry is not None:
+            value, version, checked_at = entry
+            if now - checked_at < self.__check_interval:
+                return value
+
+            if self._get_version(key) == version:
+                entry[2] = now
+                return value
+
+            self.__local.delete(key)
+
+        loading = self._get_loading()
+        if len(loading) >= self.LOADING_MAX_SIZE:
+            loading.clear()
+
+        # stamp is read before the value is loaded, so the value loaded before its change is not stored as newer one
+        loading[key] = self._get_version(key)
+
+        return default
+
+    def set(self, key, value, expires_at=None):
+        """
+        Store value, e.g. loaded after get() has missed
+
+        :param key: hashable key
+        :param value: value to store
+        :param float expires_at: unix timestamp, when entry has to be expired
+        """
+        loading = self._get_loading()
+        version = loading.pop(key) if key in loading else self._get_version(key)
+
+        self.__local.set(key, [value, version, time.time()], expires_at)
+
+    def delete(self, key):
+        """
+        Invalidate entry in all processes
+        """
+        cache.set(self._get_version_key(key), uuid.uuid4().hex, self.__version_timeout)
+        self.__local.delete(key)
+
+    def clear(self):
+        """
+        Drop entries of the current process
+        """
+        self.__local.clear()
+
+
+limits_cache = VersionedLRUCache(
+    'limits',
+    max_size=getattr(settings, 'QUOTA_LIMITS_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'QUOTA_LIMITS_CACHE_TTL', 3600),
+    check_interval=getattr(settings, 'QUOTA_LIMITS_CHECK_INTERVAL', 10),
+)
+
+premium_cache = VersionedLRUCache(
+    'premium',
+    max_size=getattr(settings, 'QUOTA_PREMIUM_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'QUOTA_LIMITS_CACHE_TTL', 3600),
+    check_interval=getattr(settings, 'QUOTA_LIMITS_CHECK_INTERVAL', 10),
+)
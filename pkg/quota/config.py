@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from pkg.utils.models import NNConfig
+
+
+__all__ = ['QuotaConfigSnapshot', 'quota_config', ]
+
+
+QuotaConfigSnapshot = namedtuple('QuotaConfigSnapshot', (
+    'version', 'note_max_size', 'total_max_size', 'attachments_max_size', 'attachments_premium_max_size',
+))
+
+
+class QuotaConfigHolder(object):
+    """
+    Keeps immutable snapshot of quota config, loaded once per process.
+
+    Changes made by other processes are detected by version stamp in the shared cache, which is checked
+    not more often than once per QUOTA_CONFIG_CHECK_INTERVAL seconds. So the config storage is touched
+    only when the config has really been changed.
+    """
+    VERSION_KEY = 'quota:config:version'
+
+    __slots__ = ('__snapshot', '__checked_at', '__check_interval', '__lock', )
+
+    def __init__(self, check_interval=10):
+        """
+        :param int check_interval: how often version stamp is checked, in seconds
+        """
+        self.__snapshot = None
+        self.__checked_at = 0
+        self.__check_interval = check_interval
+        self.__lock = threading.Lock()
+
+    def _get_version(self):
+        return cache.get(self.VERSION_KEY) or 0
+
+    def _load(self, version):
+        config = NNConfig()
+
+        return QuotaConfigSnapshot(
+            version=version,
+            note_max_size=int(config.NOTES_MAX_SIZE),
+            total_max_size=int(config.NOTES_MONTH_USAGE_QUOTA),
+            attachments_max_size=int(config.NOTES_MAX_ATTACHMENT_SIZE),
+            attachments_premium_max_size=int(config.NOTES_MAX_ATTACHMENT_SIZE_PREMIUM_DEFAULT),
+        )
+
+    def get(self):
+        """
+        :rtype QuotaConfigSnapshot:
+        """
+        snapshot = self.__snapshot
+        now = time.time()
+
+        if snapshot is not None and now - self.__checked_at < self.__check_interval:
+            return snapshot
+
+        with self.__lock:
+            version = self._get_version()
+            if self.__snapshot is None or self.__snapshot.version != version:
+                self.__snapshot = self._load(version)
+
+            self.__checked_at = now
+
+            return self.__snapshot
+
+    def bump(self):
+        """
+        Notify all processes that config has been changed
+        """
+        if not cache.add(self.VERSION_KEY, 1):
+            cache.incr(self.VERSION_KEY)
+
+        with self.__lock:
+            self.__snapshot = None
+
+
+quota_config = QuotaConfigHolder(getattr(settings, 'QUOTA_CONFIG_CHECK_INTERVAL', 10))
@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+
+from pkg.RedisSession import RSession
+from pkg.utils.transactions import on_rollback
+from models import NotesQuotaUsage, get_current_period
+
+
+__all__ = ['DatabaseQuotaCounter', 'RedisQuotaCounter', 'QuotaCounterError', 'get_quota_counter', ]
+
+
+class QuotaCounterError(Exception):
+    """
+    Counter can't be used right now, e.g. it's not seeded or it waits for flush too long
+    """
+    pass
+
+
+class DatabaseQuotaCounter(object):
+    """
+    Keeps usage of users in NotesQuotaUsage table, one record per user and billing period
+    """
+
+    def get_usage(self, user_id, period=None):
+        """
+        :param int user_id: user's id
+        :param date period: billing period. Current one by default
+
+        :return int: usage in the period, in bytes
+        """
+        period = period or get_current_period()
+        return NotesQuotaUsage.objects.get_or_create(user_id=user_id, period=period)[0].usage
+
+    def increment(self, user_id, size, max_usage=None, period=None):
+        """
+        Atomically increase usage of user
+
+        :param int user_id: user's id
+        :param int size: delta of usage, in bytes. Could be negative
+        :param int max_usage: upper bound of usage after increment. Ignored for negative size
+        :param date period: billing period. Current one by default
+
+        :return bool: False if usage would exceed the max_usage
+        """
+        return NotesQuotaUsage.objects.increment(user_id, size, max_usage, period=period or get_current_period())
+
+    def flush(self):
+        """
+        Nothing to flush, all changes are written immediately
+
+        :return int: count of flushed users
+        """
+        return 0
+
+    def get_pending(self, user_ids, period=None):
+        """
+        Deltas of usage, which are not written to DB yet. All changes are written immediately here
+
+        :param list user_ids: ids of users
+        :param date period: billing period. Current one by default
+
+        :return dict: user_id => delta, in bytes. Users without pending deltas are omitted
+        """
+        return {}
+
+    def reset(self, user_ids, period=None):
+        """
+        Forget cached usage of users, e.g. after it's corrected in DB. DB is the only storage here
+
+        :param list user_ids: ids of users
+        :param date period: billing period. Current one by default
+        """
+        pass
+
+
+class RedisQuotaCounter(DatabaseQuotaCounter):
+    """
+    Keeps usage of users in Redis and periodically writes aggregated deltas back to NotesQuotaUsage.
+
+    Redis is the source of truth for all users it has counters for. Deltas which are not written to DB yet
+    are accumulated in the DELTAS_KEY hash, its fields are "<period>:<user_id>". Flush renames that hash
+    to FLUSHING_KEY, applies it and deletes it, so if flush crashes in the middle, the next one finds
+    FLUSHING_KEY and reconciles affected users. Both steps increase FLUSH_EPOCH_KEY, so counters are not seeded
+    from DB while it's unknown whether the flushing deltas are written to it.
+    """
+
+    KEY_PREFIX = 'quota:usage:'
+    DELTAS_KEY = 'quota:deltas'
+    FLUSHING_KEY = 'quota:deltas:flushing'
+    FLUSH_EPOCH_KEY = 'quota:flush:epoch'
+    LOCK_KEY = 'quota:flush:lock'
+    LOCK_TIMEOUT = 300
+    # reset waits for running flush not longer than that, in seconds
+    RESET_LOCK_TIMEOUT = 5
+    # seed waits for running flush not longer than SEED_ATTEMPTS * SEED_RETRY_DELAY seconds
+    SEED_ATTEMPTS = 20
+    SEED_RETRY_DELAY = 0.05
+    # counters of past periods are kept for a while for late flushes and reconciliation
+    COUNTER_TIMEOUT = 60 * 60 * 24 * 62
+
+    # KEYS: usage counter, deltas; ARGV: size, max usage (negative - unlimited), deltas field
+    INCREMENT_SCRIPT = """
+        local usage = redis.call('GET', KEYS[1])
+        if not usage then
+            return nil
+        end
+
+        local size = tonumber(ARGV[1])
+        local max_usage = tonumber(ARGV[2])
+
+        if size > 0 and max_usage >= 0 and tonumber(usage) + size > max_usage then
+            return 0
+        end
+
+        redis.call('INCRBY', KEYS[1], size)
+        redis.call('HINCRBY', KEYS[2], ARGV[3], size)
+
+        return 1
+    """
+
+    # KEYS: deltas, flushing deltas; ARGV: counter key prefix
+    RECONCILE_SCRIPT = """
+        local result = {}
+        local fields = redis.call('HKEYS', KEYS[2])
+
+        for _, field in ipairs(fields) do
+            local usage = redis.call('GET', ARGV[1] .. field)
+            if usage then
+                local pending = redis.call('HGET', KEYS[1], field) or '0'
+                table.insert(result, field)
+                table.insert(result, tonumber(usage) - tonumber(pending))
+            end
+        end
+
+        return result
+    """
+
+    # KEYS: lock; ARGV: token
+    RELEASE_LOCK_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+
+        return 0
+    """
+
+    def __init__(self, connection=None):
+        """
+        :param redis.StrictRedis connection: connection to redis. Connection of sessions by default
+        """
+        self.__connection = connection
+        self.__scripts = {}
+
+    @property
+    def connection(self):
+        if self.__connection is None:
+            self.__connection = RSession.connection
+
+        return self.__connection
+
+    def _get_script(self, script):
+        if script not in self.__scripts:
+            self.__scripts[script] = self.connection.register_script(script)
+
+        return self.__scripts[script]
+
+    def _get_field(self, user_id, period):
+        return '%s:%s' % (period.strftime('%Y%m%d'), user_id)
+
+    def _parse_field(self, field):
+        """
+        :return tuple: (user_id, period)
+        """
+        period, user_id = (field.decode() if isinstance(field, bytes) else field).split(':')
+        return int(user_id), datetime.strptime(period, '%Y%m%d').date()
+
+    def _get_key(self, user_id, period):
+        return self.KEY_PREFIX + self._get_field(user_id, period)
+
+    def _read_pending(self, field):
+        """
+        :return tuple: (flush epoch, whether flush is running, deltas of field which are not written to DB yet)
+        """
+        pipe = self.connection.pipeline()
+        pipe.get(self.FLUSH_EPOCH_KEY)
+        pipe.exists(self.LOCK_KEY)
+        pipe.hget(self.DELTAS_KEY, field)
+        pipe.hget(self.FLUSHING_KEY, field)
+        epoch, flushing, pending, flushing_pending = pipe.execute()
+
+        # deltas of crashed flush are unknown to be written, they are taken as not written, @see reconcile
+        return epoch, bool(flushing and flushing_pending is not None), int(pending or 0) + int(flushing_pending or 0)
+
+    def _seed(self, user_id, period):
+        """
+        Initialize redis counter of user from DB. Deltas which are not written to DB yet are taken into account.
+        DB and deltas are read again, if flush has moved deltas meanwhile
+
+        :raise: QuotaCounterError if flush of the user's deltas does not finish in time
+        """
+        field = self._get_field(user_id, period)
+
+        for attempt in range(self.SEED_ATTEMPTS):
+            epoch = self.connection.get(self.FLUSH_EPOCH_KEY)
+            usage = super(RedisQuotaCounter, self).get_usage(user_id, period)
+            current_epoch, flushing, pending = self._read_pending(field)
+
+            if current_epoch == epoch and not flushing:
+                break
+
+            time.sleep(self.SEED_RETRY_DELAY)
+        else:
+            raise QuotaCounterError('Counter of user %s is not seeded, flush is in progress' % user_id)
+
+        key = self._get_key(user_id, period)
+        if self.connection.setnx(key, usage + pending):
+            self.connection.expire(key, self.COUNTER_TIMEOUT)
+
+    def get_usage(self, user_id, period=None):
+        period = period or get_current_period()
+        key = self._get_key(user_id, period)
+        usage = self.connection.get(key)
+
+        if usage is None:
+            self._seed(user_id, period)
+            usage = self.connection.get(key)
+
+        return int(usage)
+
+    def increment(self, user_id, size, max_usage=None, period=None):
+        period = period or get_current_period()
+        script = self._get_script(self.INCREMENT_SCRIPT)
+        keys = [self._get_key(user_id, period), self.DELTAS_KEY]
+        args = [int(size), -1 if max_usage is None else int(max_usage), self._get_field(user_id, period)]
+
+        result = script(keys=keys, args=args)
+        if result is None:
+            self._seed(user_id, period)
+            result = script(keys=keys, args=args)
+
+        # counter has expired or has been reset right after seed
+        if result is None:
+            raise QuotaCounterError('Counter of user %s is missing' % user_id)
+
+        if result and size:
+            # redis is not rolled back with the batch of actions, @see batch_transaction
+            on_rollback(lambda: self.increment(user_id, -size, period=period))
+
+        return bool(result)
+
+    def _group_by_period(self, values):
+        """
+        :param dict values: deltas field => value
+
+        :return dict: period => {user_id: value}
+        """
+        result = {}
+        for field, value in values.items():
+            user_id, period = self._parse_field(field)
+            result.setdefault(period, {})[user_id] = int(value)
+
+        return result
+
+    def _acquire_lock(self):
+        token = uuid.uuid4().hex
+
+        if self.connection.set(self.LOCK_KEY, token, nx=True, ex=self.LOCK_TIMEOUT):
+            return token
+
+        return None
+
+    def _release_lock(self, token):
+        self._get_script(self.RELEASE_LOCK_SCRIPT)(keys=[self.LOCK_KEY], args=[token])
+
+    def get_pending(self, user_ids, period=None):
+        if not user_ids:
+            return {}
+
+        period = period or get_current_period()
+        fields = [self._get_field(user_id, period) for user_id in user_ids]
+        pending = {}
+
+        for key in (self.DELTAS_KEY, self.FLUSHING_KEY):
+            for user_id, delta in zip(user_ids, self.connection.hmget(key, fields)):
+                if delta is not None:
+                    pending[user_id] = pending.get(user_id, 0) + int(delta)
+
+        return pending
+
+    def reset(self, user_ids, period=None):
+        """
+        Drop counters of users, whose usage is corrected in DB. Counters are seeded from DB and pending deltas again
+        on next use. It waits for running flush, so crashed one is reconciled with the counters, @see reconcile
+
+        :param list user_ids: ids of users
+        :param date period: billing period. Current one by default
+
+        :raise: QuotaCounterError if flush does not finish in RESET_LOCK_TIMEOUT seconds
+        """
+        if not user_ids:
+            return
+
+        period = period or get_current_period()
+        started = time.time()
+
+        token = self._acquire_lock()
+        while token is None and time.time() - started < self.RESET_LOCK_TIMEOUT:
+            time.sleep(0.1)
+            token = self._acquire_lock()
+
+        if token is None:
+            raise QuotaCounterError('Counters are not reset, flush is in progress')
+
+        try:
+            self.connection.delete(*[self._get_key(user_id, period) for user_id in user_ids])
+        finally:
+            self._release_lock(token)
+
+    def _finish_flushing(self):
+        pipe = self.connection.pipeline()
+        pipe.delete(self.FLUSHING_KEY)
+        pipe.incr(self.FLUSH_EPOCH_KEY)
+        pipe.execute()
+
+    def reconcile(self):
+        """
+        Recover after crashed flush. It's unknown whether the deltas of FLUSHING_KEY have been written to DB,
+        so the usage of affected users is written as absolute value: redis counter minus deltas which are still pending
+
+        :return int: count of reconciled users
+        """
+        if not self.connection.exists(self.FLUSHING_KEY):
+            return 0
+
+        script = self._get_script(self.RECONCILE_SCRIPT)
+        result = script(keys=[self.DELTAS_KEY, self.FLUSHING_KEY], args=[self.KEY_PREFIX])
+        usages = self._group_by_period(dict(zip(result[::2], result[1::2])))
+
+        for period, period_usages in usages.items():
+            NotesQuotaUsage.objects.bulk_set(period_usages, period=period)
+
+        self._finish_flushing()
+
+        return sum(len(period_usages) for period_usages in usages.values())
+
+    def flush(self):
+        """
+        Write accumulated deltas to DB
+
+        :return int: count of flushed users. None if another flush is in progress
+        """
+        token = self._acquire_lock()
+        if token is None:
+            return None
+
+        try:
+            flushed = self.reconcile()
+
+            if not self.connection.exists(self.DELTAS_KEY):
+                return flushed
+
+            pipe = self.connection.pipeline()
+            pipe.rename(self.DELTAS_KEY, self.FLUSHING_KEY)
+            pipe.incr(self.FLUSH_EPOCH_KEY)
+            pipe.execute()
+
+            deltas = self._group_by_period(self.connection.hgetall(self.FLUSHING_KEY))
+
+            for period, period_deltas in deltas.items():
+                NotesQuotaUsage.objects.bulk_increment(
+                    dict((user_id, delta) for user_id, delta in period_deltas.items() if delta),
+                    period=period
+                )
+
+            self._finish_flushing()
+
+            return flushed + sum(len(period_deltas) for period_deltas in deltas.values())
+        finally:
+            self._release_lock(token)
+
+
+_counters = {}
+
+
+def get_quota_counter():
+    """
+    Returns counter backend set by QUOTA_COUNTER_BACKEND setting: 'db' (default) or 'redis'
+
+    :return DatabaseQuotaCounter:
+    """
+    backend = getattr(settings, 'QUOTA_COUNTER_BACKEND', 'db')
+
+    if backend not in _counters:
+        _counters[backend] = RedisQuotaCounter() if backend == 'redis' else DatabaseQuotaCounter()
+
+    return _counters[backend]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+from optparse import make_option
+
+from django.db import router, transaction
+from django.core.management.base import BaseCommand
+
+from pkg.quota.models import NotesQuotaUsage, NotesQuotaUsageArchive, get_current_period
+
+
+class Command(BaseCommand):
+    help = 'Move usage records of past billing periods to the archive'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--keep-periods', dest='keep_periods', type='int', default=3,
+                    help='Count of the latest billing periods (including current one) which stay in place'),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=1000,
+                    help='Count of records moved by one transaction'),
+    )
+
+    def handle(self, *args, **options):
+        cutoff = get_current_period()
+        for _ in range(max(options['keep_periods'], 1) - 1):
+            cutoff = get_current_period(cutoff - timedelta(days=1))
+
+        using = router.db_for_write(NotesQuotaUsage)
+        queryset = NotesQuotaUsage.objects.filter(period__lt=cutoff)
+        last_id = 0
+        archived = 0
+
+        # small chunks keep locks short, so the command could be run at peak time
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+
+            last_id = ids[-1]
+            with transaction.commit_on_success(using=using):
+                chunk = queryset.filter(id__in=ids)
+                NotesQuotaUsageArchive.objects.bulk_create([
+                    NotesQuotaUsageArchive(user_id=user_id, period=period, usage=usage)
+                    for user_id, period, usage in chunk.values_list('user_id', 'period', 'usage')
+                ])
+                chunk.delete()
+
+            archived += len(ids)
+
+        self.stdout.write('Archived %d usage records older than %s\n' % (archived, cutoff))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from pkg.quota.counters import get_quota_counter
+
+
+class Command(BaseCommand):
+    help = 'Write usage deltas accumulated by the quota counter backend to NotesQuotaUsage'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', dest='interval', type='int', default=0,
+                    help='Repeat flush every INTERVAL seconds. Flush once by default'),
+    )
+
+    def handle(self, *args, **options):
+        counter = get_quota_counter()
+        interval = options['interval']
+
+        while True:
+            flushed = counter.flush()
+            if flushed is None:
+                self.stdout.write('Another flush is in progress\n')
+            else:
+                self.stdout.write('Flushed usage of %d users\n' % flushed)
+
+            if interval <= 0:
+                break
+
+            time.sleep(interval)
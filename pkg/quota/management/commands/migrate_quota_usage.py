@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from pkg.quota.models import NotesQuota, NotesQuotaUsage, get_current_period
+
+
+class Command(BaseCommand):
+    help = 'Copy usage of legacy NotesQuota counters into NotesQuotaUsage records of the current billing period'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int', default=1000,
+                    help='Count of users processed at once'),
+    )
+
+    def handle(self, *args, **options):
+        period = get_current_period()
+        chunk_size = options['chunk_size']
+        last_id = 0
+        migrated = 0
+
+        while True:
+            chunk = list(
+                NotesQuota.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'user_id', 'usage')[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            last_id = chunk[-1][0]
+            existing = set(NotesQuotaUsage.objects.filter(
+                period=period,
+                user_id__in=[user_id for _, user_id, _ in chunk]
+            ).values_list('user_id', flat=True))
+
+            records = [
+                NotesQuotaUsage(user_id=user_id, period=period, usage=usage)
+                for _, user_id, usage in chunk if user_id not in existing
+            ]
+            NotesQuotaUsage.objects.bulk_create(records)
+            migrated += len(records)
+
+        self.stdout.write('Migrated usage of %d users\n' % migrated)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from datetime import timedelta
+from multiprocessing import Pool
+from optparse import make_option
+
+from django.db import connections, router
+from django.db.models import Min, Max, Sum
+from django.core.management.base import BaseCommand
+
+from pkg.notes.models import NotesNotes, NotesUsers, NotesAttachements
+from pkg.quota.models import NotesQuotaUsage, QuotaReservation, get_current_period
+from pkg.quota.counters import get_quota_counter
+from pkg.utils.transactions import commit_on_success
+
+
+class UsageReconciler(object):
+    """
+    Recalculates usage of users in the range of ids in the current billing period from notes and attachments
+    created in the period and bytes reserved in it. Growth of notes created before the period is not stored
+    anywhere, so the recalculated usage is the lower bound of the real one: usage is only raised to it, never lowered.
+
+    Users are walked by keyset pagination, sizes are summed by DB, corrections are added to usage by bulk update.
+    Usage records of the chunk are locked meanwhile, so concurrent increments wait and are not lost. Deltas pending
+    in cached counters are part of usage, cached counters of corrected users are reset, @see RedisQuotaCounter.reset
+    """
+    NOTE_USER_FIELD = 'user_id'
+    NOTE_SIZE_FIELD = 'size'
+    NOTE_CREATED_FIELD = 'created'
+    ATTACHMENT_USER_FIELD = 'user_id'
+    ATTACHMENT_SIZE_FIELD = 'size'
+    ATTACHMENT_CREATED_FIELD = 'created'
+
+    def __init__(self, first_id, last_id, chunk_size=1000, checkpoint=None, dry_run=False):
+        """
+        :param int first_id: first user's id of the range
+        :param int last_id: last user's id of the range (inclusive)
+        :param int chunk_size: count of users processed at once
+        :param string checkpoint: path to file with id of the last processed user. Processing is resumed from it
+        :param bool dry_run: count corrections without writing them
+        """
+        self.first_id = first_id
+        self.last_id = last_id
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        self.period = get_current_period()
+        self.next_period = get_current_period(self.period + timedelta(days=31))
+
+    def _load_checkpoint(self):
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return self.first_id - 1
+
+        with open(self.checkpoint) as checkpoint:
+            return json.load(checkpoint)['last_user_id']
+
+    def _save_checkpoint(self, user_id):
+        if not self.checkpoint:
+            return
+
+        tmp_name = self.checkpoint + '.tmp'
+        with open(tmp_name, 'w') as checkpoint:
+            json.dump({'last_user_id': user_id}, checkpoint)
+
+        os.rename(tmp_name, self.checkpoint)
+
+    def _get_sizes(self, model, user_field, size_field, created_field, user_ids):
+        """
+        :return dict: user_id => sum of sizes of items created in the period
+        """
+        queryset = model.objects.filter(**{
+            '%s__in' % user_field: user_ids,
+            '%s__gte' % created_field: self.period,
+            '%s__lt' % created_field: self.next_period,
+        }).values(user_field).annotate(total_size=Sum(size_field)).order_by()
+
+        return dict((item[user_field], item['total_size'] or 0) for item in queryset.iterator())
+
+    def _get_reserved(self, user_ids):
+        """
+        :return dict: user_id => bytes reserved in the period and not released yet, @see QuotaReserver
+        """
+        queryset = QuotaReservation.objects.filter(
+            user_id__in=user_ids, period=self.period, released=False,
+        ).values('user_id').annotate(total_size=Sum('size')).order_by()
+
+        return dict((item['user_id'], item['total_size'] or 0) for item in queryset.iterator())
+
+    def _reconcile_chunk(self, user_ids):
+        """
+        :return int: count of corrected users
+        """
+        counter = get_quota_counter()
+
+        with commit_on_success(using=router.db_for_write(NotesQuotaUsage)):
+            current = dict(
+                NotesQuotaUsage.objects.select_for_update()
+                .filter(user_id__in=user_ids, period=self.period).values_list('user_id', 'usage')
+            )
+            for user_id, delta in counter.get_pending(list(current), self.period).items():
+                current[user_id] += delta
+
+            usages = self._get_reserved(user_ids)
+            for model, user_field, size_field, created_field in (
+                (NotesNotes, self.NOTE_USER_FIELD, self.NOTE_SIZE_FIELD, self.NOTE_CREATED_FIELD),
+                (
+                    NotesAttachements, self.ATTACHMENT_USER_FIELD, self.ATTACHMENT_SIZE_FIELD,
+                    self.ATTACHMENT_CREATED_FIELD,
+                ),
+            ):
+                for user_id, size in self._get_sizes(model, user_field, size_field, created_field, user_ids).items():
+                    usages[user_id] = usages.get(user_id, 0) + size
+
+            corrections = dict(
+                (user_id, usage - current[user_id])
+                for user_id, usage in usages.items() if user_id in current and usage > current[user_id]
+            )
+            missing = dict((user_id, usage) for user_id, usage in usages.items() if user_id not in current and usage)
+
+            if self.dry_run:
+                return len(corrections) + len(missing)
+
+            NotesQuotaUsage.objects.bulk_increment(corrections, period=self.period)
+
+            for user_id, usage in list(missing.items()):
+                # record created meanwhile has been accounted by increments, it's corrected by the next run
+                if not NotesQuotaUsage.objects.get_or_create(
+                    user_id=user_id, period=self.period, defaults={'usage': usage},
+                )[1]:
+                    del missing[user_id]
+
+        # otherwise redis counters keep the usage before correction
+        counter.reset(list(corrections) + list(missing), self.period)
+
+        return len(corrections) + len(missing)
+
+    def run(self):
+        """
+        :return int: count of corrected users
+        """
+        last_user_id = self._load_checkpoint()
+        corrected = 0
+
+        # crashed flush is reconciled with redis counters, which are reset here
+        get_quota_counter().flush()
+
+        while True:
+            user_ids = list(
+                NotesUsers.objects.filter(id__gt=last_user_id, id__lte=self.last_id)
+                .order_by('id').values_list('id', flat=True)[:self.chunk_size]
+            )
+            if not user_ids:
+                break
+
+            corrected += self._reconcile_chunk(user_ids)
+            last_user_id = user_ids[-1]
+            self._save_checkpoint(last_user_id)
+
+        return corrected
+
+
+def _reconcile_range(params):
+    # connections inherited from parent process must not be shared
+    for connection in connections.all():
+        connection.close()
+
+    return UsageReconciler(**params).run()
+
+
+class Command(BaseCommand):
+    help = 'Raise usage of the current billing period to the sum of notes and attachments created in it'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int', default=1000,
+                    help='Count of users processed at once'),
+        make_option('--workers', dest='workers', type='int', default=1,
+                    help='Count of processes. Range of users is split between them'),
+        make_option('--first-id', dest='first_id', type='int', default=None,
+                    help='First user\'s id of the range. The lowest one by default'),
+        make_option('--last-id', dest='last_id', type='int', default=None,
+                    help='Last user\'s id of the range. The highest one by default'),
+        make_option('--checkpoint', dest='checkpoint', default=None,
+                    help='Prefix of checkpoint files. Interrupted run is resumed from them '
+                         '(with the same range of users and count of workers)'),
+        make_option('--dry-run', dest='dry_run', action='store_true', default=False,
+                    help='Count corrections without writing them'),
+    )
+
+    def _split_range(self, first_id, last_id, parts):
+        step = max((last_id - first_id + 1) // parts, 1)
+        bounds = list(range(first_id, last_id + 1, step)) + [last_id + 1]
+
+        if len(bounds) > parts + 1:
+            bounds = bounds[:parts] + [last_id + 1]
+
+        return [(bounds[i], bounds[i + 1] - 1, ) for i in range(len(bounds) - 1)]
+
+    def handle(self, *args, **options):
+        bounds = NotesUsers.objects.aggregate(first_id=Min('id'), last_id=Max('id'))
+        first_id = options['first_id'] if options['first_id'] is not None else bounds['first_id']
+        last_id = options['last_id'] if options['last_id'] is not None else bounds['last_id']
+
+        if first_id is None or last_id is None:
+            return
+
+        workers = max(options['workers'], 1)
+        tasks = [
+            {
+                'first_id': range_first_id,
+                'last_id': range_last_id,
+                'chunk_size': options['chunk_size'],
+                'checkpoint': '%s.%d-%d' % (options['checkpoint'], range_first_id, range_last_id)
+                if options['checkpoint'] else None,
+                'dry_run': options['dry_run'],
+            }
+            for range_first_id, range_last_id in self._split_range(first_id, last_id, workers)
+        ]
+
+        if workers == 1:
+            corrected = sum(UsageReconciler(**task).run() for task in tasks)
+        else:
+            for connection in connections.all():
+                connection.close()
+
+            pool = Pool(processes=workers)
+            try:
+                corrected = sum(pool.map(_reconcile_range, tasks))
+            finally:
+                pool.close()
+                pool.join()
+
+        self.stdout.write('Corrected usage of %d users\n' % corrected)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+
+from pkg.quota.reservations import QuotaReserver
+
+
+class Command(BaseCommand):
+    help = 'Give bytes of expired upload reservations back to users'
+
+    def handle(self, *args, **options):
+        total = 0
+
+        while True:
+            released = QuotaReserver.release_expired()
+            if not released:
+                break
+
+            total += released
+
+        self.stdout.write('Released %d expired reservations\n' % total)
@@ -1,23 +1,160 @@
 # -*- coding: utf-8 -*-
 
-from django.db import models
+import time
+from datetime import date, timedelta
+
+from django.db import models, connections, router
 
 from pkg.utils import errors
+from pkg.utils.transactions import commit_on_success
 from pkg.utils.models import NNConfig
 from pkg.notes.models import NotesNotes, NotesUsers, NotesAttachements
 from pkg.utils.filetools import HumanizeSize as sizeformat
 from pkg.notes.utils import build_notes_pk
+from cache import limits_cache, premium_cache
+from config import quota_config
+
+
+def get_current_period(today=None):
+    """
+    Returns billing period of usage (first day of month)
+
+    :param date today: date inside the period. Current date by default
+
+    :rtype date:
+    """
+    today = today or date.today()
+    return date(today.year, today.month, 1)
+
+
+class NotesQuotaManager(models.Manager):
+    BULK_CHUNK_SIZE = 500
+
+    def increment(self, user_id, size, max_usage=None, **lookup):
+        """
+        Atomically increase usage of user by one conditional UPDATE
+
+        :param int user_id: user's id
+        :param int size: delta of usage, in bytes. Could be negative
+        :param int max_usage: upper bound of usage after increment. Ignored for negative size
+        :param dict lookup: additional conditions of the updated record, e.g. period
+
+        :return bool: False if usage would exceed the max_usage (or quota record does not exist)
+        """
+        queryset = self.filter(user_id=user_id, **lookup)
+
+        if max_usage is not None and size > 0:
+            queryset = queryset.filter(usage__lte=max_usage - size)
+
+        return bool(queryset.update(usage=models.F('usage') + size))
+
+    def _bulk_update_usage(self, values, relative, lookup):
+        """
+        Update usage of many users by single UPDATE per chunk of users
+
+        :param dict values: user_id => usage (or delta of usage if relative)
+        :param bool relative: if True values are added to current usage, otherwise replace it
+        :param dict lookup: additional conditions (column => value) of the updated records
+        """
+        using = router.db_for_write(self.model)
+        qn = connections[using].ops.quote_name
+        items = sorted(values.items())
+        lookup = sorted(lookup.items())
+
+        with commit_on_success(using=using):
+            cursor = connections[using].cursor()
+
+            for offset in range(0, len(items), self.BULK_CHUNK_SIZE):
+                chunk = items[offset:offset + self.BULK_CHUNK_SIZE]
+                case = 'CASE %s %s END' % (qn('user_id'), ' '.join(['WHEN %s THEN %s'] * len(chunk)))
+                sql = 'UPDATE %s SET %s = %s WHERE %s IN (%s)%s' % (
+                    qn(self.model._meta.db_table),
+                    qn('usage'),
+                    ' + '.join((qn('usage'), case, )) if relative else case,
+                    qn('user_id'),
+                    ', '.join(['%s'] * len(chunk)),
+                    ''.join(' AND %s = %%s' % qn(column) for column, _ in lookup),
+                )
+                params = [int(item) for pair in chunk for item in pair] + [int(user_id) for user_id, _ in chunk]
+                params += [value for _, value in lookup]
+
+                cursor.execute(sql, params)
+
+    def bulk_increment(self, deltas, **lookup):
+        """
+        :param dict deltas: user_id => delta of usage
+        :param dict lookup: additional conditions of the updated records, e.g. period
+        """
+        self._bulk_update_usage(deltas, True, lookup)
+
+    def bulk_set(self, usages, **lookup):
+        """
+        :param dict usages: user_id => new usage
+        :param dict lookup: additional conditions of the updated records, e.g. period
+        """
+        self._bulk_update_usage(usages, False, lookup)
 
 
 class NotesQuota(models.Model):
+    """
+    Legacy single counter of usage. Superseded by NotesQuotaUsage, @see migrate_quota_usage command
+    """
     id = models.AutoField(primary_key=True)
     user_id = models.IntegerField(unique=True)
     usage = models.IntegerField(default=0, blank=True)
 
+    objects = NotesQuotaManager()
+
     class Meta:
         db_table = 'notes'
 
 
+class NotesQuotaUsage(models.Model):
+    """
+    Usage of user in the billing period. New period starts with new record, so there is no need to reset usage
+    """
+    id = models.AutoField(primary_key=True)
+    user_id = models.IntegerField()
+    period = models.DateField()
+    usage = models.IntegerField(default=0, blank=True)
+
+    objects = NotesQuotaManager()
+
+    class Meta:
+        db_table = 'notes_quota_usage'
+        unique_together = (('user_id', 'period', ), )
+
+
+class NotesQuotaUsageArchive(models.Model):
+    """
+    Usage of past billing periods, moved out of NotesQuotaUsage by compact_quota_usage command
+    """
+    id = models.AutoField(primary_key=True)
+    user_id = models.IntegerField()
+    period = models.DateField()
+    usage = models.IntegerField(default=0, blank=True)
+
+    class Meta:
+        db_table = 'notes_quota_usage_archive'
+
+
+class QuotaReservation(models.Model):
+    """
+    Bytes reserved against the usage of user before upload, @see QuotaReserver
+    """
+    id = models.CharField(primary_key=True, max_length=32)
+    user_id = models.IntegerField(db_index=True)
+    period = models.DateField()
+    size = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    released = models.BooleanField(default=False)
+    # released by commit, so bytes are kept and the next commit is ignored
+    committed = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'notes_quota_reservations'
+
+
 class UsersPremiumLimits(models.Model):
     id = models.AutoField(primary_key=True)
     user = models.ForeignKey(NotesUsers, to_field='id', db_column='user_id')
@@ -51,19 +188,119 @@ class UsersPremium(models.Model):
 
     @property
     def is_premium(self):
-        return self.status == self.STATUS_ACTIVE
+        return self.status == self.STATUS_ACTIVE and self.start_date <= date.today() <= self.end_date
 
     class Meta:
         db_table = 'users_premium'
 
 
+def _get_day_start(day):
+    """
+    :param date day:
+
+    :return float: unix timestamp of the day's beginning
+    """
+    return time.mktime(day.timetuple())
+
+
+class PremiumResolver(object):
+    """
+    Resolves premium status of users. Subscription out of its dates is treated as expired regardless of its status.
+    Status is cached till the moment it could change: the start or the end of subscription
+    """
+
+    def __init__(self, cache):
+        """
+        :param ExpiringLRUCache cache: storage of resolved statuses
+        """
+        self._cache = cache
+
+    @classmethod
+    def _get_status(cls, subscription, today):
+        """
+        :param UsersPremium subscription: subscription of user, if any
+        :param date today: current date
+
+        :return tuple: (is premium, expiration unix timestamp of the status or None)
+        """
+        if subscription is None or subscription.status != UsersPremium.STATUS_ACTIVE:
+            return False, None
+
+        if today < subscription.start_date:
+            return False, _get_day_start(subscription.start_date)
+
+        if today > subscription.end_date:
+            return False, None
+
+        # subscription is active till the end of its last day
+        return True, _get_day_start(subscription.end_date + timedelta(days=1))
+
+    def resolve_many(self, user_ids):
+        """
+        Resolve statuses of many users by one query at most
+
+        :param list user_ids: ids of users
+
+        :return dict: user_id => (is premium, expiration unix timestamp of the status or None)
+        """
+        result = {}
+        missing = []
+
+        for user_id in set(user_ids):
+            status = self._cache.get(user_id)
+            if status is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = status
+
+        if missing:
+            today = date.today()
+            subscriptions = dict(
+                (subscription.user_id, subscription)
+                for subscription in UsersPremium.objects.filter(user_id__in=missing)
+            )
+
+            for user_id in missing:
+                status = self._get_status(subscriptions.get(user_id), today)
+                self._cache.set(user_id, status, status[1])
+                result[user_id] = status
+
+        return result
+
+    def resolve(self, user_id):
+        """
+        :return tuple: (is premium, expiration unix timestamp of the status or None)
+        """
+        return self.resolve_many([user_id])[user_id]
+
+    def is_premium(self, user_id):
+        """
+        :rtype bool:
+        """
+        return self.resolve(user_id)[0]
+
+    def invalidate(self, user_id):
+        self._cache.delete(user_id)
+
+
+premium_resolver = PremiumResolver(premium_cache)
+
+
 class QuotaLimits(NNConfig):
+    """
+    Limits of free accounts. Values are read from the process-wide config snapshot, @see QuotaConfigHolder
+    """
+
+    def _set_item(self, key, value):
+        super(QuotaLimits, self)._set_item(key, value)
+        quota_config.bump()
+
     @property
     def note_max_size(self):
         """
         Max size of sigle note (text + all attachments). In bytes
         """
-        return int(self.NOTES_MAX_SIZE)
+        return quota_config.get().note_max_size
 
     @note_max_size.setter
     def note_max_size(self, value):
@@ -74,7 +311,7 @@ class QuotaLimits(NNConfig):
         """
         Total Max size of all notes + all attachments. In bytes
         """
-        return int(self.NOTES_MONTH_USAGE_QUOTA)
+        return quota_config.get().total_max_size
 
     @total_max_size.setter
     def total_max_size(self, value):
@@ -85,7 +322,7 @@ class QuotaLimits(NNConfig):
         """
         Max size of attachment. In bytes
         """
-        return int(self.NOTES_MAX_ATTACHMENT_SIZE)
+        return quota_config.get().attachments_max_size
 
     @attachments_max_size.setter
     def attachments_max_size(self, value):
@@ -99,15 +336,32 @@ class UserLimits(object):
     _limiter = None
     _user_id = None
 
+    def _load_user_limits(self):
+        """
+        Load limits of user from DB
+
+        :return tuple: (limiter, expiration unix timestamp or None)
+        """
+        is_premium, expires_at = premium_resolver.resolve(self._user_id)
+
+        if is_premium:
+            try:
+                return UsersPremiumLimits.objects.get(user_id=self._user_id), expires_at
+            except UsersPremiumLimits.DoesNotExist:
+                pass
+
+        return QuotaLimits(), expires_at
+
     def _get_user_limits(self):
-        if self._user_id:
-            premium_user = UsersPremium.objects.filter(user_id=self._user_id, status=UsersPremium.STATUS_ACTIVE)
-            premium_user_limits = UsersPremiumLimits.objects.filter(user_id=self._user_id)
+        if not self._user_id:
+            return QuotaLimits()
 
-            if premium_user.exists() and premium_user_limits.exists():
-                return premium_user_limits.get()
+        limiter = limits_cache.get(self._user_id)
+        if limiter is None:
+            limiter, expires_at = self._load_user_limits()
+            limits_cache.set(self._user_id, limiter, expires_at)
 
-        return QuotaLimits()
+        return limiter
 
     def __init__(self, user_id=None):
         self._user_id = user_id
@@ -169,7 +423,7 @@ class AttachmentsQuotaLimitError(QuotaLimitError):
         #если обычний пользователь
         if not is_pro:
             error_code = errors.ERROR_ATTACHMENT_SIZE_QUOTA_EXCEED_STANDART
-            second_param = int(NNConfig().NOTES_MAX_ATTACHMENT_SIZE_PREMIUM_DEFAULT)
+            second_param = quota_config.get().attachments_premium_max_size
 
         error_text = errors.get_error_message(error_code).format(
                     sizeformat(first_param),
@@ -180,6 +434,21 @@ class AttachmentsQuotaLimitError(QuotaLimitError):
         super(AttachmentsQuotaLimitError, self).__init__(error_code, error_text)
 
 
+# attribute of instance with bytes, which are accounted before its save, @see mark_precharged
+PRECHARGED_ATTRIBUTE = '_quota_precharged'
+
+
+def mark_precharged(instance, size):
+    """
+    Mark bytes of the instance, which are already accounted into usage (e.g. by QuotaReserver.commit),
+    so the validation of its next save does not charge them again
+
+    :param instance: note, which is going to be saved
+    :param int size: accounted bytes
+    """
+    setattr(instance, PRECHARGED_ATTRIBUTE, getattr(instance, PRECHARGED_ATTRIBUTE, 0) + size)
+
+
 class QuotaValidator(object):
 
     def __init__(self, instance, prev_size, new_size):
@@ -187,13 +456,6 @@ class QuotaValidator(object):
         self._prev_size = prev_size or 0
         self._new_size = new_size or 0
 
-    def _update_used(self, new_used_size):
-        notes_quota = NotesQuota.objects.get_or_create(user_id=self._instance.user_id)[0]
-
-        if new_used_size:
-            notes_quota.usage += new_used_size
-            notes_quota.save()
-
     def validate(self):
         quota_checker = CheckQuotaLimit(self._instance.user_id)
         data_provider = SignalSizeDataProvider(self._instance, self._prev_size, self._new_size)
@@ -201,13 +463,73 @@ class QuotaValidator(object):
         attachments_size = data_provider.attachments_size
         quota_checker.check_attachment_limit(attachments_size)
 
-        total_size = data_provider.total_size
+        total_size = data_provider.total_size - getattr(self._instance, PRECHARGED_ATTRIBUTE, 0)
         quota_checker.check_total_limit(total_size)
 
         note_size = data_provider.note_size
         quota_checker.check_note_limit(note_size)
 
-        self._update_used(total_size)
+        quota_checker.consume(total_size)
+        setattr(self._instance, PRECHARGED_ATTRIBUTE, 0)
+
+    @classmethod
+    def validate_many(cls, items):
+        """
+        Validate batch of notes (imports, sync catch-up).
+        Limits are resolved once per user, the total limit is checked cumulatively in order of items
+        and accepted usage deltas are committed by one update per user.
+
+        :param list items: list of tuples (instance, prev_size, new_size)
+
+        :return list: QuotaLimitError or None for each item
+        """
+        results = [None] * len(items)
+        checkers = {}
+        accepted = {}
+
+        for index, (instance, prev_size, new_size) in enumerate(items):
+            user_id = instance.user_id
+            if user_id not in checkers:
+                checkers[user_id] = CheckQuotaLimit(user_id)
+
+            quota_checker = checkers[user_id]
+            data_provider = SignalSizeDataProvider(instance, prev_size or 0, new_size or 0)
+            total_size = data_provider.total_size - getattr(instance, PRECHARGED_ATTRIBUTE, 0)
+
+            try:
+                quota_checker.check_attachment_limit(data_provider.attachments_size)
+                quota_checker.check_total_limit(total_size)
+                quota_checker.check_note_limit(data_provider.note_size)
+            except QuotaLimitError as err:
+                results[index] = err
+                continue
+
+            quota_checker.usage += total_size
+            accepted.setdefault(user_id, []).append((index, total_size, ))
+
+        for user_id, sizes in accepted.items():
+            quota_checker = checkers[user_id]
+            batch_size = sum(size for _, size in sizes)
+
+            if not batch_size:
+                continue
+
+            if quota_checker.counter.increment(user_id, batch_size, quota_checker.limits.total_max_size):
+                continue
+
+            # usage has been changed concurrently, so account items one by one
+            quota_checker.usage = quota_checker.counter.get_usage(user_id)
+            for index, size in sizes:
+                try:
+                    quota_checker.consume(size)
+                except TotalQuotaLimitError as err:
+                    results[index] = err
+
+        for (instance, _, _), error in zip(items, results):
+            if error is None:
+                setattr(instance, PRECHARGED_ATTRIBUTE, 0)
+
+        return results
 
 
 class CheckQuotaLimit(object):
@@ -216,24 +538,44 @@ class CheckQuotaLimit(object):
     def _get_limits(self):
         return UserLimits(user_id=self.user_id)
 
+    def _get_counter(self):
+        from counters import get_quota_counter
+        return get_quota_counter()
+
     def __init__(self, user_id):
         self.user_id = user_id
 
         self.limits = self._get_limits()
-        self.notes_quota = NotesQuota.objects.get_or_create(user_id=self.user_id)[0]
+        self.counter = self._get_counter()
+        self.usage = self.counter.get_usage(self.user_id)
 
     def check_total_limit(self, size):
-        used_size = size + self.notes_quota.usage
+        used_size = size + self.usage
 
         if used_size and used_size > self.limits.total_max_size:
             raise TotalQuotaLimitError(size, self.limits.total_max_size)
 
+    def consume(self, size, period=None):
+        """
+        Check total limit and account size into usage in one atomic operation.
+        Unlike check_total_limit it could not be outdated by concurrent saves of the same user
+
+        :param int size: delta of usage, in bytes
+        :param date period: billing period. Current one by default
+        :raise: TotalQuotaLimitError
+        """
+        if not size:
+            return
+
+        if not self.counter.increment(self.user_id, size, self.limits.total_max_size, period=period):
+            raise TotalQuotaLimitError(size, self.limits.total_max_size)
+
+        if period is None or period == get_current_period():
+            self.usage += size
+
     def check_attachment_limit(self, size):
         if size and size > self.limits.attachments_max_size:
-            is_premium = UsersPremium.objects.filter(
-                user_id=self.user_id,
-                status=UsersPremium.STATUS_ACTIVE
-            ).exists()
+            is_premium = premium_resolver.is_premium(self.user_id)
 
             raise AttachmentsQuotaLimitError(size, self.limits.attachments_max_size, is_premium)
 
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from models import CheckQuotaLimit, QuotaReservation, TotalQuotaLimitError, get_current_period, mark_precharged
+from counters import get_quota_counter
+
+
+__all__ = ['QuotaReserver', ]
+
+
+class QuotaReserver(object):
+    """
+    Two-phase accounting of large uploads: reserve bytes before the upload starts,
+    then commit the actual size or release the reservation.
+
+    Reserved bytes are accounted into usage immediately by atomic increment, so no DB lock is held during the upload.
+    Committed bytes are marked on the saved note, so its save does not charge them again, @see mark_precharged.
+    Reservations which are neither committed nor released in time are released by release_expired(),
+    @see release_quota_reservations command.
+    """
+    RELEASE_CHUNK_SIZE = 500
+
+    def __init__(self, user_id):
+        """
+        :param int user_id: user's id
+        """
+        self.user_id = user_id
+        self.quota_checker = CheckQuotaLimit(user_id)
+
+    def reserve(self, size, timeout=None):
+        """
+        Reserve size bytes for upload
+
+        :param int size: expected size of upload, in bytes
+        :param int timeout: lifetime of reservation, in seconds. QUOTA_RESERVATION_TIMEOUT setting by default
+
+        :return string: reservation token
+        :raise: AttachmentsQuotaLimitError, TotalQuotaLimitError
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'QUOTA_RESERVATION_TIMEOUT', 3600)
+
+        self.quota_checker.check_attachment_limit(size)
+
+        try:
+            self.quota_checker.consume(size)
+        except TotalQuotaLimitError:
+            # expired reservations are released periodically, only ones of the user hitting the limit are released here
+            if not self.release_expired(self.user_id):
+                raise
+
+            self.quota_checker.consume(size)
+
+        reservation = QuotaReservation.objects.create(
+            id=uuid.uuid4().hex,
+            user_id=self.user_id,
+            period=get_current_period(),
+            size=size,
+            expires_at=timezone.now() + timedelta(seconds=timeout),
+        )
+
+        return reservation.id
+
+    @classmethod
+    def _claim(cls, reservation, committed=False):
+        """
+        Atomically mark reservation as released, so it could not be released twice
+
+        :param QuotaReservation reservation:
+        :param bool committed: whether reservation is released by commit
+
+        :return bool: True if reservation has been claimed by the current call
+        """
+        return bool(QuotaReservation.objects.filter(id=reservation.id, released=False).update(
+            released=True, committed=committed))
+
+    @classmethod
+    def _give_back(cls, counter, reservation):
+        counter.increment(reservation.user_id, -reservation.size, period=reservation.period)
+
+    def _pop(self, token, committed=False):
+        """
+        :param string token: reservation token
+        :param bool committed: whether reservation is released by commit
+
+        :return QuotaReservation: None if reservation does not exist or has already been released
+        """
+        try:
+            reservation = QuotaReservation.objects.get(id=token, user_id=self.user_id, released=False)
+        except QuotaReservation.DoesNotExist:
+            return None
+
+        return reservation if self._claim(reservation, committed) else None
+
+    def _is_committed(self, token):
+        return QuotaReservation.objects.filter(id=token, user_id=self.user_id, committed=True).exists()
+
+    def commit(self, token, size, instance):
+        """
+        Account actual size of upload instead of reserved one. Difference is accounted into the period
+        of reservation, like the reserved bytes. Repeated commit of the reservation is ignored.
+
+        Failed commit gives reserved bytes back. Commit and save of the instance should be done
+        in one batch_transaction, so failed save rolls the commit back too.
+
+        :param string token: reservation token
+        :param int size: actual size of upload, in bytes
+        :param instance: note, which the upload is attached to. Its save does not charge the upload again
+
+        :raise: AttachmentsQuotaLimitError, TotalQuotaLimitError
+        """
+        reservation = self._pop(token, committed=True)
+
+        if reservation is None:
+            if self._is_committed(token):
+                return
+
+            # reservation has expired and its bytes were given back, so upload is accounted from scratch
+            self.quota_checker.check_attachment_limit(size)
+            self.quota_checker.consume(size)
+        else:
+            try:
+                self.quota_checker.check_attachment_limit(size)
+                self.quota_checker.consume(size - reservation.size, reservation.period)
+            except Exception:
+                QuotaReservation.objects.filter(id=reservation.id).update(committed=False)
+                self._give_back(self.quota_checker.counter, reservation)
+                raise
+
+        mark_precharged(instance, size)
+
+    def release(self, token):
+        """
+        Give reserved bytes back on failed or cancelled upload
+
+        :param string token: reservation token
+        """
+        reservation = self._pop(token)
+
+        if reservation is not None:
+            self._give_back(self.quota_checker.counter, reservation)
+
+    @classmethod
+    def release_expired(cls, user_id=None):
+        """
+        Give bytes of expired reservations back
+
+        :param int user_id: release reservations of this user only. All users by default
+
+        :return int: count of released reservations
+        """
+        queryset = QuotaReservation.objects.all()
+        if user_id is not None:
+            queryset = queryset.filter(user_id=user_id)
+
+        # committed reservations are kept until they expire, so their repeated commits are ignored
+        queryset.filter(released=True, expires_at__lte=timezone.now()).delete()
+        queryset = queryset.filter(released=False, expires_at__lte=timezone.now())
+
+        released = 0
+        counter = get_quota_counter()
+        for reservation in queryset[:cls.RELEASE_CHUNK_SIZE]:
+            if not cls._claim(reservation):
+                continue
+
+            cls._give_back(counter, reservation)
+            released += 1
+
+        return released
@@ -1,5 +1,19 @@
 # -*- coding: utf-8 -*-
 
 from .quota import TestQuota
+from .cache import TestExpiringLRUCache, TestVersionedLRUCache, TestUserLimitsCache
+from .counters import TestRedisQuotaCounter
+from .premium import TestPremiumResolver
+from .usage import TestQuotaConsume
+from .batch import TestValidateMany
+from .periods import TestUsagePeriods
+from .reservations import TestQuotaReserver
+from .uploads import TestS3MultipartWriter, TestQuotaUploadHandler
+from .reconcile import TestUsageReconciler
+from .config import TestQuotaConfigHolder
 
-__all__ = ['TestQuota', ]
+__all__ = [
+    'TestQuota', 'TestExpiringLRUCache', 'TestRedisQuotaCounter', 'TestPremiumResolver', 'TestQuotaConsume',
+    'TestValidateMany', 'TestUsagePeriods', 'TestQuotaReserver', 'TestS3MultipartWriter', 'TestQuotaUploadHandler',
+    'TestUsageReconciler', 'TestQuotaConfigHolder', 'TestVersionedLRUCache', 'TestUserLimitsCache',
+]
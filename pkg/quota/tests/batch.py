@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from pkg.quota import models
+from pkg.quota.models import (
+    NotesQuotaUsage, QuotaValidator, TotalQuotaLimitError, NoteQuotaLimitError, get_current_period,
+)
+from .usage import QuotaCheckerStub
+
+
+__all__ = ['TestValidateMany', ]
+
+
+class NoteStub(object):
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+
+class SizeDataProviderStub(object):
+    def __init__(self, instance, prev_size, new_size):
+        self.attachments_size = 0
+        self.total_size = new_size - prev_size
+        self.note_size = new_size
+
+
+class TestValidateMany(TestCase):
+    multi_db = True
+    USER_ID = 42
+    OTHER_USER_ID = 43
+
+    def setUp(self):
+        self._patched = (models.CheckQuotaLimit, models.SignalSizeDataProvider, )
+        models.CheckQuotaLimit = QuotaCheckerStub
+        models.SignalSizeDataProvider = SizeDataProviderStub
+
+        for user_id in (self.USER_ID, self.OTHER_USER_ID, ):
+            NotesQuotaUsage.objects.create(user_id=user_id, period=get_current_period(), usage=100)
+
+    def tearDown(self):
+        models.CheckQuotaLimit, models.SignalSizeDataProvider = self._patched
+
+    def _get_usage(self, user_id):
+        return NotesQuotaUsage.objects.get(user_id=user_id, period=get_current_period()).usage
+
+    def test_accepted_items_are_accounted_at_once(self):
+        results = QuotaValidator.validate_many([
+            (NoteStub(self.USER_ID), 0, 20, ),
+            (NoteStub(self.USER_ID), 10, 30, ),
+            (NoteStub(self.OTHER_USER_ID), 0, 5, ),
+        ])
+
+        self.assertEqual(results, [None, None, None])
+        self.assertEqual(self._get_usage(self.USER_ID), 140)
+        self.assertEqual(self._get_usage(self.OTHER_USER_ID), 105)
+
+    def test_total_limit_is_checked_cumulatively(self):
+        results = QuotaValidator.validate_many([
+            (NoteStub(self.USER_ID), 0, 30, ),
+            (NoteStub(self.USER_ID), 0, 30, ),
+            (NoteStub(self.USER_ID), 0, 10, ),
+        ])
+
+        self.assertEqual(results[0], None)
+        self.assertIsInstance(results[1], TotalQuotaLimitError)
+        self.assertEqual(results[2], None)
+        self.assertEqual(self._get_usage(self.USER_ID), 140)
+
+    def test_rejected_item_does_not_fail_others(self):
+        results = QuotaValidator.validate_many([
+            (NoteStub(self.USER_ID), 0, 45, ),
+            (NoteStub(self.USER_ID), 0, 20, ),
+        ])
+
+        self.assertIsInstance(results[0], NoteQuotaLimitError)
+        self.assertEqual(results[1], None)
+        self.assertEqual(self._get_usage(self.USER_ID), 120)
+
+    def test_concurrent_save_falls_back_to_items(self):
+        # usage is read once per user, then another process accounts its save
+        original_init = QuotaCheckerStub.__init__
+
+        def init(checker, user_id):
+            original_init(checker, user_id)
+            NotesQuotaUsage.objects.increment(user_id, 25, period=get_current_period())
+
+        QuotaCheckerStub.__init__ = init
+        try:
+            results = QuotaValidator.validate_many([
+                (NoteStub(self.USER_ID), 0, 20, ),
+                (NoteStub(self.USER_ID), 0, 10, ),
+            ])
+        finally:
+            QuotaCheckerStub.__init__ = original_init
+
+        self.assertEqual(results[0], None)
+        self.assertIsInstance(results[1], TotalQuotaLimitError)
+        self.assertEqual(self._get_usage(self.USER_ID), 145)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.cache import cache as shared_cache
+from django.db.models.signals import post_save, post_delete
+from django.test import SimpleTestCase
+
+from pkg.quota import cache
+from pkg.quota.cache import ExpiringLRUCache, VersionedLRUCache, limits_cache, premium_cache
+from pkg.quota.models import UserLimits, UsersPremium, UsersPremiumLimits
+
+
+__all__ = ['TestExpiringLRUCache', 'TestVersionedLRUCache', 'TestUserLimitsCache', ]
+
+
+class TestExpiringLRUCache(SimpleTestCase):
+    def test_missing_key_returns_default(self):
+        cache = ExpiringLRUCache()
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(1, 'default'), 'default')
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ExpiringLRUCache(max_size=2)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+
+        self.assertEqual(cache.get(1), 'a')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), 'c')
+        self.assertEqual(len(cache), 2)
+
+    def test_entry_expires_at_given_time(self):
+        cache = ExpiringLRUCache()
+        cache.set(1, 'a', expires_at=time.time() - 1)
+        cache.set(2, 'b', expires_at=time.time() + 60)
+
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(2), 'b')
+
+    def test_default_ttl_limits_entry_expiration(self):
+        cache = ExpiringLRUCache(ttl=-1)
+        cache.set(1, 'a', expires_at=time.time() + 60)
+
+        self.assertIsNone(cache.get(1))
+
+    def test_deleted_entry_is_missing(self):
+        cache = ExpiringLRUCache()
+        cache.set(1, 'a')
+        cache.delete(1)
+
+        self.assertIsNone(cache.get(1))
+
+
+class TimeStub(object):
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+
+class TestVersionedLRUCache(SimpleTestCase):
+    NAME = 'test'
+
+    def setUp(self):
+        self._time = cache.time
+        cache.time = self.clock = TimeStub()
+        shared_cache.delete(VersionedLRUCache(self.NAME)._get_version_key(1))
+
+    def tearDown(self):
+        cache.time = self._time
+
+    def test_entry_is_cached_until_deleted(self):
+        local = VersionedLRUCache(self.NAME)
+
+        self.assertIsNone(local.get(1))
+        local.set(1, 'a')
+        self.assertEqual(local.get(1), 'a')
+
+        local.delete(1)
+        self.assertIsNone(local.get(1))
+
+    def test_deletion_by_other_process_is_seen_after_check_interval(self):
+        local = VersionedLRUCache(self.NAME, check_interval=10)
+        local.get(1)
+        local.set(1, 'a')
+
+        VersionedLRUCache(self.NAME).delete(1)
+
+        self.clock.now += 9
+        self.assertEqual(local.get(1), 'a')
+
+        self.clock.now += 1
+        self.assertIsNone(local.get(1))
+
+    def test_unchanged_entry_survives_check(self):
+        local = VersionedLRUCache(self.NAME, check_interval=10)
+        local.get(1)
+        local.set(1, 'a')
+
+        self.clock.now += 10
+        self.assertEqual(local.get(1), 'a')
+
+    def test_value_loaded_before_deletion_is_not_kept(self):
+        local = VersionedLRUCache(self.NAME, check_interval=10)
+
+        self.assertIsNone(local.get(1))
+        # the value is changed by other process while this one loads the old value
+        VersionedLRUCache(self.NAME).delete(1)
+        local.set(1, 'old')
+
+        self.clock.now += 10
+        self.assertIsNone(local.get(1))
+
+    def test_expired_stamp_invalidates_entry(self):
+        local = VersionedLRUCache(self.NAME, check_interval=10)
+        local.delete(1)
+        local.get(1)
+        local.set(1, 'a')
+
+        shared_cache.delete(local._get_version_key(1))
+
+        self.clock.now += 10
+        self.assertIsNone(local.get(1))
+
+
+class LimitsStub(object):
+    note_max_size = 40
+    total_max_size = 150
+    attachments_max_size = 500
+
+
+class UserLimitsStub(UserLimits):
+    """
+    Counts loads instead of reading premium status and limits from DB
+    """
+    loads = []
+    expires_at = None
+
+    def _load_user_limits(self):
+        self.loads.append(self._user_id)
+        return LimitsStub(), self.expires_at
+
+
+class TestUserLimitsCache(SimpleTestCase):
+    USER_ID = 42
+
+    def setUp(self):
+        UserLimitsStub.loads = []
+        UserLimitsStub.expires_at = None
+        limits_cache.clear()
+        premium_cache.clear()
+
+    def tearDown(self):
+        limits_cache.clear()
+        premium_cache.clear()
+
+    def test_limits_are_loaded_once(self):
+        self.assertEqual(UserLimitsStub(self.USER_ID).note_max_size, 40)
+        self.assertEqual(UserLimitsStub(self.USER_ID).total_max_size, 150)
+
+        self.assertEqual(UserLimitsStub.loads, [self.USER_ID])
+
+    def test_limits_expire_with_premium_status(self):
+        UserLimitsStub.expires_at = time.time() - 1
+
+        UserLimitsStub(self.USER_ID)
+        UserLimitsStub(self.USER_ID)
+
+        self.assertEqual(UserLimitsStub.loads, [self.USER_ID, self.USER_ID])
+
+    def test_limits_are_invalidated_by_change_of_premium_limits(self):
+        for signal in (post_save, post_delete, ):
+            UserLimitsStub(self.USER_ID)
+            signal.send(sender=UsersPremiumLimits, instance=UsersPremiumLimits(user_id=self.USER_ID))
+
+        UserLimitsStub(self.USER_ID)
+
+        self.assertEqual(UserLimitsStub.loads, [self.USER_ID] * 3)
+
+    def test_limits_are_invalidated_by_change_of_subscription(self):
+        for signal in (post_save, post_delete, ):
+            UserLimitsStub(self.USER_ID)
+            signal.send(sender=UsersPremium, instance=UsersPremium(user_id=self.USER_ID))
+
+        UserLimitsStub(self.USER_ID)
+
+        self.assertEqual(UserLimitsStub.loads, [self.USER_ID] * 3)
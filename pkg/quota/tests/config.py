@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from pkg.quota.config import QuotaConfigHolder, QuotaConfigSnapshot
+
+
+__all__ = ['TestQuotaConfigHolder', ]
+
+
+class QuotaConfigHolderStub(QuotaConfigHolder):
+    """
+    Counts loads instead of reading config storage
+    """
+    loads = []
+
+    def _load(self, version):
+        self.loads.append(version)
+        return QuotaConfigSnapshot(version, 10, 100, 1000, 10000)
+
+
+class TestQuotaConfigHolder(TestCase):
+    def setUp(self):
+        cache.delete(QuotaConfigHolder.VERSION_KEY)
+        QuotaConfigHolderStub.loads = []
+
+    def test_snapshot_is_loaded_once(self):
+        holder = QuotaConfigHolderStub(check_interval=60)
+
+        self.assertIs(holder.get(), holder.get())
+        self.assertEqual(holder.get().note_max_size, 10)
+        self.assertEqual(QuotaConfigHolderStub.loads, [0])
+
+    def test_version_is_not_checked_within_interval(self):
+        holder = QuotaConfigHolderStub(check_interval=60)
+        holder.get()
+
+        # change made by another process
+        QuotaConfigHolderStub().bump()
+
+        self.assertEqual(holder.get().version, 0)
+        self.assertEqual(QuotaConfigHolderStub.loads, [0])
+
+    def test_snapshot_is_reloaded_on_new_version(self):
+        holder = QuotaConfigHolderStub(check_interval=0)
+        holder.get()
+
+        QuotaConfigHolderStub().bump()
+
+        self.assertEqual(holder.get().version, 1)
+        holder.get()
+        self.assertEqual(QuotaConfigHolderStub.loads, [0, 1])
+
+    def test_bump_drops_own_snapshot(self):
+        holder = QuotaConfigHolderStub(check_interval=60)
+        holder.get()
+
+        holder.bump()
+        holder.bump()
+
+        self.assertEqual(holder.get().version, 2)
+        self.assertEqual(QuotaConfigHolderStub.loads, [0, 2])
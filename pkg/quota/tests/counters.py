@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+from unittest import skipIf
+
+from django.test import TestCase
+
+from pkg.quota.models import NotesQuotaUsage, get_current_period
+from pkg.quota.counters import QuotaCounterError, RedisQuotaCounter
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+__all__ = ['TestRedisQuotaCounter', ]
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed')
+class TestRedisQuotaCounter(TestCase):
+    multi_db = True
+    USER_ID = 42
+
+    def setUp(self):
+        self.connection = fakeredis.FakeStrictRedis()
+        self.connection.flushall()
+        self.counter = RedisQuotaCounter(self.connection)
+
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=get_current_period(), usage=100)
+
+    def _get_db_usage(self):
+        return NotesQuotaUsage.objects.get(user_id=self.USER_ID, period=get_current_period()).usage
+
+    def test_counter_is_seeded_from_db(self):
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 100)
+
+    def test_increment_within_limit(self):
+        self.assertTrue(self.counter.increment(self.USER_ID, 50, 150))
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 150)
+
+    def test_increment_over_limit_is_rejected(self):
+        self.assertFalse(self.counter.increment(self.USER_ID, 51, 150))
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 100)
+
+    def test_decrement_ignores_limit(self):
+        self.assertTrue(self.counter.increment(self.USER_ID, -10, 50))
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 90)
+
+    def test_increment_does_not_touch_db_until_flush(self):
+        self.counter.increment(self.USER_ID, 20)
+        self.counter.increment(self.USER_ID, 30)
+        self.assertEqual(self._get_db_usage(), 100)
+
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self._get_db_usage(), 150)
+        self.assertFalse(self.connection.exists(RedisQuotaCounter.FLUSHING_KEY))
+
+    def test_crashed_flush_is_reconciled(self):
+        self.counter.increment(self.USER_ID, 20)
+        # flush crashed right after the deltas have been written to DB
+        self.connection.rename(RedisQuotaCounter.DELTAS_KEY, RedisQuotaCounter.FLUSHING_KEY)
+        NotesQuotaUsage.objects.bulk_increment({self.USER_ID: 20}, period=get_current_period())
+        self.counter.increment(self.USER_ID, 5)
+
+        self.counter.flush()
+
+        self.assertEqual(self._get_db_usage(), 125)
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 125)
+
+    def test_pending_deltas(self):
+        self.counter.increment(self.USER_ID, 20)
+
+        self.assertEqual(self.counter.get_pending([self.USER_ID, self.USER_ID + 1]), {self.USER_ID: 20})
+
+        self.connection.rename(RedisQuotaCounter.DELTAS_KEY, RedisQuotaCounter.FLUSHING_KEY)
+        self.counter.increment(self.USER_ID, 5)
+
+        self.assertEqual(self.counter.get_pending([self.USER_ID]), {self.USER_ID: 25})
+
+    def test_reset_drops_counter_but_keeps_pending_deltas(self):
+        self.counter.increment(self.USER_ID, 20)
+        # usage is corrected in DB, e.g. by reconcile_quota_usage
+        NotesQuotaUsage.objects.bulk_increment({self.USER_ID: 30}, period=get_current_period())
+
+        self.counter.reset([self.USER_ID])
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 150)
+
+        self.counter.flush()
+
+        self.assertEqual(self._get_db_usage(), 150)
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 150)
+
+    def test_missing_counter_after_seed_is_error(self):
+        self.counter._seed = lambda user_id, period: None
+
+        self.assertRaises(QuotaCounterError, self.counter.increment, self.USER_ID, 5)
+
+    def test_counter_is_not_seeded_while_its_deltas_are_flushed(self):
+        self.counter.SEED_RETRY_DELAY = 0
+        self.counter.increment(self.USER_ID, 20)
+
+        # flush has written the deltas to DB, but has not deleted them yet
+        self.connection.rename(RedisQuotaCounter.DELTAS_KEY, RedisQuotaCounter.FLUSHING_KEY)
+        self.connection.set(RedisQuotaCounter.LOCK_KEY, 'token')
+        NotesQuotaUsage.objects.bulk_increment({self.USER_ID: 20}, period=get_current_period())
+        self.connection.delete(self.counter._get_key(self.USER_ID, get_current_period()))
+
+        self.assertRaises(QuotaCounterError, self.counter.get_usage, self.USER_ID)
+
+        self.connection.delete(RedisQuotaCounter.FLUSHING_KEY)
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 120)
+
+    def test_deltas_of_crashed_flush_are_seeded_as_pending(self):
+        self.counter.increment(self.USER_ID, 20)
+        self.connection.rename(RedisQuotaCounter.DELTAS_KEY, RedisQuotaCounter.FLUSHING_KEY)
+        self.connection.delete(self.counter._get_key(self.USER_ID, get_current_period()))
+
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 120)
+
+    def test_reset_fails_while_flush_is_in_progress(self):
+        self.counter.RESET_LOCK_TIMEOUT = 0
+        self.counter.increment(self.USER_ID, 20)
+        self.connection.set(RedisQuotaCounter.LOCK_KEY, 'token')
+
+        self.assertRaises(QuotaCounterError, self.counter.reset, [self.USER_ID])
+        self.assertEqual(self.counter.get_usage(self.USER_ID), 120)
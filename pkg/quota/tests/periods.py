@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, timedelta
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from pkg.quota.models import NotesQuota, NotesQuotaUsage, NotesQuotaUsageArchive, get_current_period
+from pkg.quota.counters import DatabaseQuotaCounter
+
+
+__all__ = ['TestUsagePeriods', ]
+
+
+class TestUsagePeriods(TestCase):
+    multi_db = True
+    USER_ID = 42
+    OTHER_USER_ID = 43
+    PAST_PERIOD = date(2014, 4, 1)
+    PERIOD = date(2014, 5, 1)
+
+    def setUp(self):
+        self.counter = DatabaseQuotaCounter()
+
+    def _get_usage(self, user_id, period):
+        return NotesQuotaUsage.objects.get(user_id=user_id, period=period).usage
+
+    def test_period_is_the_first_day_of_month(self):
+        self.assertEqual(get_current_period(date(2014, 5, 31)), self.PERIOD)
+        self.assertEqual(get_current_period(date(2014, 5, 1)), self.PERIOD)
+        self.assertEqual(get_current_period().day, 1)
+
+    def test_new_period_starts_with_zero_usage(self):
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=self.PAST_PERIOD, usage=100)
+
+        self.assertEqual(self.counter.get_usage(self.USER_ID, self.PERIOD), 0)
+        self.assertEqual(self.counter.get_usage(self.USER_ID, self.PAST_PERIOD), 100)
+
+    def test_increment_touches_its_period_only(self):
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=self.PAST_PERIOD, usage=100)
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=self.PERIOD, usage=10)
+
+        self.assertTrue(self.counter.increment(self.USER_ID, 20, 100, period=self.PERIOD))
+
+        self.assertEqual(self._get_usage(self.USER_ID, self.PERIOD), 30)
+        self.assertEqual(self._get_usage(self.USER_ID, self.PAST_PERIOD), 100)
+
+    def test_bulk_increment_and_set_of_period(self):
+        for user_id in (self.USER_ID, self.OTHER_USER_ID, ):
+            NotesQuotaUsage.objects.create(user_id=user_id, period=self.PAST_PERIOD, usage=100)
+            NotesQuotaUsage.objects.create(user_id=user_id, period=self.PERIOD, usage=10)
+
+        NotesQuotaUsage.objects.bulk_increment({self.USER_ID: 5, self.OTHER_USER_ID: -5}, period=self.PERIOD)
+        self.assertEqual(self._get_usage(self.USER_ID, self.PERIOD), 15)
+        self.assertEqual(self._get_usage(self.OTHER_USER_ID, self.PERIOD), 5)
+
+        NotesQuotaUsage.objects.bulk_set({self.USER_ID: 1, self.OTHER_USER_ID: 2}, period=self.PERIOD)
+        self.assertEqual(self._get_usage(self.USER_ID, self.PERIOD), 1)
+        self.assertEqual(self._get_usage(self.OTHER_USER_ID, self.PERIOD), 2)
+
+        self.assertEqual(self._get_usage(self.USER_ID, self.PAST_PERIOD), 100)
+        self.assertEqual(self._get_usage(self.OTHER_USER_ID, self.PAST_PERIOD), 100)
+
+    def test_compact_moves_past_periods_to_archive(self):
+        current = get_current_period()
+        previous = get_current_period(current - timedelta(days=1))
+        old = get_current_period(previous - timedelta(days=1))
+
+        for period in (current, previous, old, ):
+            NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=period, usage=period.month)
+
+        call_command('compact_quota_usage', keep_periods=2, chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(
+            sorted(NotesQuotaUsage.objects.values_list('period', flat=True)), sorted([current, previous]))
+        self.assertEqual(
+            list(NotesQuotaUsageArchive.objects.values_list('user_id', 'period', 'usage')),
+            [(self.USER_ID, old, old.month, )],
+        )
+
+    def test_migrate_copies_legacy_usage_into_current_period(self):
+        NotesQuota.objects.create(user_id=self.USER_ID, usage=100)
+        NotesQuota.objects.create(user_id=self.OTHER_USER_ID, usage=200)
+        NotesQuotaUsage.objects.create(user_id=self.OTHER_USER_ID, period=get_current_period(), usage=5)
+
+        call_command('migrate_quota_usage', stdout=StringIO())
+
+        self.assertEqual(self._get_usage(self.USER_ID, get_current_period()), 100)
+        # records, which already exist, are not overwritten
+        self.assertEqual(self._get_usage(self.OTHER_USER_ID, get_current_period()), 5)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+from django.test import SimpleTestCase
+
+from pkg.quota.models import UsersPremium, PremiumResolver
+
+
+__all__ = ['TestPremiumResolver', ]
+
+
+class TestPremiumResolver(SimpleTestCase):
+    TODAY = date(2014, 5, 15)
+
+    def _get_subscription(self, status=UsersPremium.STATUS_ACTIVE, start_date=date(2014, 5, 1),
+                          end_date=date(2014, 5, 31)):
+        return UsersPremium(user_id=1, status=status, start_date=start_date, end_date=end_date)
+
+    def test_user_without_subscription_is_not_premium(self):
+        self.assertEqual(PremiumResolver._get_status(None, self.TODAY), (False, None, ))
+
+    def test_inactive_subscription_is_not_premium(self):
+        subscription = self._get_subscription(status=UsersPremium.STATUS_CANCELLED)
+
+        self.assertFalse(PremiumResolver._get_status(subscription, self.TODAY)[0])
+
+    def test_active_subscription_expires_after_its_last_day(self):
+        is_premium, expires_at = PremiumResolver._get_status(self._get_subscription(), self.TODAY)
+
+        self.assertTrue(is_premium)
+        self.assertEqual(date.fromtimestamp(expires_at), date(2014, 6, 1))
+
+    def test_subscription_out_of_dates_is_expired(self):
+        subscription = self._get_subscription(end_date=date(2014, 5, 14))
+
+        self.assertEqual(PremiumResolver._get_status(subscription, self.TODAY), (False, None, ))
+
+    def test_future_subscription_status_expires_at_its_start(self):
+        subscription = self._get_subscription(start_date=date(2014, 5, 20))
+        is_premium, expires_at = PremiumResolver._get_status(subscription, self.TODAY)
+
+        self.assertFalse(is_premium)
+        self.assertEqual(date.fromtimestamp(expires_at), date(2014, 5, 20))
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from pkg.quota.models import NotesQuotaUsage, QuotaReservation, get_current_period
+from pkg.quota.management.commands import reconcile_quota_usage
+from pkg.quota.management.commands.reconcile_quota_usage import UsageReconciler
+
+
+__all__ = ['TestUsageReconciler', ]
+
+
+class CounterStub(object):
+    def __init__(self):
+        self.reset_calls = []
+        self.pending = {}
+
+    def get_pending(self, user_ids, period=None):
+        return dict((user_id, delta) for user_id, delta in self.pending.items() if user_id in user_ids)
+
+    def reset(self, user_ids, period=None):
+        self.reset_calls.append((sorted(user_ids), period, ))
+
+
+class ReconcilerStub(UsageReconciler):
+    """
+    Sums sizes of the given items instead of notes and attachments
+    """
+    def __init__(self, sizes, **kwargs):
+        super(ReconcilerStub, self).__init__(first_id=1, last_id=100, **kwargs)
+        self.sizes = sizes
+        self.periods = []
+
+    def _get_sizes(self, model, user_field, size_field, created_field, user_ids):
+        self.periods.append((self.period, self.next_period, ))
+        return self.sizes.pop(0)
+
+
+class TestUsageReconciler(TestCase):
+    multi_db = True
+    USER_ID = 42
+    OTHER_USER_ID = 43
+    NEW_USER_ID = 44
+
+    def setUp(self):
+        self._patched = reconcile_quota_usage.get_quota_counter
+        self.counter = CounterStub()
+        reconcile_quota_usage.get_quota_counter = lambda: self.counter
+
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=get_current_period(), usage=100)
+        NotesQuotaUsage.objects.create(user_id=self.OTHER_USER_ID, period=get_current_period(), usage=30)
+
+    def tearDown(self):
+        reconcile_quota_usage.get_quota_counter = self._patched
+
+    def _get_usage(self, user_id):
+        return NotesQuotaUsage.objects.get(user_id=user_id, period=get_current_period()).usage
+
+    def test_usage_is_raised_to_sum_of_items_of_the_period(self):
+        reconciler = ReconcilerStub([
+            {self.USER_ID: 100, self.OTHER_USER_ID: 20, self.NEW_USER_ID: 5},
+            {self.USER_ID: 10, self.OTHER_USER_ID: 10},
+        ])
+
+        corrected = reconciler._reconcile_chunk([self.USER_ID, self.OTHER_USER_ID, self.NEW_USER_ID])
+
+        self.assertEqual(corrected, 2)
+        self.assertEqual(self._get_usage(self.USER_ID), 110)
+        self.assertEqual(self._get_usage(self.OTHER_USER_ID), 30)
+        self.assertEqual(self._get_usage(self.NEW_USER_ID), 5)
+
+        period = get_current_period()
+        self.assertEqual(reconciler.periods[0][0], period)
+        self.assertEqual(reconciler.periods[0][1], get_current_period(reconciler.periods[0][1]))
+        self.assertGreater(reconciler.periods[0][1], period)
+
+    def test_usage_is_never_lowered(self):
+        # edits of notes created before the period are not counted by reconciler
+        corrected = ReconcilerStub([{self.USER_ID: 60}, {}])._reconcile_chunk([self.USER_ID])
+
+        self.assertEqual(corrected, 0)
+        self.assertEqual(self._get_usage(self.USER_ID), 100)
+
+    def test_reserved_bytes_are_counted(self):
+        for size, released in ((50, False), (1000, True), ):
+            QuotaReservation.objects.create(
+                id='%032d' % size, user_id=self.USER_ID, period=get_current_period(), size=size,
+                expires_at=timezone.now() + timedelta(hours=1), released=released,
+            )
+
+        ReconcilerStub([{self.USER_ID: 60}, {}])._reconcile_chunk([self.USER_ID])
+
+        self.assertEqual(self._get_usage(self.USER_ID), 110)
+
+    def test_pending_deltas_are_part_of_usage(self):
+        self.counter.pending = {self.USER_ID: 30}
+
+        ReconcilerStub([{self.USER_ID: 150}, {}])._reconcile_chunk([self.USER_ID])
+
+        # pending deltas are written by the next flush
+        self.assertEqual(self._get_usage(self.USER_ID), 120)
+
+    def test_counters_of_corrected_users_are_reset(self):
+        ReconcilerStub([{self.USER_ID: 160}, {self.OTHER_USER_ID: 40}])._reconcile_chunk(
+            [self.USER_ID, self.OTHER_USER_ID]
+        )
+
+        self.assertEqual(self.counter.reset_calls, [([self.USER_ID, self.OTHER_USER_ID], get_current_period(), )])
+
+    def test_dry_run_writes_nothing(self):
+        corrected = ReconcilerStub([{self.USER_ID: 160}, {}], dry_run=True)._reconcile_chunk([self.USER_ID])
+
+        self.assertEqual(corrected, 1)
+        self.assertEqual(self._get_usage(self.USER_ID), 100)
+        self.assertEqual(self.counter.reset_calls, [])
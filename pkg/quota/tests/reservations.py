@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from pkg.quota import models, reservations
+from pkg.quota.models import (
+    NotesQuotaUsage, QuotaReservation, QuotaValidator, TotalQuotaLimitError, get_current_period,
+)
+from pkg.quota.reservations import QuotaReserver
+from .batch import NoteStub, SizeDataProviderStub
+from .usage import QuotaCheckerStub
+
+
+__all__ = ['TestQuotaReserver', ]
+
+
+class TestQuotaReserver(TestCase):
+    multi_db = True
+    USER_ID = 42
+    PAST_PERIOD = date(2014, 4, 1)
+
+    def setUp(self):
+        self._patched = (reservations.CheckQuotaLimit, models.CheckQuotaLimit, models.SignalSizeDataProvider, )
+        reservations.CheckQuotaLimit = models.CheckQuotaLimit = QuotaCheckerStub
+        models.SignalSizeDataProvider = SizeDataProviderStub
+
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=get_current_period(), usage=100)
+        self.reserver = QuotaReserver(self.USER_ID)
+
+    def tearDown(self):
+        reservations.CheckQuotaLimit, models.CheckQuotaLimit, models.SignalSizeDataProvider = self._patched
+
+    def _get_usage(self, period=None):
+        return NotesQuotaUsage.objects.get(user_id=self.USER_ID, period=period or get_current_period()).usage
+
+    def test_reserve_accounts_bytes_before_upload(self):
+        self.reserver.reserve(30)
+
+        self.assertEqual(self._get_usage(), 130)
+        self.assertRaises(TotalQuotaLimitError, QuotaReserver(self.USER_ID).reserve, 30)
+
+    def test_commit_accounts_actual_size(self):
+        token = self.reserver.reserve(30)
+        self.reserver.commit(token, 20, NoteStub(self.USER_ID))
+
+        self.assertEqual(self._get_usage(), 120)
+
+    def test_save_of_committed_upload_is_not_charged_again(self):
+        note = NoteStub(self.USER_ID)
+        token = self.reserver.reserve(30)
+        self.reserver.commit(token, 30, note)
+
+        # save of the note with the attachment and 5 bytes of text
+        QuotaValidator(note, 0, 35).validate()
+        self.assertEqual(self._get_usage(), 135)
+
+        # mark is consumed by the save
+        QuotaValidator(note, 35, 40).validate()
+        self.assertEqual(self._get_usage(), 140)
+
+    def test_repeated_commit_is_ignored(self):
+        token = self.reserver.reserve(30)
+        self.reserver.commit(token, 20, NoteStub(self.USER_ID))
+        self.reserver.commit(token, 20, NoteStub(self.USER_ID))
+
+        self.assertEqual(self._get_usage(), 120)
+
+    def test_failed_commit_gives_reserved_bytes_back(self):
+        token = self.reserver.reserve(30)
+
+        self.assertRaises(TotalQuotaLimitError, self.reserver.commit, token, 80, NoteStub(self.USER_ID))
+        self.assertEqual(self._get_usage(), 100)
+
+        # reservation is released by the failed commit
+        self.reserver.release(token)
+        self.assertEqual(self._get_usage(), 100)
+
+    def test_expired_reservations_are_released_when_limit_is_hit(self):
+        token = self.reserver.reserve(30)
+        QuotaReservation.objects.filter(id=token).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.reserver.reserve(40)
+        self.assertEqual(self._get_usage(), 140)
+
+    def test_commit_is_accounted_into_period_of_reservation(self):
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=self.PAST_PERIOD, usage=50)
+        QuotaReservation.objects.create(
+            id='a' * 32, user_id=self.USER_ID, period=self.PAST_PERIOD, size=30,
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+
+        self.reserver.commit('a' * 32, 40, NoteStub(self.USER_ID))
+
+        self.assertEqual(self._get_usage(self.PAST_PERIOD), 60)
+        self.assertEqual(self._get_usage(), 100)
+
+    def test_commit_of_expired_reservation_accounts_from_scratch(self):
+        token = self.reserver.reserve(30)
+        QuotaReservation.objects.filter(id=token).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(QuotaReserver.release_expired(self.USER_ID), 1)
+        self.assertEqual(self._get_usage(), 100)
+
+        self.reserver.commit(token, 20, NoteStub(self.USER_ID))
+        self.assertEqual(self._get_usage(), 120)
+
+    def test_release_gives_bytes_back_once(self):
+        token = self.reserver.reserve(30)
+
+        self.reserver.release(token)
+        self.reserver.release(token)
+
+        self.assertEqual(self._get_usage(), 100)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from pkg.utils.s3 import S3MultipartWriter, UploadSizeLimitError
+from pkg.quota import uploads
+from pkg.quota.models import NotesQuotaUsage, NoteQuotaLimitError, TotalQuotaLimitError, get_current_period
+from pkg.quota.uploads import QuotaUploadHandler
+from .usage import QuotaCheckerStub
+
+
+__all__ = ['TestS3MultipartWriter', 'TestQuotaUploadHandler', ]
+
+
+class MultipartUploadStub(object):
+    def __init__(self):
+        self.parts = []
+        self.completed = False
+        self.cancelled = False
+
+    def upload_part_from_file(self, fp, part_num):
+        self.parts.append((part_num, fp.read(), ))
+
+    def complete_upload(self):
+        self.completed = True
+
+    def cancel_upload(self):
+        self.cancelled = True
+
+
+class KeyStub(object):
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    def set_contents_from_file(self, fp, headers=None, policy=None):
+        self.bucket.files[self.name] = fp.read()
+
+
+class BucketStub(object):
+    def __init__(self):
+        self.files = {}
+        self.uploads = []
+
+    def initiate_multipart_upload(self, name, headers=None, policy=None):
+        self.uploads.append(MultipartUploadStub())
+        return self.uploads[-1]
+
+    def new_key(self, name):
+        return KeyStub(self, name)
+
+
+class SmallPartWriter(S3MultipartWriter):
+    PART_SIZE = 4
+
+
+class FailingUploadStub(MultipartUploadStub):
+    def upload_part_from_file(self, fp, part_num):
+        raise IOError('S3 is not available')
+
+
+class FailingBucketStub(BucketStub):
+    def initiate_multipart_upload(self, name, headers=None, policy=None):
+        self.uploads.append(FailingUploadStub())
+        return self.uploads[-1]
+
+
+class StorageStub(object):
+    default_acl = 'private'
+
+    def __init__(self):
+        self.bucket = BucketStub()
+
+    def _clean_name(self, name):
+        return name
+
+    def _normalize_name(self, name):
+        return name
+
+    def open_writer(self, name, max_size=None, content_type=None):
+        return SmallPartWriter(self, name, max_size, content_type)
+
+
+class TestS3MultipartWriter(TestCase):
+    def setUp(self):
+        self.storage = StorageStub()
+
+    def test_small_file_is_uploaded_by_single_request(self):
+        writer = self.storage.open_writer('a.txt')
+        writer.write(b'abc')
+
+        self.assertEqual(writer.close(), 'a.txt')
+        self.assertEqual(self.storage.bucket.files, {'a.txt': b'abc'})
+        self.assertEqual(self.storage.bucket.uploads, [])
+
+    def test_large_file_is_uploaded_by_parts(self):
+        writer = self.storage.open_writer('a.txt')
+        for chunk in (b'ab', b'cdef', b'gh', b'i', ):
+            writer.write(chunk)
+        writer.close()
+
+        upload, = self.storage.bucket.uploads
+        self.assertEqual(upload.parts, [(1, b'abcdef', ), (2, b'ghi', )])
+        self.assertTrue(upload.completed)
+
+    def test_upload_over_limit_is_aborted(self):
+        writer = self.storage.open_writer('a.txt', max_size=6)
+        writer.write(b'abcde')
+
+        with self.assertRaises(UploadSizeLimitError) as context:
+            writer.write(b'fg')
+
+        self.assertEqual((context.exception.size, context.exception.max_size, ), (7, 6, ))
+        self.assertTrue(self.storage.bucket.uploads[0].cancelled)
+
+
+class TestQuotaUploadHandler(TestCase):
+    multi_db = True
+    USER_ID = 42
+
+    def setUp(self):
+        self._patched = uploads.CheckQuotaLimit
+        uploads.CheckQuotaLimit = QuotaCheckerStub
+
+        # limits of the stub: note - 40 bytes, total - 150 bytes
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=get_current_period(), usage=100)
+        self.storage = StorageStub()
+
+    def tearDown(self):
+        uploads.CheckQuotaLimit = self._patched
+
+    def _get_handler(self, note_size=0):
+        return QuotaUploadHandler(user_id=self.USER_ID, note_size=note_size, storage=self.storage)
+
+    def _upload(self, handler, chunks, content_length=None):
+        handler.new_file('file', 'a.txt', 'text/plain', content_length)
+
+        start = 0
+        for chunk in chunks:
+            handler.receive_data_chunk(chunk, start)
+            start += len(chunk)
+
+        return handler.file_complete(start)
+
+    def test_upload_within_limits(self):
+        handler = self._get_handler()
+        uploaded = self._upload(handler, [b'abc', b'def'])
+
+        self.assertEqual((uploaded.name, uploaded.size, ), ('a.txt', 6, ))
+        self.assertEqual(handler.quota_checker.usage, 106)
+
+    def test_declared_size_over_limit_is_rejected_before_upload(self):
+        handler = self._get_handler()
+
+        self.assertRaises(NoteQuotaLimitError, self._upload, handler, [b'abc'], 41)
+        self.assertEqual(self.storage.bucket.files, {})
+
+    def test_upload_is_aborted_as_soon_as_it_exceeds_limit(self):
+        handler = self._get_handler(note_size=30)
+
+        self.assertRaises(NoteQuotaLimitError, self._upload, handler, [b'abcdef', b'ghijkl'])
+        self.assertTrue(self.storage.bucket.uploads[0].cancelled)
+
+    def test_next_file_is_limited_by_what_is_left(self):
+        handler = self._get_handler()
+        self._upload(handler, [b'x' * 35])
+
+        # 35 bytes of the note are used by the first file of the request
+        self.assertRaises(NoteQuotaLimitError, self._upload, handler, [b'x' * 20])
+
+    def test_upload_over_total_limit(self):
+        NotesQuotaUsage.objects.filter(user_id=self.USER_ID).update(usage=140)
+
+        self.assertRaises(TotalQuotaLimitError, self._upload, self._get_handler(), [b'x' * 15])
+
+    def test_upload_is_aborted_by_handler_on_limit(self):
+        handler = self._get_handler(note_size=30)
+
+        self.assertRaises(NoteQuotaLimitError, self._upload, handler, [b'abcdef', b'ghijkl'])
+        self.assertIsNone(handler.writer)
+
+    def test_upload_is_aborted_on_storage_failure(self):
+        self.storage.bucket = FailingBucketStub()
+        handler = self._get_handler()
+
+        self.assertRaises(IOError, self._upload, handler, [b'abcdef'])
+        self.assertTrue(self.storage.bucket.uploads[0].cancelled)
+        self.assertIsNone(handler.writer)
+
+    def test_incomplete_file_is_aborted_by_next_one(self):
+        handler = self._get_handler()
+        handler.new_file('file', 'a.txt', 'text/plain', None)
+        handler.receive_data_chunk(b'abcdef', 0)
+
+        # the file is skipped, so it's not completed
+        self._upload(handler, [b'abc'])
+
+        self.assertTrue(self.storage.bucket.uploads[0].cancelled)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from pkg.quota.models import NotesQuotaUsage, CheckQuotaLimit, TotalQuotaLimitError, get_current_period
+from pkg.quota.counters import DatabaseQuotaCounter
+
+
+__all__ = ['TestQuotaConsume', 'QuotaCheckerStub', ]
+
+
+class LimitsStub(object):
+    note_max_size = 40
+    total_max_size = 150
+    attachments_max_size = 500
+
+
+class QuotaCheckerStub(CheckQuotaLimit):
+    """
+    Checker with fixed limits and DB counter, so neither premium status nor config storage is touched
+    """
+    def _get_limits(self):
+        return LimitsStub()
+
+    def _get_counter(self):
+        return DatabaseQuotaCounter()
+
+
+class TestQuotaConsume(TestCase):
+    multi_db = True
+    USER_ID = 42
+
+    def setUp(self):
+        NotesQuotaUsage.objects.create(user_id=self.USER_ID, period=get_current_period(), usage=100)
+
+    def _get_usage(self):
+        return NotesQuotaUsage.objects.get(user_id=self.USER_ID, period=get_current_period()).usage
+
+    def test_increment_within_limit(self):
+        self.assertTrue(NotesQuotaUsage.objects.increment(self.USER_ID, 50, 150, period=get_current_period()))
+        self.assertEqual(self._get_usage(), 150)
+
+    def test_increment_over_limit_is_rejected(self):
+        self.assertFalse(NotesQuotaUsage.objects.increment(self.USER_ID, 51, 150, period=get_current_period()))
+        self.assertEqual(self._get_usage(), 100)
+
+    def test_decrement_ignores_limit(self):
+        self.assertTrue(NotesQuotaUsage.objects.increment(self.USER_ID, -10, 50, period=get_current_period()))
+        self.assertEqual(self._get_usage(), 90)
+
+    def test_increment_of_missing_record_fails(self):
+        self.assertFalse(NotesQuotaUsage.objects.increment(self.USER_ID + 1, 10, period=get_current_period()))
+
+    def test_consume_accounts_size(self):
+        quota_checker = QuotaCheckerStub(self.USER_ID)
+        quota_checker.consume(50)
+
+        self.assertEqual(quota_checker.usage, 150)
+        self.assertEqual(self._get_usage(), 150)
+
+    def test_consume_over_limit_raises_and_keeps_usage(self):
+        quota_checker = QuotaCheckerStub(self.USER_ID)
+
+        self.assertRaises(TotalQuotaLimitError, quota_checker.consume, 51)
+        self.assertEqual(quota_checker.usage, 100)
+        self.assertEqual(self._get_usage(), 100)
+
+    def test_consume_is_not_outdated_by_concurrent_save(self):
+        quota_checker = QuotaCheckerStub(self.USER_ID)
+        # another process has accounted its save after the checker read the usage
+        NotesQuotaUsage.objects.increment(self.USER_ID, 40, period=get_current_period())
+
+        self.assertRaises(TotalQuotaLimitError, quota_checker.consume, 20)
+        self.assertEqual(self._get_usage(), 140)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from pkg.utils.s3 import S3BotoStorage, UploadSizeLimitError
+from models import CheckQuotaLimit
+
+
+__all__ = ['QuotaUploadHandler', ]
+
+
+class QuotaUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded attachments directly into S3 and aborts upload as soon as it exceeds
+    the attachment, note or total limit of the user.
+
+    Has to be installed before request.FILES is accessed:
+        request.upload_handlers = [QuotaUploadHandler(request, note_size=note_size)]
+
+    Django 1.x does not call upload_interrupted(), so the upload is aborted by the handler itself
+    before any error is raised out of it
+    """
+
+    def __init__(self, request=None, user_id=None, note_size=0, storage=None):
+        """
+        :param HttpRequest request: current request
+        :param int user_id: owner of note. Current user by default
+        :param int note_size: current size of note (text + attachments), in bytes
+        :param S3BotoStorageBase storage: storage of attachments
+        """
+        super(QuotaUploadHandler, self).__init__(request)
+
+        self.user_id = user_id if user_id is not None else request.user.pk
+        self.note_size = note_size or 0
+        self.storage = storage or S3BotoStorage()
+        self.quota_checker = None
+        self.writer = None
+
+    def _get_max_size(self):
+        limits = self.quota_checker.limits
+
+        return min(
+            limits.attachments_max_size,
+            limits.note_max_size - self.note_size,
+            limits.total_max_size - self.quota_checker.usage,
+        )
+
+    def _check_limits(self, size):
+        """
+        :raise: AttachmentsQuotaLimitError, NoteQuotaLimitError, TotalQuotaLimitError
+        """
+        self.quota_checker.check_attachment_limit(size)
+        self.quota_checker.check_note_limit(self.note_size + size)
+        self.quota_checker.check_total_limit(size)
+
+    def _abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, *args, **kwargs):
+        # previous file is not completed, e.g. it's skipped by other handler
+        self._abort()
+
+        super(QuotaUploadHandler, self).new_file(
+            field_name, file_name, content_type, content_length, charset, *args, **kwargs)
+
+        if self.quota_checker is None:
+            self.quota_checker = CheckQuotaLimit(self.user_id)
+
+        # declared size is known, so there is no need to receive anything
+        if content_length:
+            self._check_limits(content_length)
+
+        self.writer = self.storage.open_writer(file_name, self._get_max_size(), content_type)
+
+    def receive_data_chunk(self, raw_data, start):
+        try:
+            self.writer.write(raw_data)
+        except UploadSizeLimitError as err:
+            self._abort()
+            self._check_limits(err.size)
+            raise
+        except Exception:
+            self._abort()
+            raise
+
+        return None
+
+    def file_complete(self, file_size):
+        try:
+            name = self.writer.close()
+        except Exception:
+            self._abort()
+            raise
+
+        self.writer = None
+
+        # following files of the same request are limited by what is left
+        self.note_size += file_size
+        self.quota_checker.usage += file_size
+
+        return UploadedFile(name=name, content_type=self.content_type, size=file_size, charset=self.charset)
+
+    def upload_interrupted(self):
+        self._abort()
@@ -3,17 +3,21 @@
 from datetime import datetime, timedelta
 
 from django.conf import settings
+from django.core.signals import request_started, request_finished
 from django.dispatch.dispatcher import receiver
 
 from ..notes.models import note_updated
 from ..RedisSession import RSession
 from .errors import *
+from .lastupdate import LastUpdateCoalescer, to_timestamp, from_timestamp, get_settled_time
+from .router import Action, ActionRouter, Optional, parse_batch, BATCH_ACTION, BATCH_MAX_SIZE
+from .transactions import batch_transaction, on_commit
 import json
 
 
 __all__ = [
     'update_cookie', 'update_session_expire', 'request_parser', 'response_builder', 'get_request_action',
-    'BaseActions',
+    'BaseActions', 'Action', 'ActionRouter', 'Optional', 'get_notes_last_update', 'get_changes_since',
 ]
 
 
@@ -25,26 +29,84 @@ class BaseActions(object):
         self.user_id = user_id
 
 
+# bulk edit of notes sends note_updated for each note, but only the latest time of each user is written.
+# RSession writes last update of the user of the current context, so out of request it's written at once,
+# in the context where it's set
+last_updates = LastUpdateCoalescer(lambda user_id, key, value: RSession.set_last_update(key, value), window=0)
+request_started.connect(last_updates.begin, dispatch_uid='last_updates_begin')
+request_finished.connect(last_updates.flush, dispatch_uid='last_updates_flush')
+
+
 @receiver(note_updated)
 def _update_time_changed(**kwargs):
-    RSession.set_last_update('notes_last_update', kwargs['update_time'])
+    # workers send user of note, out of them it's user of the session
+    user_id = kwargs.get('user_id', getattr(kwargs.get('instance'), 'user_id', None))
 
+    # update of rolled back batch is not written
+    on_commit(lambda: last_updates.set(user_id, 'notes_last_update', kwargs['update_time']))
 
-def request_parser(request, allowed_actions):
+
+def get_notes_last_update(request=None):
     """
-    Parse request from client, define and return action type (action handler) and request's body params
+    Last update of notes of the current user, e.g. for conditional_on_last_update. DB is not used
 
-    :param HttpRequest request: request params
+    :param HttpRequest request: request params, not used
+    :return float: unix timestamp or None, if notes were never updated
+    """
+    return to_timestamp(RSession.get_last_update('notes_last_update'))
+
+
+def get_changes_since(queryset, since, field='update_time', settle_time=None):
+    """
+    Delta sync: notes modified after the time, which client is synced to. Client sends back 'lastUpdate'
+    of the previous response as 'since'. DB is not queried, if nothing is changed since then.
+
+    Transactions are committed in any order, so 'lastUpdate' of response is not later than the time,
+    before which all changes are committed, @see get_settled_time. Client may get some notes twice,
+    it merges them by id. Notes deleted from the table are not returned
+
+    Usage:
+        def get_changes(user_id, since=None):
+            notes = NotesNotes.objects.filter(user=user_id).values('id', 'text', 'update_time')
+            return get_changes_since(notes, since)
+
+        'changes': Action(get_changes, {'since': Optional(float)}, read_only=True)
+
+    :param QuerySet queryset: notes of the user
+    :param since: 'lastUpdate' of the previous response, @see to_timestamp. None - all notes
+    :param string field: name of DateTimeField with time of modification of note
+    :param float settle_time: @see get_settled_time
+
+    :return dict: {'notes': queryset or empty list, 'lastUpdate': float, 'full': bool}
+    """
+    last_update = get_notes_last_update()
+    since = to_timestamp(since)
+
+    if since is not None and last_update is not None and since >= last_update:
+        return {'notes': [], 'lastUpdate': since, 'full': False}
+
+    synced_to = get_settled_time(settle_time)
+    if last_update is not None:
+        synced_to = min(synced_to, last_update)
+
+    if since is None:
+        return {'notes': queryset, 'lastUpdate': synced_to, 'full': True}
+
+    return {
+        'notes': queryset.filter(**{field + '__gt': from_timestamp(since)}),
+        'lastUpdate': max(since, synced_to),
+        'full': False,
+    }
+
+
+def _parse_action(request_data, allowed_actions):
+    """
+    :param dict request_data: decoded request: {"action": ..., "body": ...}
     :param dict allowed_actions: dict with allowed actions in format 'action': callable_handler
     :return: {'action': handler, 'body': {}}
     :raise: ParseRequestError
     """
 
-    if request.method != 'POST' or not request.is_ajax() or len(request.body) < 1:
-        raise ParseRequestError(ERROR_INVALID_REQUEST_FORMAT)
-
-    request_data = json.loads(request.body, request.encoding)
-
     if not isinstance(request_data, dict):
         raise ParseRequestError(ERROR_INVALID_REQUEST_FORMAT)
 
@@ -65,6 +127,108 @@ def request_parser(request, allowed_actions):
     }
 
 
+def request_parser(request, allowed_actions):
+    """
+    Parse request from client, define and return action type (action handler) and request's body params.
+    Batch of actions is parsed too, @see parse_batch
+
+    :param HttpRequest request: request params
+    :param dict allowed_actions: dict with allowed actions in format 'action': callable_handler
+    :return: {'action': handler, 'body': {}} or {'batch': [...], 'atomic': bool}
+    :raise: ParseRequestError
+    """
+
+    if request.method != 'POST' or not request.is_ajax() or len(request.body) < 1:
+        raise ParseRequestError(ERROR_INVALID_REQUEST_FORMAT)
+
+    request_data = json.loads(request.body, request.encoding)
+
+    # action named 'batch' in the table has priority
+    is_batch = BATCH_ACTION not in allowed_actions and isinstance(request_data, dict)
+    if is_batch and request_data.get('action') == BATCH_ACTION:
+        return parse_batch(
+            request_data.get('body'),
+            lambda item: _parse_action(item, allowed_actions),
+            getattr(settings, 'ACTIONS_BATCH_MAX_SIZE', BATCH_MAX_SIZE),
+        )
+
+    return _parse_action(request_data, allowed_actions)
+
+
+class _BatchRollback(Exception):
+    def __init__(self, index, error):
+        super(_BatchRollback, self).__init__(index, error)
+        self.index = index
+        self.error = error
+
+
+def _get_error_result(err):
+    return {"errorCode": err.code, "errorMessage": err.message, "body": {}}
+
+
+def _execute_action(user_id, action_handler, request_body):
+    """
+    :return dict: result of action in format of response
+    :raise: BaseError
+    """
+    result = {"errorCode": NO_ERROR, "body": {}}
+
+    user_notes = action_handler(user_id, **request_body)
+    if user_notes is not None:
+        result["body"].update(user_notes)
+
+    return result
+
+
+def _execute_batch(user_id, batch, atomic):
+    """
+    Execute actions of batch. Atomic batch is executed in one transaction and stops on the first error,
+    then results of other actions are ERROR_SAVE_DATA. Otherwise each action is executed in its own transaction.
+    Transaction covers notes and quota databases, @see batch_transaction
+
+    :param int user_id: user's id
+    :param list batch: parsed actions or errors of parsing
+    :param bool atomic: execute all actions in one transaction
+
+    :return tuple: list of results, error of atomic batch or None
+    """
+    results = [None] * len(batch)
+
+    if atomic:
+        try:
+            with batch_transaction():
+                for i, item in enumerate(batch):
+                    if isinstance(item, BaseError):
+                        raise _BatchRollback(i, item)
+
+                    try:
+                        results[i] = _execute_action(user_id, item['action'], item['body'])
+                    except BaseError as err:
+                        raise _BatchRollback(i, err)
+        except _BatchRollback as rollback:
+            not_saved = BaseError(ERROR_SAVE_DATA)
+            results = [
+                _get_error_result(rollback.error if i == rollback.index else not_saved) for i in range(len(batch))
+            ]
+
+            return results, rollback.error
+
+        return results, None
+
+    for i, item in enumerate(batch):
+        if isinstance(item, BaseError):
+            results[i] = _get_error_result(item)
+            continue
+
+        try:
+            with batch_transaction():
+                results[i] = _execute_action(user_id, item['action'], item['body'])
+        except BaseError as err:
+            results[i] = _get_error_result(err)
+
+    return results, None
+
+
 def response_builder(request, parser=None):
     """
 
@@ -90,12 +254,20 @@ def response_builder(request, parser=None):
 
         return result
 
+    if 'batch' in request_result:
+        results, error = _execute_batch(user_id, request_result['batch'], request_result['atomic'])
+        result["body"]["results"] = results
+
+        if error is not None:
+            result['errorCode'] = error.code
+            result['errorMessage'] = error.message
+
+        return result
+
     action_handler = request_result['action']
     request_body = request_result['body']
     try:
-        user_notes = action_handler(user_id, **request_body)
-        if user_notes is not None:
-            result["body"].update(user_notes)
+        result.update(_execute_action(user_id, action_handler, request_body))
     except BaseError as err:
         result['errorCode'] = err.code
         result['errorMessage'] = err.message
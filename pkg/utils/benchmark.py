@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of ActionRouter against request_parser and get_request_action. Usage:
+
+    python -m pkg.utils.benchmark --count 100000
+"""
+
+import json
+import timeit
+import argparse
+
+from .actions import request_parser, get_request_action, Action, ActionRouter, Optional
+
+
+class _Request(object):
+    method = 'POST'
+    encoding = None
+
+    def __init__(self, body):
+        self.body = body
+
+    def is_ajax(self):
+        return True
+
+
+def _handler(user_id, **body):
+    return body
+
+
+def _get_legacy_actions():
+    def notes(body):
+        return get_request_action({
+            'get': lambda: {'handler': _handler, 'body': body['get']},
+            'save': lambda: {'handler': _handler, 'body': body['save']},
+            'delete': lambda: {'handler': _handler, 'body': body['delete']},
+        }, body)
+
+    return {'notes': notes}
+
+
+def _get_router(validate=True):
+    text_type = unicode if str is bytes else str
+
+    return ActionRouter({
+        'notes': ActionRouter({
+            'get': Action(_handler, {'offset': int, 'limit': Optional(int)} if validate else None),
+            'save': Action(_handler, {'id': int, 'text': text_type, 'tags': Optional([int])} if validate else None),
+            'delete': Action(_handler, {'ids': [int]} if validate else None),
+        }),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000, help='count of parsed requests')
+    args = parser.parse_args()
+
+    request = _Request(json.dumps({
+        'action': 'notes',
+        'body': {'save': {'id': 1, 'text': '<p>note</p>', 'tags': [1, 2, 3]}},
+    }))
+    legacy_actions = _get_legacy_actions()
+    router = _get_router()
+    plain_router = _get_router(validate=False)
+
+    assert request_parser(request, legacy_actions) == router.parse(request)
+
+    for title, func in (
+        ('request_parser', lambda: request_parser(request, legacy_actions)),
+        ('ActionRouter.parse', lambda: router.parse(request)),
+        ('ActionRouter.parse, no schemas', lambda: plain_router.parse(request)),
+        ('json.loads only', lambda: json.loads(request.body)),
+    ):
+        elapsed = timeit.timeit(func, number=args.count)
+        print('%-32s %8.2f us' % (title, elapsed * 1e6 / args.count))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ __all__ = ['QuotaRouter', ]
 
 class QuotaRouter(object):
     DB_NAME = u'xxxx'
-    DB_MODELS = [u'NotesQuota', ]
+    DB_MODELS = [u'NotesQuota', u'NotesQuotaUsage', u'NotesQuotaUsageArchive', u'QuotaReservation', ]
 
     def db_for_read(self, model, **hints):
         return self.DB_NAME if unicode(getattr(model, '__name__', None)) in self.DB_MODELS else None
@@ -1,18 +1,311 @@
 # -*- coding: utf-8 -*-
 
+import re
 import json
+import hashlib
+from importlib import import_module
 
-from django.http import HttpResponse
+try:
+    from collections.abc import Iterator
+except ImportError:
+    from collections import Iterator
+
+from django.conf import settings
+from django.db.models.query import QuerySet
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import patch_cache_control
 from django.utils.functional import update_wrapper
+from django.utils.http import http_date, parse_http_date_safe
+
+from .errors import NO_ERROR
+from .lastupdate import to_timestamp, is_settled
+
+
+__all__ = ['render_to_json', 'iter_json', 'conditional_on_last_update', ]
+
+
+try:
+    _STRING_TYPES = (basestring, )
+except NameError:
+    _STRING_TYPES = (str, )
+
+try:
+    _PRIMITIVE_TYPES = frozenset((str, unicode, int, long, float, bool, type(None), ))
+    _KEY_TYPES = frozenset((str, unicode, ))
+except NameError:
+    _PRIMITIVE_TYPES = frozenset((str, int, float, bool, type(None), ))
+    _KEY_TYPES = frozenset((str, ))
+
+# encoder is reused, it's stateless
+_default_dumps = DjangoJSONEncoder().encode
+_dumps = None
+
+
+def _is_primitive(value):
+    """
+    Whether the value consists of json types only. Fast encoders differ from DjangoJSONEncoder on other types,
+    e.g. ujson encodes datetime as timestamp and Decimal as float
+    """
+    value_type = type(value)
+
+    if value_type in _PRIMITIVE_TYPES:
+        return True
+
+    if value_type is list or value_type is tuple:
+        for item in value:
+            if not _is_primitive(item):
+                return False
+
+        return True
+
+    if value_type is dict:
+        for key, item in value.items():
+            if type(key) not in _KEY_TYPES or not _is_primitive(item):
+                return False
+
+        return True
+
+    return False
+
+
+def _get_dumps():
+    """
+    Encoder of values: the fast one from JSON_FAST_DUMPS setting (e.g. 'ujson.dumps'), if it's installed.
+    It's used for values of json types only, @see _is_primitive. Others are encoded by DjangoJSONEncoder
+
+    :return callable: value => string
+    """
+    global _dumps
+
+    if _dumps is None:
+        _dumps = _default_dumps
+        path = getattr(settings, 'JSON_FAST_DUMPS', None)
+
+        if path:
+            module_name, name = path.rsplit('.', 1)
+            try:
+                fast_dumps = getattr(import_module(module_name), name)
+            except (ImportError, AttributeError, ):
+                fast_dumps = None
+
+            if fast_dumps is not None:
+                def _dumps(value):
+                    if not _is_primitive(value):
+                        return _default_dumps(value)
+
+                    try:
+                        return fast_dumps(value)
+                    except (TypeError, ValueError, OverflowError, ):
+                        return _default_dumps(value)
+
+    return _dumps
+
+
+# types of values, which are never lazy. Check of them is cheaper than isinstance of Iterator
+_PLAIN_TYPES = frozenset(_STRING_TYPES + (str, int, float, bool, type(None), list, tuple, ))
+
+
+def _is_lazy(value):
+    return type(value) not in _PLAIN_TYPES and isinstance(value, (QuerySet, Iterator, ))
+
+
+def _has_lazy(value):
+    """
+    Lazy values are looked for in dicts only, lists are encoded as is
+    """
+    if type(value) is dict:
+        for item in value.values():
+            if _has_lazy(item):
+                return True
+
+        return False
+
+    return _is_lazy(value)
+
+
+def _iter_encode(value, dumps):
+    if not _has_lazy(value):
+        yield dumps(value)
+    elif isinstance(value, dict):
+        yield '{'
+
+        for i, (key, item) in enumerate(value.items()):
+            if not isinstance(key, _STRING_TYPES):
+                # the same conversion of keys as json does
+                key = json.dumps(key)
+
+            yield '%s%s: ' % (', ' if i else '', dumps(key))
+            for chunk in _iter_encode(item, dumps):
+                yield chunk
+
+        yield '}'
+    elif _is_lazy(value):
+        yield '['
+
+        # queryset is not cached
+        for i, item in enumerate(value.iterator() if isinstance(value, QuerySet) else value):
+            if i:
+                yield ', '
 
+            for chunk in _iter_encode(item, dumps):
+                yield chunk
 
-__all__ = ['render_to_json', ]
+        yield ']'
+
+
+def iter_json(value, buffer_size=64 * 1024):
+    """
+    Encode value to json incrementally. Generators, iterators and querysets (in dicts or in each other)
+    are encoded as lists as they are iterated, so the whole json is never kept in memory
+
+    :param value: value to encode
+    :param int buffer_size: min size of yielded chunks, in characters
+
+    :return generator: chunks of json
+    """
+    buffered = []
+    size = 0
+
+    for chunk in _iter_encode(value, _get_dumps()):
+        buffered.append(chunk)
+        size += len(chunk)
+
+        if size >= buffer_size:
+            yield ''.join(buffered)
+            buffered = []
+            size = 0
+
+    if buffered:
+        yield ''.join(buffered)
 
 
 def render_to_json(func):
+    """
+    Render result of view to json response. Result with generators, iterators or querysets in its dicts
+    is streamed, @see iter_json. Other results are rendered at once
+    """
     def wrapper(request, *args, **kwargs):
         result = func(request, *args, **kwargs)
+
+        if _has_lazy(result):
+            buffer_size = getattr(settings, 'JSON_STREAM_BUFFER_SIZE', 64 * 1024)
+            return StreamingHttpResponse(iter_json(result, buffer_size), content_type="application/json")
+
         json_data = json.dumps(result, cls=DjangoJSONEncoder)
-        return HttpResponse(json_data, mimetype="application/json")
+        response = HttpResponse(json_data, mimetype="application/json")
+
+        if isinstance(result, dict) and result.get('errorCode', NO_ERROR) != NO_ERROR:
+            # errors of response_builder may be temporary, they are never validated by last update
+            patch_cache_control(response, no_store=True)
+
+        return response
     return update_wrapper(wrapper, func)
+
+
+_ETAG = re.compile(r'(?:W/)?"([^"]*)"')
+
+
+def _get_etag(request, last_update, request_key):
+    """
+    Response of POST depends on its body, e.g. on action
+    """
+    session = getattr(request, 'session', None)
+
+    etag = hashlib.md5()
+    etag.update(('%r:%s:%s:' % (
+        last_update, getattr(session, 'session_key', None), request.get_full_path(),
+    )).encode('utf-8'))
+
+    if isinstance(request_key, bytes):
+        etag.update(request_key)
+    elif request_key is not None:
+        etag.update(request_key.encode('utf-8'))
+
+    return etag.hexdigest()
+
+
+def _get_not_modified_response(request):
+    """
+    Only GET and HEAD may be answered by 304. Response to other methods tells that the data is the same,
+    in format of response_builder
+    """
+    if request.method in ('GET', 'HEAD', ):
+        return HttpResponseNotModified()
+
+    return HttpResponse(
+        json.dumps({"errorCode": NO_ERROR, "body": {}, "notModified": True}), mimetype="application/json")
+
+
+def _is_not_modified(request, etag, last_modified):
+    """
+    :param HttpRequest request: request params
+    :param string etag: etag of the current response
+    :param int last_modified: unix timestamp of the current response
+
+    :return bool: whether the client has the current response
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # If-Modified-Since is ignored, if client sends etags
+        return if_none_match.strip() == '*' or etag in _ETAG.findall(if_none_match)
+
+    # date does not tell which request it's about, so responses of other methods are validated by etag only
+    if request.method not in ('GET', 'HEAD', ):
+        return False
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def conditional_on_last_update(get_last_update, is_cacheable=None, settle_time=None, get_request_key=None):
+    """
+    Conditional requests validated by last update of the data, e.g. by notes_last_update.
+    Client gets 304 (or {"notModified": true} for POST) while the last update is the same,
+    the view is not called at all. It's put above render_to_json:
+
+        @conditional_on_last_update(get_notes_last_update, router.is_read_only, get_request_key=router.get_cache_key)
+        @render_to_json
+        def notes(request):
+            return response_builder(request, router.parse)
+
+    ETag depends on the last update, session and request (key of POST too), so different actions
+    of the same url are cached separately. Last update, which is not settled yet, and errors are not validated
+
+    :param callable get_last_update: request => last update of the data, @see to_timestamp. It should not use DB
+    :param callable is_cacheable: request => whether response depends on the data only. GET and HEAD by default
+    :param float settle_time: @see is_settled
+    :param callable get_request_key: request => string, which identifies response besides url and session,
+        e.g. ActionRouter.get_cache_key. Body of POST by default
+    """
+    if is_cacheable is None:
+        is_cacheable = lambda request: request.method in ('GET', 'HEAD', )
+
+    if get_request_key is None:
+        get_request_key = lambda request: request.body if request.method == 'POST' else None
+
+    def decorator(func):
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return func(request, *args, **kwargs)
+
+            last_update = to_timestamp(get_last_update(request))
+            if last_update is None or not is_settled(last_update, settle_time):
+                return func(request, *args, **kwargs)
+
+            etag = _get_etag(request, last_update, get_request_key(request))
+            last_modified = int(last_update)
+
+            if _is_not_modified(request, etag, last_modified):
+                response = _get_not_modified_response(request)
+            else:
+                response = func(request, *args, **kwargs)
+                if response.status_code != 200 or 'no-store' in response.get('Cache-Control', ''):
+                    return response
+
+            response['ETag'] = '"%s"' % etag
+            response['Last-Modified'] = http_date(last_modified)
+
+            return response
+        return update_wrapper(wrapper, func)
+    return decorator
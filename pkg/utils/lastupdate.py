@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import atexit
+import calendar
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .lru import ExpiringLRUCache
+
+
+__all__ = ['LastUpdateCoalescer', 'to_timestamp', 'from_timestamp', 'get_settled_time', 'is_settled', ]
+
+
+try:
+    _STRING_TYPES = (basestring, )
+    _NUMBER_TYPES = (int, long, float, )
+except NameError:
+    _STRING_TYPES = (str, )
+    _NUMBER_TYPES = (int, float, )
+
+
+def to_timestamp(value):
+    """
+    Convert last update to unix timestamp, which is sent to clients and compared
+
+    :param value: datetime (naive one is in local time), unix timestamp or its string, ISO 8601 string
+
+    :return float: unix timestamp or None, if value is empty or malformed
+    """
+    if isinstance(value, _STRING_TYPES):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+
+        try:
+            value = parse_datetime(value)
+        except ValueError:
+            return None
+
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            seconds = calendar.timegm(value.utctimetuple())
+        else:
+            seconds = time.mktime(value.timetuple())
+
+        return seconds + value.microsecond / 1000000.0
+
+    if isinstance(value, _NUMBER_TYPES) and not isinstance(value, bool):
+        return float(value)
+
+    return None
+
+
+def from_timestamp(timestamp):
+    """
+    :param float timestamp: unix timestamp
+
+    :return datetime: datetime to compare with DateTimeField, aware one if USE_TZ is on
+    """
+    if getattr(settings, 'USE_TZ', False):
+        return datetime.fromtimestamp(timestamp, timezone.utc)
+
+    return datetime.fromtimestamp(timestamp)
+
+
+def get_settled_time(settle_time=None):
+    """
+    Last update is written after commit of transaction, but transactions are committed in any order,
+    so the written value may hide changes, which are committed later with earlier timestamps.
+    All changes before the time longest transaction ago are committed
+
+    :param float settle_time: max duration of transaction, in seconds. LAST_UPDATE_SETTLE_TIME by default
+
+    :return float: unix timestamp, all changes before it are committed
+    """
+    if settle_time is None:
+        settle_time = getattr(settings, 'LAST_UPDATE_SETTLE_TIME', 5.0)
+
+    return time.time() - settle_time
+
+
+def is_settled(timestamp, settle_time=None):
+    """
+    :param float timestamp: last update, unix timestamp
+    :param float settle_time: @see get_settled_time
+
+    :return bool: whether all changes before the last update are committed
+    """
+    return timestamp <= get_settled_time(settle_time)
+
+
+def _merge(values, key, value):
+    current = values.get(key)
+    if current is None or value > current:
+        values[key] = value
+
+
+class LastUpdateCoalescer(object):
+    """
+    Write-behind of last update timestamps of users, where only the maximum matters.
+
+    Timestamps are buffered per user and key. Ones set during request are buffered per thread and written once
+    at the end of request, i.e. after its transaction is committed. Ones set out of request (commands, workers)
+    are buffered per process and written once per window. Timestamp without user is known only to the context
+    where it's set, so out of request it's written at once.
+
+    Buffers are flushed in any order, so the process keeps the last written timestamp of each user and key,
+    and an older or equal one is not written over it.
+
+    Usage:
+        last_updates = LastUpdateCoalescer(lambda user_id, key, value: ...)
+        request_started.connect(last_updates.begin)
+        request_finished.connect(last_updates.flush)
+
+        last_updates.set(user_id, 'notes_last_update', update_time)
+    """
+    # bound methods are connected to signals by weak references
+    __slots__ = (
+        '__writer', '__window', '__local', '__lock', '__shared', '__timer', '__pid', '__written', '__write_lock',
+        '__weakref__',
+    )
+
+    def __init__(self, writer, window=1.0, written_size=10000):
+        """
+        :param callable writer: writer of timestamp, writer(user_id, key, value)
+        :param float window: max delay of timestamps set out of request, in seconds. 0 - write them immediately
+        :param int written_size: max count of users and keys, whose last written timestamps are kept
+        """
+        self.__writer = writer
+        self.__window = window
+        self.__local = threading.local()
+        self.__written = ExpiringLRUCache(max_size=written_size, ttl=0)
+        self.__pid = None
+        self._reset()
+
+        atexit.register(self.flush_shared)
+
+    def _reset(self):
+        # timer and lock are not inherited by forked process
+        self.__lock = threading.Lock()
+        self.__write_lock = threading.Lock()
+        self.__shared = {}
+        self.__timer = None
+        self.__pid = os.getpid()
+
+    def begin(self, **kwargs):
+        """
+        Start buffering of the current thread, e.g. by request_started signal
+        """
+        self.__local.pending = {}
+
+    def flush(self, **kwargs):
+        """
+        Write timestamps buffered by the current thread and stop buffering, e.g. by request_finished signal
+        """
+        pending = getattr(self.__local, 'pending', None)
+        self.__local.pending = None
+
+        if pending:
+            self._write(pending)
+
+    def flush_shared(self):
+        """
+        Write timestamps buffered out of request
+        """
+        with self.__lock:
+            shared, self.__shared, self.__timer = self.__shared, {}, None
+
+        if shared:
+            self._write(shared)
+
+    def set(self, user_id, key, value):
+        """
+        :param int user_id: user's id. None - user of the current context, e.g. of session
+        :param string key: name of timestamp
+        :param value: timestamp
+        """
+        pending = getattr(self.__local, 'pending', None)
+        if pending is not None:
+            return _merge(pending, (user_id, key, ), value)
+
+        if not self.__window or user_id is None:
+            return self._write({(user_id, key, ): value})
+
+        if self.__pid != os.getpid():
+            self._reset()
+
+        with self.__lock:
+            _merge(self.__shared, (user_id, key, ), value)
+
+            if self.__timer is None:
+                self.__timer = threading.Timer(self.__window, self.flush_shared)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def _write(self, values):
+        """
+        :param dict values: (user_id, key) => timestamp
+        """
+        for (user_id, key), value in values.items():
+            # users of the contexts are unknown, so their timestamps can't be compared
+            if user_id is None:
+                self.__writer(user_id, key, value)
+                continue
+
+            # lock is held during write, else the older timestamp may be written after the newer one
+            with self.__write_lock:
+                written = self.__written.get((user_id, key, ))
+                if written is not None and not value > written:
+                    continue
+
+                self.__writer(user_id, key, value)
+                self.__written.set((user_id, key, ), value)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from collections import OrderedDict
+
+
+__all__ = ['ExpiringLRUCache', ]
+
+
+class ExpiringLRUCache(object):
+    """
+    Process-local LRU cache with bounded size and per-entry expiration time
+    """
+    __slots__ = ('__items', '__max_size', '__ttl', '__lock', )
+
+    def __init__(self, max_size=10000, ttl=3600):
+        """
+        :param int max_size: max count of cached entries
+        :param int ttl: default time to live of entry, in seconds. 0 - entries expires only by eviction
+        """
+        self.__items = OrderedDict()
+        self.__max_size = int(max_size)
+        self.__ttl = int(ttl)
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__items)
+
+    def _get_expire_time(self, expires_at=None):
+        """
+        Returns nearest time (unix timestamp) of entry expiration
+
+        :param float expires_at: entry specific expiration time
+
+        :return float|None:
+        """
+        default_expire = time.time() + self.__ttl if self.__ttl else None
+
+        if expires_at is None:
+            return default_expire
+
+        if default_expire is None:
+            return expires_at
+
+        return min(expires_at, default_expire)
+
+    def get(self, key, default=None):
+        """
+        Returns cached value or default one if entry is missing or expired
+
+        :param key: hashable key
+        :param default: fallback value
+        """
+        with self.__lock:
+            try:
+                value, expires_at = self.__items.pop(key)
+            except KeyError:
+                return default
+
+            if expires_at is not None and expires_at <= time.time():
+                return default
+
+            # move entry to the end of queue
+            self.__items[key] = (value, expires_at, )
+
+        return value
+
+    def set(self, key, value, expires_at=None):
+        """
+        Store value
+
+        :param key: hashable key
+        :param value: value to store
+        :param float expires_at: unix timestamp, when entry has to be expired
+        """
+        expire_time = self._get_expire_time(expires_at)
+
+        with self.__lock:
+            self.__items.pop(key, None)
+            self.__items[key] = (value, expire_time, )
+
+            while len(self.__items) > self.__max_size:
+                self.__items.popitem(last=False)
+
+    def delete(self, key):
+        with self.__lock:
+            self.__items.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from .errors import *
+
+
+__all__ = ['Action', 'ActionRouter', 'Optional', 'compile_schema', 'parse_batch', 'BATCH_ACTION', 'BATCH_MAX_SIZE', ]
+
+
+try:
+    _STRING_TYPES = (basestring, )
+    _INTEGER_TYPES = (int, long, )
+except NameError:
+    _STRING_TYPES = (str, )
+    _INTEGER_TYPES = (int, )
+
+
+# name of action, which carries the list of actions, @see parse_batch
+BATCH_ACTION = 'batch'
+# max count of actions in one batch
+BATCH_MAX_SIZE = 100
+# attribute of request with its decoded body, @see ActionRouter._decode
+_DATA_ATTRIBUTE = '_action_router_data'
+
+
+class Optional(object):
+    """
+    Marker of optional key of dict schema
+    """
+    __slots__ = ('schema', )
+
+    def __init__(self, schema):
+        self.schema = schema
+
+
+def _any(value):
+    return True
+
+
+def _get_types(value_type):
+    """
+    :param type value_type: type from schema
+
+    :return frozenset: exact types of decoded json values, which match the type. Booleans are not numbers
+    """
+    if value_type in (str, ) + _STRING_TYPES:
+        return frozenset(_STRING_TYPES + (str, ))
+
+    if value_type in _INTEGER_TYPES:
+        return frozenset(_INTEGER_TYPES)
+
+    if value_type is float:
+        return frozenset(_INTEGER_TYPES + (float, ))
+
+    return frozenset((value_type, ))
+
+
+def _compile_type(value_type):
+    types = _get_types(value_type)
+    return lambda value: type(value) in types
+
+
+def _compile_list(schema):
+    if not schema:
+        return lambda value: type(value) is list
+
+    if isinstance(schema[0], type):
+        types = _get_types(schema[0])
+        return lambda value: type(value) is list and set(map(type, value)) <= types
+
+    item_validator = compile_schema(schema[0])
+
+    def validate(value):
+        if type(value) is not list:
+            return False
+
+        for item in value:
+            if not item_validator(item):
+                return False
+
+        return True
+
+    return validate
+
+
+def _compile_dict(schema):
+    required = []
+    optional = []
+
+    for key, item in schema.items():
+        if isinstance(item, Optional):
+            optional.append((key, compile_schema(item.schema), ))
+        else:
+            required.append((key, compile_schema(item), ))
+
+    def validate(value):
+        if type(value) is not dict:
+            return False
+
+        for key, validator in required:
+            if key not in value or not validator(value[key]):
+                return False
+
+        for key, validator in optional:
+            if key in value and not validator(value[key]):
+                return False
+
+        return True
+
+    return validate
+
+
+def compile_schema(schema):
+    """
+    Compile declarative schema of value to validator function.
+
+    Schema is: None (any value), type of json value (int, float, bool, unicode, dict, list), list with schema of items,
+    dict with schemas of keys (Optional ones may be missed, other keys are allowed) or validator function
+
+    :param schema: schema of value
+
+    :return callable: value => bool
+    """
+    if schema is None:
+        return _any
+
+    if isinstance(schema, type):
+        return _compile_type(schema)
+
+    if isinstance(schema, list):
+        return _compile_list(schema)
+
+    if isinstance(schema, dict):
+        return _compile_dict(schema)
+
+    if callable(schema):
+        return schema
+
+    raise TypeError('Unsupported schema: %r' % (schema, ))
+
+
+def parse_batch(body, parse_item, max_size=BATCH_MAX_SIZE):
+    """
+    Parse body of batch action: {"actions": [{"action": ..., "body": ...}, ...], "atomic": true}.
+    Atomic batch is executed in one transaction, otherwise each action is executed separately
+
+    :param body: body of batch action
+    :param callable parse_item: parser of single action, request data => {'action': handler, 'body': {}}
+    :param int max_size: max count of actions
+
+    :return dict: {'batch': [parsed action or ParseRequestError, ...], 'atomic': bool}
+    :raise: ParseRequestError
+    """
+    actions = body.get('actions') if isinstance(body, dict) else None
+    if not isinstance(actions, list) or not actions or len(actions) > max_size:
+        raise ParseRequestError(ERROR_INVALID_REQUEST_BODY)
+
+    batch = []
+    for item in actions:
+        try:
+            batch.append(parse_item(item))
+        except ParseRequestError as err:
+            batch.append(err)
+
+    return {
+        'batch': batch,
+        'atomic': bool(body.get('atomic', True)),
+    }
+
+
+class Action(object):
+    """
+    Handler of action with schema of its body
+    """
+    __slots__ = ('handler', 'read_only', '__validator', )
+
+    def __init__(self, handler, schema=None, read_only=False):
+        """
+        :param callable handler: handler of action, it's called as handler(user_id, **body)
+        :param schema: schema of body, @see compile_schema. Body is not validated by default
+        :param bool read_only: the action does not change data, so its response may be cached by client
+        """
+        self.handler = handler
+        self.read_only = read_only
+        self.__validator = compile_schema(schema)
+
+    def __call__(self, body):
+        """
+        :param body: body of action
+
+        :return dict: {'handler': handler, 'body': body, 'read_only': bool}
+        :raise: ParseRequestError
+        """
+        if not self.__validator(body):
+            raise ParseRequestError(ERROR_INVALID_REQUEST_BODY)
+
+        return {
+            'handler': self.handler,
+            'body': body,
+            'read_only': self.read_only,
+        }
+
+
+class ActionRouter(object):
+    """
+    Router of requests, which is built once from the table of allowed actions.
+    It's a compiled counterpart of request_parser and get_request_action with the same error codes.
+
+    Values of the table are Action, nested ActionRouter (it selects sub-action by the only known key of body)
+    or legacy callable, which takes body and returns {'handler': handler, 'body': body}.
+
+    Batch of actions is parsed too, @see parse_batch.
+
+    Usage:
+        router = ActionRouter({
+            'notes': ActionRouter({
+                'get': Action(get_notes, {'offset': int, 'limit': Optional(int)}, read_only=True),
+                'delete': Action(delete_notes, {'ids': [int]}),
+            }),
+        })
+
+        response_builder(request, router.parse)
+    """
+    __slots__ = ('__actions', '__batch_max_size', )
+
+    def __init__(self, actions, batch_max_size=BATCH_MAX_SIZE):
+        """
+        :param dict actions: name of action => Action, ActionRouter or callable
+        :param int batch_max_size: max count of actions in one batch
+        """
+        self.__actions = dict(actions)
+        self.__batch_max_size = batch_max_size
+
+    def _decode(self, request):
+        """
+        Decoded body is kept by the request, so it's decoded once by is_read_only, get_cache_key and parse
+
+        :param HttpRequest request: request params
+
+        :return: decoded body
+        :raise: ParseRequestError
+        """
+        if not hasattr(request, _DATA_ATTRIBUTE):
+            request_data = None
+
+            if request.method == 'POST' and request.body and request.is_ajax():
+                try:
+                    request_data = {'data': json.loads(request.body, request.encoding)}
+                except ValueError:
+                    pass
+
+            setattr(request, _DATA_ATTRIBUTE, request_data)
+
+        request_data = getattr(request, _DATA_ATTRIBUTE)
+        if request_data is None:
+            raise ParseRequestError(ERROR_INVALID_REQUEST_FORMAT)
+
+        return request_data['data']
+
+    def parse(self, request):
+        """
+        Parse request from client, @see request_parser
+
+        :param HttpRequest request: request params
+
+        :return dict: {'action': handler, 'body': {}} or parsed batch
+        :raise: ParseRequestError
+        """
+        request_data = self._decode(request)
+
+        # action named 'batch' in the table has priority
+        is_batch = BATCH_ACTION not in self.__actions and isinstance(request_data, dict)
+        if is_batch and request_data.get('action') == BATCH_ACTION:
+            return parse_batch(request_data.get('body'), self._parse_data, self.__batch_max_size)
+
+        return self._parse_data(request_data)
+
+    def _parse_data(self, request_data):
+        """
+        :param dict request_data: decoded request: {"action": ..., "body": ...}
+
+        :return dict: {'action': handler, 'body': {}, 'read_only': bool}
+        :raise: ParseRequestError
+        """
+        if not isinstance(request_data, dict):
+            raise ParseRequestError(ERROR_INVALID_REQUEST_FORMAT)
+
+        try:
+            action = self.__actions.get(request_data.get('action'))
+        except TypeError:
+            # unhashable name of action
+            action = None
+
+        if action is None:
+            raise ParseRequestError(ERROR_INVALID_REQUEST_ACTION)
+
+        body = request_data.get('body')
+        if not body:
+            raise ParseRequestError(ERROR_INVALID_REQUEST_BODY)
+
+        result = action(body)
+
+        return {
+            'action': result['handler'],
+            'body': result['body'],
+            # legacy callables are never read only
+            'read_only': result.get('read_only', False),
+        }
+
+    def is_read_only(self, request):
+        """
+        Whether the request changes nothing, so its response may be cached by client,
+        @see conditional_on_last_update. Batch is read only if all its actions are read only
+
+        :param HttpRequest request: request params
+
+        :return bool:
+        """
+        try:
+            result = self.parse(request)
+        except ParseRequestError:
+            return False
+
+        if 'batch' in result:
+            return all(not isinstance(item, BaseError) and item['read_only'] for item in result['batch'])
+
+        return result['read_only']
+
+    def get_cache_key(self, request):
+        """
+        Canonical form of the request, which does not depend on formatting of its json,
+        @see conditional_on_last_update
+
+        :param HttpRequest request: request params
+
+        :return string: key or None for malformed request
+        """
+        try:
+            return json.dumps(self._decode(request), sort_keys=True, separators=(',', ':', ))
+        except ParseRequestError:
+            return None
+
+    def __call__(self, body):
+        """
+        Select action by the only key of body, which is known action, @see get_request_action
+
+        :param dict body: request body
+
+        :return dict: {'handler': handler, 'body': args_of_handler, 'read_only': bool}
+        :raise: ParseRequestError
+        """
+        if not isinstance(body, dict):
+            raise ParseRequestError(ERROR_INVALID_REQUEST_BODY)
+
+        name = None
+        for key in body:
+            if key in self.__actions:
+                if name is not None:
+                    raise ParseRequestError(ERROR_INVALID_REQUEST_ACTION)
+
+                name = key
+
+        if name is None:
+            raise ParseRequestError(ERROR_INVALID_REQUEST_ACTION)
+
+        return self.__actions[name](body[name])
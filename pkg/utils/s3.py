@@ -1,12 +1,112 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ['S3BotoStorage', ]
+__all__ = ['S3BotoStorage', 'S3MultipartWriter', 'UploadSizeLimitError', ]
 
 
+from io import BytesIO
+
 from storages.backends.s3boto import S3BotoStorage as sb3s_orig
 from storages.utils import setting
 
 
+class UploadSizeLimitError(Exception):
+    def __init__(self, size, max_size):
+        super(UploadSizeLimitError, self).__init__(size, max_size)
+        self.size = size
+        self.max_size = max_size
+
+
+class S3MultipartWriter(object):
+    """
+    Streams data into S3 by parts, so the whole file is never buffered.
+    Upload is aborted (and its parts are removed from S3) as soon as written size exceeds max_size
+    """
+    # min size of part allowed by S3 (except the last one)
+    PART_SIZE = 5 * 1024 * 1024
+
+    __slots__ = ('__storage', '__name', '__max_size', '__headers', '__buffer', '__upload', '__parts', '__size', )
+
+    def __init__(self, storage, name, max_size=None, content_type=None):
+        """
+        :param S3BotoStorageBase storage: storage to write to
+        :param string name: name of file in the storage
+        :param int max_size: max allowed size of file, in bytes. Unlimited by default
+        :param string content_type: MIME type of file
+        """
+        self.__storage = storage
+        self.__name = storage._normalize_name(storage._clean_name(name))
+        self.__max_size = max_size
+        self.__headers = {'Content-Type': content_type} if content_type else {}
+        self.__buffer = BytesIO()
+        self.__upload = None
+        self.__parts = 0
+        self.__size = 0
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def size(self):
+        return self.__size
+
+    def _upload_part(self):
+        if self.__upload is None:
+            self.__upload = self.__storage.bucket.initiate_multipart_upload(
+                self.__name, headers=self.__headers, policy=self.__storage.default_acl)
+
+        self.__parts += 1
+        self.__buffer.seek(0)
+        self.__upload.upload_part_from_file(self.__buffer, self.__parts)
+        self.__buffer = BytesIO()
+
+    def write(self, data):
+        """
+        :param bytes data: next chunk of file
+
+        :raise: UploadSizeLimitError
+        """
+        self.__size += len(data)
+
+        if self.__max_size is not None and self.__size > self.__max_size:
+            self.abort()
+            raise UploadSizeLimitError(self.__size, self.__max_size)
+
+        self.__buffer.write(data)
+        if self.__buffer.tell() >= self.PART_SIZE:
+            self._upload_part()
+
+    def close(self):
+        """
+        Finish upload
+
+        :return string: name of file in the storage
+        """
+        if self.__upload is None:
+            key = self.__storage.bucket.new_key(self.__name)
+            self.__buffer.seek(0)
+            key.set_contents_from_file(self.__buffer, headers=self.__headers, policy=self.__storage.default_acl)
+        else:
+            if self.__buffer.tell():
+                self._upload_part()
+            self.__upload.complete_upload()
+
+        self.__upload = None
+        self.__buffer = BytesIO()
+
+        return self.__name
+
+    def abort(self):
+        """
+        Cancel upload and remove already uploaded parts
+        """
+        if self.__upload is not None:
+            self.__upload.cancel_upload()
+
+        self.__upload = None
+        self.__buffer = BytesIO()
+
+
 class S3BotoStorageBase(sb3s_orig):
     s3_url = setting('S3_URL', '')
 
@@ -27,4 +127,10 @@ class S3BotoStorageBase(sb3s_orig):
         if self.s3_url and self.bucket_name:
             self.s3_url = '/'.join((self.s3_url, self.bucket_name))
 
+    def open_writer(self, name, max_size=None, content_type=None):
+        """
+        :return S3MultipartWriter: streaming writer of file with given name
+        """
+        return S3MultipartWriter(self, name, max_size, content_type)
+
 S3BotoStorage = lambda: S3BotoStorageBase()
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+
+from .router import TestCompileSchema, TestActionRouter
+from .transactions import TestBatchTransaction
+from .lastupdate import TestLastUpdateCoalescer
+from .decorators import TestJsonEncoders, TestConditionalOnLastUpdate
+from .actions import TestGetChangesSince
+
+__all__ = [
+    'TestCompileSchema', 'TestActionRouter', 'TestBatchTransaction', 'TestLastUpdateCoalescer', 'TestJsonEncoders',
+    'TestConditionalOnLastUpdate', 'TestGetChangesSince',
+]
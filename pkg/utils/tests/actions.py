@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.test import SimpleTestCase
+
+from pkg.utils import actions
+from pkg.utils.actions import get_changes_since
+from pkg.utils.lastupdate import from_timestamp
+
+
+__all__ = ['TestGetChangesSince', ]
+
+
+class NotesStub(object):
+    """
+    Queryset of notes, which records its filter
+    """
+    def __init__(self, lookup=None):
+        self.lookup = lookup
+
+    def filter(self, **lookup):
+        return NotesStub(lookup)
+
+
+class TestGetChangesSince(SimpleTestCase):
+    SINCE = 1398945600.5
+
+    def setUp(self):
+        self._patched = actions.get_notes_last_update
+        self.last_update = None
+        actions.get_notes_last_update = lambda request=None: self.last_update
+
+    def tearDown(self):
+        actions.get_notes_last_update = self._patched
+
+    def test_first_sync_gets_all_notes(self):
+        notes = NotesStub()
+        result = get_changes_since(notes, None, settle_time=0)
+
+        self.assertIs(result['notes'], notes)
+        self.assertTrue(result['full'])
+
+    def test_nothing_is_queried_without_changes(self):
+        self.last_update = self.SINCE
+
+        result = get_changes_since(NotesStub(), self.SINCE)
+
+        self.assertEqual(result, {'notes': [], 'lastUpdate': self.SINCE, 'full': False})
+
+    def test_changes_since_time_of_client(self):
+        self.last_update = self.SINCE + 10
+
+        result = get_changes_since(NotesStub(), self.SINCE, settle_time=0)
+
+        self.assertEqual(result['notes'].lookup, {'update_time__gt': from_timestamp(self.SINCE)})
+        self.assertEqual(result['lastUpdate'], self.SINCE + 10)
+        self.assertFalse(result['full'])
+
+    def test_client_is_synced_to_settled_time_only(self):
+        self.last_update = time.time()
+
+        result = get_changes_since(NotesStub(), self.SINCE, settle_time=60)
+
+        self.assertLess(result['lastUpdate'], self.last_update - 59)
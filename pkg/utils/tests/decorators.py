@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import calendar
+from decimal import Decimal
+from datetime import datetime
+from unittest import skipIf
+
+from django.http import HttpResponse
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils.cache import patch_cache_control
+
+from pkg.utils import decorators
+from pkg.utils.decorators import iter_json, conditional_on_last_update
+from pkg.utils.router import Action, ActionRouter
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+__all__ = ['TestJsonEncoders', 'TestConditionalOnLastUpdate', ]
+
+
+def fast_dumps_stub(value):
+    """
+    Encoder with behaviour of ujson on types, which are not json ones
+    """
+    def default(item):
+        if isinstance(item, datetime):
+            return calendar.timegm(item.utctimetuple())
+
+        if isinstance(item, Decimal):
+            return float(item)
+
+        raise TypeError(repr(item))
+
+    return json.dumps(value, default=default)
+
+
+PRIMITIVE_PAYLOADS = (
+    {"errorCode": 0, "body": {"notes": [{"id": 1, "text": u"заметка <b>\"1\"</b>", "pinned": True}]}},
+    {"body": {"lastUpdate": 1398945600.5, "ids": [1, 2, 3], "next": None}},
+    [u"a/b", 10 ** 15, -1.25],
+)
+
+RICH_PAYLOADS = (
+    {"body": {"updated": datetime(2014, 5, 1, 12, 0, 0)}},
+    {"body": {"size": Decimal('10.50')}},
+    {"body": {"notes": [{"id": 1, "created": datetime(2014, 5, 1)}]}},
+)
+
+
+class TestJsonEncoders(SimpleTestCase):
+    def setUp(self):
+        decorators._dumps = None
+
+    def tearDown(self):
+        decorators._dumps = None
+
+    def _encode(self, value):
+        return ''.join(iter_json(value))
+
+    def _encode_by(self, path, value):
+        decorators._dumps = None
+
+        with override_settings(JSON_FAST_DUMPS=path):
+            return self._encode(value)
+
+    def test_types_out_of_json_are_encoded_by_default_encoder(self):
+        for payload in RICH_PAYLOADS:
+            self.assertEqual(
+                self._encode_by('pkg.utils.tests.decorators.fast_dumps_stub', payload), self._encode_by(None, payload))
+
+    def test_missing_fast_encoder_is_ignored(self):
+        payload = PRIMITIVE_PAYLOADS[0]
+
+        self.assertEqual(self._encode_by('pkg.utils.tests.missing.dumps', payload), self._encode_by(None, payload))
+
+    @skipIf(ujson is None, 'ujson is not installed')
+    def test_encoders_give_the_same_json(self):
+        for payload in PRIMITIVE_PAYLOADS + RICH_PAYLOADS:
+            self.assertEqual(
+                json.loads(self._encode_by('ujson.dumps', payload)), json.loads(self._encode_by(None, payload)))
+
+
+def get_notes(user_id, **body):
+    pass
+
+
+class TestConditionalOnLastUpdate(SimpleTestCase):
+    LAST_UPDATE = 1398945600.5
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ActionRouter({
+            'notes': ActionRouter({'get': Action(get_notes, {'offset': int}, read_only=True)}),
+        })
+        self.calls = []
+        self.last_update = self.LAST_UPDATE
+        self.error = False
+
+    def _view(self, request):
+        self.calls.append(request)
+        response = HttpResponse('{}')
+
+        if self.error:
+            patch_cache_control(response, no_store=True)
+
+        return response
+
+    def _get_view(self, **options):
+        return conditional_on_last_update(lambda request: self.last_update, **options)(self._view)
+
+    def _post(self, body, **headers):
+        return self.factory.post('/notes/', body, content_type='application/json',
+                                 HTTP_X_REQUESTED_WITH='XMLHttpRequest', **headers)
+
+    def test_get_is_answered_by_304(self):
+        view = self._get_view()
+
+        etag = view(self.factory.get('/notes/'))['ETag']
+        response = view(self.factory.get('/notes/', HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(self.calls), 1)
+
+        self.last_update += 1
+        self.assertEqual(view(self.factory.get('/notes/', HTTP_IF_NONE_MATCH=etag)).status_code, 200)
+
+    def test_post_is_answered_by_not_modified_payload(self):
+        view = self._get_view(is_cacheable=self.router.is_read_only, get_request_key=self.router.get_cache_key)
+
+        etag = view(self._post('{"action": "notes", "body": {"get": {"offset": 0}}}'))['ETag']
+        # the same request in other formatting
+        response = view(self._post('{"body":{"get":{"offset":0}},"action":"notes"}', HTTP_IF_NONE_MATCH=etag))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content.decode('utf-8')), {"errorCode": 0, "body": {}, "notModified": True})
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(self.calls), 1)
+
+        view(self._post('{"action": "notes", "body": {"get": {"offset": 10}}}', HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_post_is_not_validated_by_date(self):
+        view = self._get_view(is_cacheable=self.router.is_read_only, get_request_key=self.router.get_cache_key)
+
+        last_modified = view(self._post('{"action": "notes", "body": {"get": {"offset": 0}}}'))['Last-Modified']
+        response = view(self._post('{"action": "notes", "body": {"get": {"offset": 10}}}',
+                                   HTTP_IF_MODIFIED_SINCE=last_modified))
+
+        self.assertEqual(json.loads(response.content.decode('utf-8')), {})
+        self.assertEqual(len(self.calls), 2)
+
+    def test_body_is_decoded_once(self):
+        view = self._get_view(is_cacheable=self.router.is_read_only, get_request_key=self.router.get_cache_key)
+        request = self._post('{"action": "notes", "body": {"get": {"offset": 0}}}')
+        loads = json.loads
+        decoded = []
+
+        def counting_loads(*args, **kwargs):
+            decoded.append(args[0])
+            return loads(*args, **kwargs)
+
+        json.loads = counting_loads
+        try:
+            view(request)
+            self.router.parse(request)
+        finally:
+            json.loads = loads
+
+        self.assertEqual(len(decoded), 1)
+
+    def test_errors_and_unsettled_updates_are_not_validated(self):
+        view = self._get_view()
+
+        self.error = True
+        self.assertFalse(view(self.factory.get('/notes/')).has_header('ETag'))
+
+        self.error = False
+        self.last_update = time.time()
+        self.assertFalse(view(self.factory.get('/notes/')).has_header('ETag'))
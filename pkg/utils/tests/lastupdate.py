@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from datetime import datetime
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from pkg.utils.lastupdate import LastUpdateCoalescer, to_timestamp
+
+
+__all__ = ['TestLastUpdateCoalescer', ]
+
+
+class TestLastUpdateCoalescer(SimpleTestCase):
+    KEY = 'notes_last_update'
+
+    def setUp(self):
+        self.written = []
+        self.coalescer = LastUpdateCoalescer(lambda *args: self.written.append(args), window=60)
+
+    def tearDown(self):
+        self.coalescer.flush()
+        self.coalescer.flush_shared()
+
+    def test_request_writes_latest_time_of_each_user(self):
+        self.coalescer.begin()
+        for user_id, value in ((1, 10), (1, 30), (2, 5), (1, 20), ):
+            self.coalescer.set(user_id, self.KEY, value)
+
+        self.assertEqual(self.written, [])
+        self.coalescer.flush()
+
+        self.assertEqual(sorted(self.written), [(1, self.KEY, 30), (2, self.KEY, 5)])
+
+    def test_older_time_of_other_user_is_written(self):
+        self.coalescer.set(1, self.KEY, 30)
+        self.coalescer.set(2, self.KEY, 10)
+        self.coalescer.flush_shared()
+
+        self.coalescer.set(3, self.KEY, 5)
+        self.coalescer.flush_shared()
+
+        self.assertEqual(sorted(self.written), [(1, self.KEY, 30), (2, self.KEY, 10), (3, self.KEY, 5)])
+
+    def test_buffers_flushed_out_of_order_dont_move_time_backwards(self):
+        self.coalescer.begin()
+        self.coalescer.set(1, self.KEY, 10)
+
+        # other thread is out of request of this one
+        thread = threading.Thread(target=lambda: self.coalescer.set(1, self.KEY, 20))
+        thread.start()
+        thread.join()
+
+        self.coalescer.flush_shared()
+        self.coalescer.flush()
+
+        self.coalescer.set(1, self.KEY, 20)
+        self.coalescer.set(1, self.KEY, 15)
+        self.coalescer.flush_shared()
+
+        self.assertEqual(self.written, [(1, self.KEY, 20)])
+
+    def test_time_without_user_is_written_at_once_out_of_request(self):
+        self.coalescer.set(None, self.KEY, 10)
+
+        self.assertEqual(self.written, [(None, self.KEY, 10)])
+
+    def test_no_window(self):
+        coalescer = LastUpdateCoalescer(lambda *args: self.written.append(args), window=0)
+        coalescer.set(1, self.KEY, 10)
+        coalescer.set(1, self.KEY, 5)
+
+        self.assertEqual(self.written, [(1, self.KEY, 10)])
+
+    def test_to_timestamp(self):
+        moment = datetime(2014, 5, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+
+        self.assertEqual(to_timestamp(moment), 1398945600.5)
+        self.assertEqual(to_timestamp(u'1398945600.5'), 1398945600.5)
+        self.assertEqual(to_timestamp(u'2014-05-01T12:00:00.5Z'), 1398945600.5)
+        self.assertEqual(to_timestamp(True), None)
+        self.assertEqual(to_timestamp(u'yesterday'), None)
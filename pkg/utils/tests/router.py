@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from pkg.utils.errors import (
+    ParseRequestError, ERROR_INVALID_REQUEST_FORMAT, ERROR_INVALID_REQUEST_ACTION, ERROR_INVALID_REQUEST_BODY,
+)
+from pkg.utils.router import Action, ActionRouter, Optional, compile_schema
+
+
+__all__ = ['TestCompileSchema', 'TestActionRouter', ]
+
+
+def get_notes(user_id, **body):
+    pass
+
+
+def delete_notes(user_id, **body):
+    pass
+
+
+def legacy_action(body):
+    return {'handler': delete_notes, 'body': body}
+
+
+class TestCompileSchema(SimpleTestCase):
+    def test_types(self):
+        self.assertTrue(compile_schema(int)(1))
+        self.assertFalse(compile_schema(int)(True))
+        self.assertFalse(compile_schema(int)(u'1'))
+        self.assertTrue(compile_schema(float)(1))
+        self.assertTrue(compile_schema(unicode)(u'a'))
+        self.assertTrue(compile_schema(None)([None]))
+
+    def test_lists(self):
+        self.assertTrue(compile_schema([int])([1, 2]))
+        self.assertFalse(compile_schema([int])([1, u'2']))
+        self.assertTrue(compile_schema([{'id': int}])([{'id': 1}]))
+        self.assertFalse(compile_schema([{'id': int}])([{'id': 1}, {}]))
+        self.assertFalse(compile_schema([])({}))
+
+    def test_dicts(self):
+        validate = compile_schema({'offset': int, 'limit': Optional(int)})
+
+        self.assertTrue(validate({'offset': 0}))
+        self.assertTrue(validate({'offset': 0, 'limit': 10, 'other': u'a'}))
+        self.assertFalse(validate({'offset': 0, 'limit': u'10'}))
+        self.assertFalse(validate({'limit': 10}))
+        self.assertFalse(validate([]))
+
+    def test_unsupported_schema(self):
+        self.assertRaises(TypeError, compile_schema, 1)
+
+
+class TestActionRouter(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ActionRouter({
+            'notes': ActionRouter({
+                'get': Action(get_notes, {'offset': int, 'limit': Optional(int)}, read_only=True),
+                'delete': Action(delete_notes, {'ids': [int]}),
+            }),
+            'legacy': legacy_action,
+        }, batch_max_size=2)
+
+    def _request(self, data, ajax=True):
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+        body = data if isinstance(data, str) else json.dumps(data)
+
+        return self.factory.post('/', body, content_type='application/json', **headers)
+
+    def _assert_error(self, code, data, ajax=True):
+        with self.assertRaises(ParseRequestError) as context:
+            self.router.parse(self._request(data, ajax))
+
+        self.assertEqual(context.exception.code, code)
+
+    def test_nested_action(self):
+        result = self.router.parse(self._request({'action': 'notes', 'body': {'get': {'offset': 10}}}))
+
+        self.assertEqual(result, {'action': get_notes, 'body': {'offset': 10}, 'read_only': True})
+
+    def test_legacy_action_is_not_read_only(self):
+        result = self.router.parse(self._request({'action': 'legacy', 'body': {'ids': [1]}}))
+
+        self.assertEqual(result, {'action': delete_notes, 'body': {'ids': [1]}, 'read_only': False})
+
+    def test_errors(self):
+        self._assert_error(ERROR_INVALID_REQUEST_FORMAT, {'action': 'legacy', 'body': {'ids': [1]}}, ajax=False)
+        self._assert_error(ERROR_INVALID_REQUEST_FORMAT, '{')
+        self._assert_error(ERROR_INVALID_REQUEST_FORMAT, [1])
+        self._assert_error(ERROR_INVALID_REQUEST_ACTION, {'action': 'unknown', 'body': {'ids': [1]}})
+        self._assert_error(ERROR_INVALID_REQUEST_ACTION, {'action': [], 'body': {'ids': [1]}})
+        self._assert_error(ERROR_INVALID_REQUEST_ACTION, {'action': 'notes', 'body': {'get': {}, 'delete': {}}})
+        self._assert_error(ERROR_INVALID_REQUEST_BODY, {'action': 'notes'})
+        self._assert_error(ERROR_INVALID_REQUEST_BODY, {'action': 'notes', 'body': {'delete': {'ids': [u'1']}}})
+
+    def test_batch(self):
+        result = self.router.parse(self._request({'action': 'batch', 'body': {'actions': [
+            {'action': 'notes', 'body': {'get': {'offset': 0}}},
+            {'action': 'unknown', 'body': {}},
+        ], 'atomic': False}}))
+
+        self.assertFalse(result['atomic'])
+        self.assertEqual(result['batch'][0]['action'], get_notes)
+        self.assertEqual(result['batch'][1].code, ERROR_INVALID_REQUEST_ACTION)
+
+    def test_batch_size_is_limited(self):
+        action = {'action': 'notes', 'body': {'get': {'offset': 0}}}
+
+        self._assert_error(ERROR_INVALID_REQUEST_BODY, {'action': 'batch', 'body': {'actions': [action] * 3}})
+        self._assert_error(ERROR_INVALID_REQUEST_BODY, {'action': 'batch', 'body': {'actions': []}})
+
+    def test_read_only(self):
+        get = {'action': 'notes', 'body': {'get': {'offset': 0}}}
+        delete = {'action': 'notes', 'body': {'delete': {'ids': [1]}}}
+
+        self.assertTrue(self.router.is_read_only(self._request(get)))
+        self.assertFalse(self.router.is_read_only(self._request(delete)))
+        for actions, read_only in (([get, get], True, ), ([get, delete], False, ), ):
+            request = self._request({'action': 'batch', 'body': {'actions': actions}})
+            self.assertEqual(self.router.is_read_only(request), read_only)
+        self.assertFalse(self.router.is_read_only(self._request('{')))
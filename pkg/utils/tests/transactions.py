@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TransactionTestCase
+
+from pkg.quota.models import NotesQuotaUsage, get_current_period
+from pkg.utils.errors import BaseError, ERROR_SAVE_DATA, ERROR_NOTE_SIZE_QUOTA_EXCEED
+from pkg.utils.transactions import batch_transaction, commit_on_success, on_commit, on_rollback, in_batch
+
+
+__all__ = ['TestBatchTransaction', ]
+
+
+class TestBatchTransaction(TransactionTestCase):
+    multi_db = True
+    USER_ID = 42
+
+    def _create_usage(self, user_id=USER_ID):
+        NotesQuotaUsage.objects.create(user_id=user_id, period=get_current_period(), usage=100)
+
+    def _rollback(self, func):
+        try:
+            with batch_transaction():
+                func()
+                raise BaseError(ERROR_NOTE_SIZE_QUOTA_EXCEED)
+        except BaseError:
+            pass
+
+    def test_quota_database_is_rolled_back(self):
+        self._rollback(self._create_usage)
+
+        self.assertFalse(NotesQuotaUsage.objects.exists())
+
+    def test_nested_commit_does_not_commit_batch(self):
+        def create():
+            with commit_on_success(using='xxxx'):
+                self._create_usage()
+
+            with batch_transaction():
+                self._create_usage(self.USER_ID + 1)
+
+        self._rollback(create)
+
+        self.assertFalse(NotesQuotaUsage.objects.exists())
+
+    def test_side_effects_are_deferred_until_commit(self):
+        calls = []
+
+        with batch_transaction():
+            self.assertTrue(in_batch())
+            on_commit(lambda: calls.append('commit'))
+            on_rollback(lambda: calls.append('rollback'))
+            self.assertEqual(calls, [])
+
+        self.assertFalse(in_batch())
+        self.assertEqual(calls, ['commit'])
+
+    def test_side_effects_are_compensated_on_rollback(self):
+        calls = []
+
+        def change():
+            on_commit(lambda: calls.append('commit'))
+            on_rollback(lambda: calls.append('first'))
+            on_rollback(lambda: calls.append('second'))
+
+        self._rollback(change)
+
+        self.assertEqual(calls, ['second', 'first'])
+
+    def test_side_effects_out_of_batch(self):
+        calls = []
+
+        on_commit(lambda: calls.append('commit'))
+        on_rollback(lambda: calls.append('rollback'))
+
+        self.assertEqual(calls, ['commit'])
+
+    def test_batch_error_is_not_hidden(self):
+        with self.assertRaises(BaseError) as context:
+            with batch_transaction():
+                raise BaseError(ERROR_SAVE_DATA)
+
+        self.assertEqual(context.exception.code, ERROR_SAVE_DATA)
+        self.assertFalse(in_batch())
+
+    def _fail(self):
+        raise ValueError('callback failed')
+
+    def test_failed_callback_does_not_stop_others(self):
+        calls = []
+
+        with batch_transaction():
+            on_commit(self._fail)
+            on_commit(lambda: calls.append('commit'))
+
+        self.assertEqual(calls, ['commit'])
+
+    def test_failed_compensation_does_not_hide_batch_error(self):
+        calls = []
+
+        with self.assertRaises(BaseError) as context:
+            with batch_transaction():
+                on_rollback(lambda: calls.append('first'))
+                on_rollback(self._fail)
+                raise BaseError(ERROR_SAVE_DATA)
+
+        self.assertEqual(context.exception.code, ERROR_SAVE_DATA)
+        self.assertEqual(calls, ['first'])
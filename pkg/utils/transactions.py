@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction, DEFAULT_DB_ALIAS
+
+from .dbrouter import QuotaRouter
+
+
+__all__ = ['batch_transaction', 'commit_on_success', 'on_commit', 'on_rollback', 'in_batch', ]
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class _Batch(object):
+    __slots__ = ('on_commit', 'on_rollback', )
+
+    def __init__(self):
+        self.on_commit = []
+        self.on_rollback = []
+
+
+def _get_databases():
+    """
+    :return list: aliases of databases changed by actions, ACTIONS_BATCH_DATABASES. Notes and quota ones by default
+    """
+    databases = getattr(settings, 'ACTIONS_BATCH_DATABASES', None) or (DEFAULT_DB_ALIAS, QuotaRouter.DB_NAME, )
+    return [using for using in databases if using in settings.DATABASES]
+
+
+@contextmanager
+def _commit_on_success(databases):
+    if not databases:
+        yield
+        return
+
+    with transaction.commit_on_success(using=databases[0]):
+        with _commit_on_success(databases[1:]):
+            yield
+
+
+def in_batch():
+    """
+    :return bool: whether the current thread is inside batch_transaction
+    """
+    return getattr(_local, 'batch', None) is not None
+
+
+@contextmanager
+def batch_transaction():
+    """
+    Transaction of all databases changed by actions, e.g. of batch request. Nested one joins the outer one.
+
+    Side effects out of databases (counters in redis, last updates) are registered by on_commit and on_rollback,
+    they are performed after the databases are committed or rolled back. Failed callback is logged and does not
+    stop the others. Databases are committed one by one, so failed commit of the notes one can't undo
+    committed quota one.
+
+    Usage:
+        with batch_transaction():
+            for action in actions:
+                action()
+    """
+    if in_batch():
+        yield
+        return
+
+    batch = _local.batch = _Batch()
+    committed = False
+
+    try:
+        with _commit_on_success(_get_databases()):
+            yield
+
+        committed = True
+    finally:
+        _local.batch = None
+
+        # exception of the batch, if any, is re-raised by the finally clause, callbacks can't mask it
+        for callback in (batch.on_commit if committed else reversed(batch.on_rollback)):
+            try:
+                callback()
+            except Exception:
+                logger.exception('Callback of batch transaction failed')
+
+
+@contextmanager
+def commit_on_success(using=None):
+    """
+    Counterpart of transaction.commit_on_success, which does not commit in the middle of batch_transaction.
+    It's context manager only
+
+    :param string using: alias of database
+    """
+    if in_batch():
+        yield
+        return
+
+    with transaction.commit_on_success(using=using):
+        yield
+
+
+def on_commit(callback):
+    """
+    Call the callback after batch_transaction is committed. Out of it the callback is called at once
+
+    :param callable callback: callback without arguments
+    """
+    if in_batch():
+        _local.batch.on_commit.append(callback)
+    else:
+        callback()
+
+
+def on_rollback(callback):
+    """
+    Call the callback, e.g. compensation of change out of databases, if batch_transaction is rolled back.
+    Out of it nothing could be rolled back, so the callback is dropped
+
+    :param callable callback: callback without arguments
+    """
+    if in_batch():
+        _local.batch.on_rollback.append(callback)